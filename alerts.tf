@@ -37,7 +37,7 @@ data "aws_iam_policy_document" "sns_topic_policy" {
 
     principals {
       type        = "Service"
-      identifiers = ["events.amazonaws.com"]
+      identifiers = ["events.amazonaws.com", "cloudwatch.amazonaws.com"]
     }
 
     resources = [aws_sns_topic.sfn_events.arn]
@@ -76,6 +76,25 @@ resource "aws_cloudwatch_event_target" "sns" {
   }
 }
 
+# Alarm when an export chunk takes over 80% of the 900s processor timeout,
+# using the EMF metrics logged by the Lambda. The per-phase metrics
+# (ConnectDuration, FetchDuration, EncodeDuration, ...) show where the time went.
+resource "aws_cloudwatch_metric_alarm" "export_chunk_duration" {
+  alarm_name          = "${var.name}-${var.environment}-export-chunk-duration"
+  alarm_description   = "An export chunk is close to the Lambda timeout"
+  namespace           = local.metrics_namespace
+  metric_name         = "Duration"
+  dimensions          = { Function = "database-export" }
+  statistic           = "Maximum"
+  period              = 300
+  evaluation_periods  = 1
+  comparison_operator = "GreaterThanThreshold"
+  threshold           = local.export_processor_timeout * 1000 * 0.8
+  treat_missing_data  = "notBreaching"
+  alarm_actions       = [aws_sns_topic.sfn_events.arn]
+  tags                = var.tags
+}
+
 # Creating CloudWatch resources
 #trivy:ignore:AVD-AWS-0017 CloudWatch log groups encrypted by default.
 resource "aws_cloudwatch_log_group" "eventbridge" {
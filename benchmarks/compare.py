@@ -0,0 +1,73 @@
+"""
+Compares two benchmark result files produced by benchmarks/run.py.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json [--threshold 10]
+
+Prints every numeric metric that changed by more than the threshold
+(percent) and exits non-zero if a throughput metric dropped or a time,
+memory or call-count metric grew beyond it.
+"""
+
+import argparse
+import json
+import sys
+
+# Metrics where a higher value is better; everything else is a cost
+HIGHER_IS_BETTER = ("_per_s",)
+
+# Workload shape rather than performance
+IGNORED = {"tables", "rows", "source_bytes", "chunks", "tables_completed"}
+
+
+def flatten(data, prefix=""):
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{path}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(baseline: dict, candidate: dict, threshold: float):
+    base = dict(flatten(baseline.get("profiles", {}), "profiles."))
+    base.update(flatten(baseline.get("micro", {}), "micro."))
+    cand = dict(flatten(candidate.get("profiles", {}), "profiles."))
+    cand.update(flatten(candidate.get("micro", {}), "micro."))
+
+    regressions = []
+    for metric in sorted(base.keys() & cand.keys()):
+        old, new = base[metric], cand[metric]
+        if old == 0 or metric.rsplit(".", 1)[-1] in IGNORED:
+            continue
+        change = (new - old) / old * 100
+        if abs(change) < threshold:
+            continue
+        better = change > 0 if metric.endswith(HIGHER_IS_BETTER) else change < 0
+        print(
+            f"{'improved' if better else 'REGRESSED':<10} {metric}: {old} -> {new} ({change:+.1f}%)"
+        )
+        if not better:
+            regressions.append(metric)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('revision')} -> {candidate.get('revision')}")
+    regressions = compare(baseline, candidate, args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
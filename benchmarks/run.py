@@ -0,0 +1,553 @@
+"""
+Offline benchmark for the export Lambdas.
+
+Runs the scanner, exporter and finaliser handlers in-process against a
+synthetic database (see synthetic.py), with S3, Glue, Athena and Secrets
+Manager backed by moto. No network or AWS account is needed.
+
+Usage:
+    python benchmarks/run.py [--profile wide ...] [--scale 0.1] [--output results.json]
+
+With --dsn the handlers read the tables of a real SQL Server database, e.g.
+a local mssql container with a restored copy, through the real drivers,
+instead of the synthetic profiles.
+
+The JSON result can be compared between commits with benchmarks/compare.py.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, str(Path(__file__).parent))
+from synthetic import (  # noqa: E402
+    PROFILES,
+    FakeDatabase,
+    build_profile,
+    fake_drivers,
+    fake_pymssql,
+)
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+LAMBDA_ROOT = REPO_ROOT / "lambda_functions"
+sys.path.insert(0, str(LAMBDA_ROOT / "shared"))
+
+BUCKET = "benchmark-parquet-exports"
+PROGRESS_TABLE = "benchmark-export-progress"
+DB_NAME = "benchmark_db"
+EXTRACTION_TIMESTAMP = "20240101000000Z"
+REGION = "eu-west-2"
+
+
+class CallCounter:
+    """
+    Counts AWS API calls made through the default boto3 session, less those
+    aws_clients answered with the response of an identical call.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Counter = Counter()
+
+    def __call__(self, model, context, **kwargs):
+        if not context.get("coalesced"):
+            self.calls[f"{model.service_model.service_name}:{model.name}"] += 1
+
+    def snapshot(self) -> Counter:
+        return Counter(self.calls)
+
+
+def load_handler(name: str):
+    """Imports lambda_functions/<name>/main.py under a unique module name."""
+    path = LAMBDA_ROOT / name / "main.py"
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    sys.path.insert(0, str(path.parent))
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(path.parent))
+    return module
+
+
+def sum_emf_metrics(log: str) -> dict:
+    """Totals the metrics of the EMF records the handlers printed."""
+    totals: Counter = Counter()
+    for line in log.splitlines():
+        if not line.startswith('{"_aws"'):
+            continue
+        record = json.loads(line)
+        for directive in record["_aws"]["CloudWatchMetrics"]:
+            for metric in directive["Metrics"]:
+                totals[metric["Name"]] += record[metric["Name"]]
+    return {name: round(value, 3) for name, value in sorted(totals.items())}
+
+
+@contextlib.contextmanager
+def measure(result: dict, counter: CallCounter):
+    """Records wall time, CPU time, traced peak memory, AWS calls and EMF metrics."""
+    calls_before = counter.snapshot()
+    log = io.StringIO()
+    tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with contextlib.redirect_stdout(log):
+            yield
+    finally:
+        result["wall_s"] = round(time.perf_counter() - wall, 4)
+        result["cpu_s"] = round(time.process_time() - cpu, 4)
+        result["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        calls = counter.snapshot() - calls_before
+        result["aws_calls"] = dict(sorted(calls.items()))
+        result["metrics"] = sum_emf_metrics(log.getvalue())
+
+
+def s3_bytes(prefix: str) -> int:
+    s3 = boto3.client("s3", region_name=REGION)
+    total = 0
+    for page in s3.get_paginator("list_objects_v2").paginate(
+        Bucket=BUCKET, Prefix=prefix
+    ):
+        total += sum(obj["Size"] for obj in page.get("Contents", []))
+    return total
+
+
+def parse_dsn(dsn: str) -> dict:
+    """server=host,port;user=...;password=...;database=... as a dict."""
+    settings = dict(part.split("=", 1) for part in dsn.split(";") if part.strip())
+    settings = {key.strip().lower(): value.strip() for key, value in settings.items()}
+    missing = {"server", "user", "password", "database"} - settings.keys()
+    if missing:
+        raise SystemExit(f"--dsn is missing {', '.join(sorted(missing))}")
+    return settings
+
+
+def run_profile(profile: str, scale: float, env: dict, dsn: dict | None = None) -> dict:
+    """
+    Runs the handlers over the synthetic profile or, given a DSN, over the
+    tables of that SQL Server database with the real drivers.
+    """
+    result: dict = {}
+    if dsn is None:
+        tables = build_profile(profile, scale)
+        db = FakeDatabase(tables)
+        rows = sum(t.rows for t in tables)
+        result = {"tables": len(tables), "rows": rows, "source_bytes": db.total_bytes}
+
+    with mock_aws():
+        boto3.setup_default_session(region_name=REGION)
+        counter = CallCounter()
+        boto3.DEFAULT_SESSION.events.register("after-call", counter)
+
+        boto3.client("s3").create_bucket(
+            Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION}
+        )
+        secret_arn = boto3.client("secretsmanager").create_secret(
+            Name="benchmark-db-password",
+            SecretString=dsn["password"] if dsn else "password",
+        )["ARN"]
+
+        boto3.client("dynamodb").create_table(
+            TableName=PROGRESS_TABLE,
+            KeySchema=[
+                {"AttributeName": "run", "KeyType": "HASH"},
+                {"AttributeName": "table", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "run", "AttributeType": "S"},
+                {"AttributeName": "table", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        os.environ.update(
+            env,
+            DATABASE_PW_SECRET_ARN=secret_arn,
+            OUTPUT_BUCKET=BUCKET,
+            EXPORT_PROGRESS_TABLE=PROGRESS_TABLE,
+        )
+        if dsn is None:
+            sys.modules.update(fake_drivers(db))
+        else:
+            # Drop the stand-ins an earlier synthetic profile installed
+            for name in fake_drivers(FakeDatabase([])):
+                sys.modules.pop(name, None)
+
+        scanner = load_handler("database_export_scanner")
+        exporter = load_handler("database_export")
+        finaliser = load_handler("database_export_finaliser")
+
+        db_name = dsn["database"] if dsn else DB_NAME
+        base_event = {
+            "db_endpoint": dsn["server"] if dsn else "localhost",
+            "db_username": dsn["user"] if dsn else "admin",
+            "db_name": db_name,
+            "output_bucket": BUCKET,
+            "extraction_timestamp": EXTRACTION_TIMESTAMP,
+        }
+
+        scan: dict = {}
+        with measure(scan, counter):
+            plan = scanner.handler({**base_event, "tables_to_export": []}, None)
+        scan["chunks"] = len(plan["chunks"])
+        result["scanner"] = scan
+
+        export: dict = {}
+        chunk_times = []
+        completed_tables = set()
+        with measure(export, counter):
+            for chunk in plan["chunks"]:
+                started = time.perf_counter()
+                output = exporter.handler({**base_event, "chunk": chunk}, None)
+                chunk_times.append(time.perf_counter() - started)
+                if output["table_complete"]:
+                    completed_tables.add(output["table"])
+        export["bytes_written"] = s3_bytes(f"{db_name}/")
+        if dsn is not None:
+            rows = int(export["metrics"].get("Rows", 0))
+            result.update(tables=len(plan["tables"]), rows=rows)
+        export["rows_per_s"] = round(rows / export["wall_s"], 1)
+        if dsn is None:
+            export["source_bytes_per_s"] = round(db.total_bytes / export["wall_s"], 1)
+        export["written_bytes_per_s"] = round(
+            export["bytes_written"] / export["wall_s"], 1
+        )
+        export["max_chunk_s"] = round(max(chunk_times, default=0.0), 4)
+        export["tables_completed"] = len(completed_tables)
+        result["exporter"] = export
+
+        finalise: dict = {}
+        with measure(finalise, counter):
+            for table in plan["tables"]:
+                finaliser.handler(
+                    {
+                        "chunk": {
+                            **table,
+                            "extraction_timestamp": EXTRACTION_TIMESTAMP,
+                        }
+                    },
+                    None,
+                )
+        result["finaliser"] = finalise
+
+    return result
+
+
+def run_micro(iterations: int) -> dict:
+    """Times the pure planning/decoding helpers without any AWS calls."""
+    with mock_aws():
+        boto3.setup_default_session(region_name=REGION)
+        sys.modules.setdefault("pymssql", fake_pymssql(FakeDatabase([])))
+        scanner = load_handler("database_export_scanner")
+        exporter = load_handler("database_export")
+
+    import pandas as pd
+
+    micro = {}
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        scanner.generate_chunk_query_by_rownum("dbo", "t", ["a", "b"], 50_000, i)
+    micro["generate_chunk_query_by_rownum_us"] = round(
+        (time.perf_counter() - started) / iterations * 1e6, 3
+    )
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        scanner.calculate_rows_per_chunk(1_000_000 + i, 512_000.0, 10)
+    micro["calculate_rows_per_chunk_us"] = round(
+        (time.perf_counter() - started) / iterations * 1e6, 3
+    )
+
+    df = pd.DataFrame(
+        {
+            "rv": [i.to_bytes(8, "big") for i in range(iterations)],
+            "legacy": ["caf\xe9 na\xefve".encode("cp1252")] * iterations,
+            "plain": ["text"] * iterations,
+        }
+    )
+    started = time.perf_counter()
+    exporter.decode_columns(df, {"rv"})
+    micro["decode_columns_rows_per_s"] = round(
+        iterations / (time.perf_counter() - started), 1
+    )
+    return micro
+
+
+# Modules each handler imports on first use, on top of its module imports
+LAZY_IMPORTS = {
+    "database_export[pandas]": ("database_export", ["pandas"]),
+    "database_export[arrow]": ("database_export", []),
+    "database_export_finaliser[parquet]": ("database_export_finaliser", []),
+    "database_export_finaliser[iceberg]": (
+        "database_export_finaliser",
+        ["pyarrow.parquet", "pyiceberg.catalog"],
+    ),
+}
+
+
+def import_time(name: str, extra_imports: list[str]) -> dict:
+    """Cold-start import cost of a handler, from python -X importtime."""
+    code = "; ".join(f"import {m}" for m in ["main", *extra_imports])
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(LAMBDA_ROOT / "shared"),
+        "AWS_DEFAULT_REGION": REGION,
+        "STATE_MACHINE_ARN": "arn:aws:states:eu-west-2:123456789012:stateMachine:x",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=LAMBDA_ROOT / name,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+
+    # "import time: self [us] | cumulative | imported package", nested
+    # imports are indented under the package that imported them
+    top_level, second_level = {}, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, package = line[len("import time:") :].split("|")
+        depth = (len(package) - len(package.lstrip()) - 1) // 2
+        if depth == 0:
+            top_level[package.strip()] = int(cumulative) / 1000
+        elif depth == 1:
+            second_level[package.strip()] = int(cumulative) / 1000
+    # Interpreter startup (site, encodings) is included in the total
+    slowest = sorted(second_level.items(), key=lambda item: -item[1])[:5]
+    return {
+        "total_ms": round(sum(top_level.values()), 1),
+        "slowest_ms": {package: round(ms, 1) for package, ms in slowest},
+    }
+
+
+def run_import_times() -> dict:
+    results = {}
+    for path in sorted(LAMBDA_ROOT.glob("*/main.py")):
+        name = path.parent.name
+        if not any(name == target for target, _ in LAZY_IMPORTS.values()):
+            results[name] = import_time(name, [])
+    for label, (name, extra_imports) in LAZY_IMPORTS.items():
+        results[label] = import_time(name, extra_imports)
+    return dict(sorted(results.items()))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Extraction profile settings compared by --extraction-sweep, each on its
+# own and then combined
+EXTRACTION_SETTINGS = {
+    "default": {},
+    "read_uncommitted": {"isolation_level": "READ UNCOMMITTED"},
+    "unordered": {"keep_order": False},
+    "maxdop_1": {"maxdop": 1},
+    "packet_32k": {"packet_size": 32767},
+    "fetch_5000": {"fetch_size": 5000},
+    "read_optimised": {
+        "isolation_level": "READ UNCOMMITTED",
+        "keep_order": False,
+        "packet_size": 32767,
+        "fetch_size": 5000,
+    },
+}
+
+
+def run_extraction_sweep(
+    profile: str, scale: float, env: dict, dsn: dict | None = None
+) -> dict:
+    """Exporter rows/s for the profile with each extraction setting."""
+    sweep = {}
+    for name, settings in EXTRACTION_SETTINGS.items():
+        result = run_profile(
+            profile, scale, {**env, "EXTRACTION_PROFILE": json.dumps(settings)}, dsn
+        )
+        sweep[name] = {
+            "settings": settings,
+            "rows_per_s": result["exporter"]["rows_per_s"],
+            "wall_s": result["exporter"]["wall_s"],
+            "fetch_ms": result["exporter"]["metrics"].get("FetchDuration", 0.0),
+        }
+    return sweep
+
+
+# Export drivers compared by --driver-sweep
+EXPORT_DRIVERS = ["pymssql", "pytds", "arrow_odbc"]
+
+
+def run_driver_sweep(
+    profile: str, scale: float, env: dict, dsn: dict | None = None
+) -> dict:
+    """
+    Exporter rows/s and CPU time for the profile with each export driver.
+    Only a sweep with a DSN measures the drivers themselves; see README.md.
+    """
+    sweep = {}
+    for driver in EXPORT_DRIVERS:
+        result = run_profile(
+            profile,
+            scale,
+            {**env, "EXPORT_DRIVER": json.dumps({"name": driver})},
+            dsn,
+        )
+        export = result["exporter"]
+        sweep[driver] = {
+            "rows_per_s": export["rows_per_s"],
+            "wall_s": export["wall_s"],
+            "cpu_s": export["cpu_s"],
+            "cpu_us_per_row": round(export["cpu_s"] / max(result["rows"], 1) * 1e6, 2),
+            "fetch_ms": export["metrics"].get("FetchDuration", 0.0),
+            "decode_ms": export["metrics"].get("DecodeDuration", 0.0),
+            "peak_traced_bytes": export["peak_traced_bytes"],
+        }
+    return sweep
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profile", action="append", choices=PROFILES)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--refresh-mode", default="full")
+    parser.add_argument("--parquet-file-size", default="10")
+    parser.add_argument(
+        "--export-engine", default="pandas", choices=["pandas", "arrow"]
+    )
+    parser.add_argument(
+        "--extraction-profile",
+        default="{}",
+        help="EXTRACTION_PROFILE JSON passed to the exporter",
+    )
+    parser.add_argument(
+        "--export-pipeline",
+        default="{}",
+        help="EXPORT_PIPELINE JSON passed to the exporter",
+    )
+    parser.add_argument(
+        "--lob-offload",
+        default="{}",
+        help="LOB_OFFLOAD JSON passed to the scanner and exporter",
+    )
+    parser.add_argument(
+        "--server-side-projection",
+        action="store_true",
+        help="have the chunk queries convert rowversion, binary and text columns",
+    )
+    parser.add_argument(
+        "--export-driver",
+        default="{}",
+        help="EXPORT_DRIVER JSON passed to the exporter",
+    )
+    parser.add_argument(
+        "--dsn",
+        help="server=host,port;user=...;password=...;database=... of a SQL Server "
+        "database to read instead of the synthetic profiles",
+    )
+    parser.add_argument(
+        "--driver-sweep",
+        action="store_true",
+        help="also measure exporter rows/s and CPU for each export driver",
+    )
+    parser.add_argument(
+        "--encoding-profile",
+        default="default",
+        help="Parquet encoding profile the scanner assigns to every table",
+    )
+    parser.add_argument(
+        "--extraction-sweep",
+        action="store_true",
+        help="also measure exporter rows/s for each extraction setting",
+    )
+    parser.add_argument("--micro-iterations", type=int, default=20_000)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+    env = {
+        "DATABASE_REFRESH_MODE": args.refresh_mode,
+        # Iceberg commits need a real Iceberg catalog, which moto does not provide
+        "OUTPUT_TABLE_FORMAT": "parquet",
+        "OUTPUT_PARQUET_FILE_SIZE": args.parquet_file_size,
+        "EXPORT_ENGINE": args.export_engine,
+        "EXTRACTION_PROFILE": args.extraction_profile,
+        "EXPORT_PIPELINE": args.export_pipeline,
+        "LOB_OFFLOAD": args.lob_offload,
+        "SERVER_SIDE_PROJECTION": str(args.server_side_projection).lower(),
+        "EXPORT_DRIVER": args.export_driver,
+        "ENCODING_PROFILE_SIZE_CLASSES": json.dumps(
+            [{"min_size_mb": 0, "profile": args.encoding_profile}]
+        ),
+    }
+
+    dsn = parse_dsn(args.dsn) if args.dsn else None
+    # A DSN's database replaces the synthetic profiles
+    profiles = ["dsn"] if dsn else (args.profile or PROFILES)
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            **env,
+            "scale": args.scale,
+            "dsn": {k: dsn[k] for k in ("server", "database")} if dsn else None,
+        },
+        "profiles": {
+            profile: run_profile(profile, args.scale, env, dsn) for profile in profiles
+        },
+        "micro": run_micro(args.micro_iterations),
+        "extraction": {
+            profile: run_extraction_sweep(profile, args.scale, env, dsn)
+            for profile in profiles
+        }
+        if args.extraction_sweep
+        else {},
+        "drivers": {
+            profile: run_driver_sweep(profile, args.scale, env, dsn)
+            for profile in profiles
+        }
+        if args.driver_sweep
+        else {},
+        "import_time": run_import_times(),
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,785 @@
+"""
+Local simulator for the restore and export state machines.
+
+Renders the ASL templates, interprets the state machine JSON and invokes
+the Lambda handlers in-process, with AWS backed by moto and the database
+by the synthetic stand-in (see synthetic.py). Time is simulated: a Lambda
+task takes its measured in-process duration plus a fixed invoke overhead,
+Wait states advance the clock without sleeping and Map iterations run on
+MaxConcurrency simulated slots.
+
+The RDS instance and the native restore are modelled on the simulated
+clock: the instance becomes available --rds-create-seconds after it is
+created, and rds_task_status reports SUCCESS --restore-seconds after the
+restore started.
+
+Usage:
+    python benchmarks/simulate.py [--machine restore|export] [--profile wide ...]
+        [--max-concurrency 5] [--output simulation.json]
+
+The report gives the simulated end-to-end duration, the time spent per
+state on the critical path, per-state totals and the idle concurrency of
+each Map state.
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import os
+import re
+import sys
+import time
+import types
+from collections import defaultdict
+from pathlib import Path
+
+import boto3
+from moto import mock_aws
+
+sys.path.insert(0, str(Path(__file__).parent))
+from run import (  # noqa: E402
+    BUCKET,
+    DB_NAME,
+    EXTRACTION_TIMESTAMP,
+    PROGRESS_TABLE,
+    REGION,
+    REPO_ROOT,
+    load_handler,
+)
+from synthetic import PROFILES, FakeDatabase, build_profile, fake_pymssql  # noqa: E402
+
+ACCOUNT = "000000000000"
+NAME, ENVIRONMENT = "benchmark", "local"
+
+# Lambdas invoked by the state machines, by template variable
+LAMBDAS = {
+    "DatabaseRestoreLambdaArn": "database_restore",
+    "DatabaseRestoreStatusLambdaArn": "database_restore_status",
+    "DatabaseExportScannerLambdaArn": "database_export_scanner",
+    "DatabaseExportProcessorLambdaArn": "database_export",
+    "DatabaseExportFinaliserLambdaArn": "database_export_finaliser",
+    "ExportValidationRowCountUpdaterLambdaArn": "export_validation_rowcount_updater",
+    "TransformOutputLambdaArn": "transform_output",
+    "DatabaseExportPreparerLambdaArn": "database_export_preparer",
+}
+
+# Step Functions SDK integration service names that differ from boto3's
+SDK_SERVICES = {"eventbridge": "events"}
+
+
+class StatesError(Exception):
+    """A Step Functions error, matched against Retry and Catch ErrorEquals."""
+
+    def __init__(self, error: str, cause: str = ""):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def lambda_arn(name: str) -> str:
+    return f"arn:aws:lambda:{REGION}:{ACCOUNT}:function:{name}"
+
+
+def state_machine_arn(name: str) -> str:
+    return f"arn:aws:states:{REGION}:{ACCOUNT}:stateMachine:{name}"
+
+
+def render_template(path: Path, variables: dict) -> dict:
+    """
+    Renders the subset of Terraform templatefile() syntax the ASL templates
+    use: %{ if var ~}...%{ endif ~}, ${var}, ${jsonencode(var)} and
+    ${var ? "a" : "b"}.
+    """
+    text = path.read_text()
+
+    def directive(match):
+        return match.group(2) if variables[match.group(1)] else ""
+
+    text = re.sub(
+        r"%\{ if (\w+) ~\}\n?(.*?)%\{ endif ~\}\n?", directive, text, flags=re.S
+    )
+
+    def interpolate(match):
+        expr = match.group(1).strip()
+        if m := re.fullmatch(r'(\w+) \? "([^"]*)" : "([^"]*)"', expr):
+            return m.group(2) if variables[m.group(1)] else m.group(3)
+        if m := re.fullmatch(r"jsonencode\((\w+)\)", expr):
+            return json.dumps(variables[m.group(1)])
+        return (
+            str(variables[expr]).lower()
+            if isinstance(variables[expr], bool)
+            else str(variables[expr])
+        )
+
+    return json.loads(re.sub(r"\$\{([^}]*)\}", interpolate, text))
+
+
+# --- Input and output processing -------------------------------------------
+
+PATH_TOKEN = re.compile(r"\.([^.\[]+)|\[(\d+)\]")
+
+
+def get_path(data, path: str, context: dict):
+    if path.startswith("$$"):
+        data, path = context, path[1:]
+    try:
+        for name, index in PATH_TOKEN.findall(path[1:]):
+            data = data[int(index)] if index else data[name]
+    except (KeyError, IndexError, TypeError):
+        raise StatesError("States.Runtime", f"Invalid path {path}")
+    return data
+
+
+def set_path(data, path: str, value):
+    if path == "$":
+        return value
+    result = dict(data) if isinstance(data, dict) else {}
+    target = result
+    names = [name for name, _ in PATH_TOKEN.findall(path[1:])]
+    for name in names[:-1]:
+        target[name] = dict(target.get(name) or {})
+        target = target[name]
+    target[names[-1]] = value
+    return result
+
+
+def split_arguments(text: str) -> list:
+    """Splits intrinsic function arguments on top-level commas."""
+    args, depth, quoted, current = [], 0, False, ""
+    for i, char in enumerate(text):
+        if char == "'" and text[i - 1 : i] != "\\":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            args.append(current.strip())
+            current = ""
+            continue
+        current += char
+    if current.strip():
+        args.append(current.strip())
+    return args
+
+
+def intrinsic(expr: str, data, context: dict):
+    name, rest = expr.split("(", 1)
+    args = [evaluate(arg, data, context) for arg in split_arguments(rest[:-1])]
+    if name == "States.Format":
+        template, values = args[0], iter(args[1:])
+        return re.sub(r"\{\}", lambda _: str(next(values)), template)
+    if name == "States.JsonToString":
+        return json.dumps(args[0], separators=(",", ":"))
+    if name == "States.StringToJson":
+        return json.loads(args[0])
+    if name == "States.Array":
+        return args
+    raise StatesError("States.Runtime", f"Unsupported intrinsic {name}")
+
+
+def evaluate(expr: str, data, context: dict):
+    if expr.startswith("States."):
+        return intrinsic(expr, data, context)
+    if expr.startswith("$"):
+        return get_path(data, expr, context)
+    if expr.startswith("'"):
+        return expr[1:-1].replace("\\'", "'")
+    return json.loads(expr)
+
+
+def render(template, data, context: dict):
+    """Resolves the ".$" fields of a Parameters, ItemSelector or ResultSelector."""
+    if isinstance(template, dict):
+        return {
+            key[:-2] if key.endswith(".$") else key: evaluate(value, data, context)
+            if key.endswith(".$")
+            else render(value, data, context)
+            for key, value in template.items()
+        }
+    if isinstance(template, list):
+        return [render(value, data, context) for value in template]
+    return template
+
+
+COMPARISONS = {
+    "StringEquals": lambda a, b: a == b,
+    "BooleanEquals": lambda a, b: a is b,
+    "NumericEquals": lambda a, b: a == b,
+    "NumericGreaterThan": lambda a, b: a > b,
+    "NumericGreaterThanEquals": lambda a, b: a >= b,
+    "NumericLessThan": lambda a, b: a < b,
+    "NumericLessThanEquals": lambda a, b: a <= b,
+    "IsNull": lambda a, b: (a is None) is b,
+}
+
+
+def matches(rule: dict, data, context: dict) -> bool:
+    if "Not" in rule:
+        return not matches(rule["Not"], data, context)
+    if "And" in rule:
+        return all(matches(r, data, context) for r in rule["And"])
+    if "Or" in rule:
+        return any(matches(r, data, context) for r in rule["Or"])
+    if "IsPresent" in rule:
+        try:
+            get_path(data, rule["Variable"], context)
+            return rule["IsPresent"]
+        except StatesError:
+            return not rule["IsPresent"]
+    value = get_path(data, rule["Variable"], context)
+    for op, expected in rule.items():
+        if op.endswith("Path") and op[:-4] in COMPARISONS:
+            return COMPARISONS[op[:-4]](value, get_path(data, expected, context))
+        if op in COMPARISONS:
+            return COMPARISONS[op](value, expected)
+    raise StatesError("States.Runtime", f"Unsupported Choice rule {rule}")
+
+
+def error_matches(error_equals: list, error: str) -> bool:
+    return "States.ALL" in error_equals or error in error_equals
+
+
+# --- Simulated services ----------------------------------------------------
+
+
+class SimulatedRds:
+    """RDS DB instances whose status follows the simulated clock."""
+
+    def __init__(self, create_seconds: float, delete_seconds: float):
+        self.create_seconds = create_seconds
+        self.delete_seconds = delete_seconds
+        self.instances: dict = {}
+
+    def describe(self, identifier: str, now: float) -> dict:
+        instance = self.instances[identifier]
+        if instance.get("deleted_at") is not None:
+            status = "deleting"
+        elif now >= instance["available_at"]:
+            status = "available"
+        else:
+            status = "creating"
+        return {
+            "DbInstanceIdentifier": identifier,
+            "DbInstanceArn": f"arn:aws:rds:{REGION}:{ACCOUNT}:db:{identifier}",
+            "DbInstanceStatus": status,
+            "DbSubnetGroup": {"VpcId": "vpc-local"},
+            "Engine": "sqlserver-se",
+            "EngineVersion": "16.00",
+            "DbInstanceClass": "db.m5.2xlarge",
+            "AllocatedStorage": 200,
+            "MasterUsername": "admin",
+            "Endpoint": {"Address": f"{identifier}.local", "Port": 1433},
+        }
+
+    def call(self, action: str, params: dict, now: float) -> dict:
+        identifier = params["DbInstanceIdentifier"]
+        instance = self.instances.get(identifier)
+        if instance and now >= instance.get("deleted_at", float("inf")):
+            del self.instances[identifier]
+            instance = None
+        if action == "createDBInstance":
+            self.instances[identifier] = {"available_at": now + self.create_seconds}
+            return {"DbInstance": self.describe(identifier, now)}
+        if instance is None:
+            raise StatesError("Rds.DbInstanceNotFoundException", identifier)
+        if action == "deleteDBInstance":
+            instance["deleted_at"] = now + self.delete_seconds
+            return {"DbInstance": self.describe(identifier, now)}
+        if action == "describeDBInstances":
+            return {"DbInstances": [self.describe(identifier, now)]}
+        raise StatesError("States.Runtime", f"Unsupported RDS action {action}")
+
+
+def fake_pytds(simulator: "Simulator", restore_seconds: float) -> types.ModuleType:
+    """
+    A pytds stand-in for the restore Lambdas: rds_restore_database starts a
+    task that rds_task_status reports as SUCCESS after restore_seconds.
+    """
+
+    class Cursor:
+        def __init__(self):
+            self.rows = []
+
+        def execute(self, sql):
+            if "rds_restore_database" in sql:
+                simulator.restore_started = simulator.clock
+                self.rows = [(1,)]
+            elif "rds_task_status" in sql:
+                done = simulator.clock >= simulator.restore_started + restore_seconds
+                status = "SUCCESS" if done else "IN_PROGRESS"
+                self.rows = [(1, "RESTORE_DB", DB_NAME, 0, 0, status, "")]
+            else:
+                self.rows = []
+
+        def fetchone(self):
+            return self.rows.pop(0) if self.rows else None
+
+        def nextset(self):
+            return None
+
+        def close(self):
+            pass
+
+    class Connection:
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            pass
+
+        def close(self):
+            pass
+
+    module = types.ModuleType("pytds")
+    module.connect = lambda **kwargs: Connection()  # type: ignore[attr-defined]
+    return module
+
+
+# --- Interpreter -----------------------------------------------------------
+
+
+class Simulator:
+    def __init__(
+        self,
+        machines: dict,
+        handlers: dict,
+        rds: SimulatedRds,
+        lambda_overhead: float,
+        sdk_latency: float,
+        time_scale: float,
+    ):
+        self.machines = machines
+        self.handlers = handlers
+        self.rds = rds
+        self.lambda_overhead = lambda_overhead
+        self.sdk_latency = sdk_latency
+        self.time_scale = time_scale
+        # Simulated time of the call in progress, read by the fake services
+        self.clock = 0.0
+        self.restore_started = float("inf")
+        self.states: defaultdict[str, dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0}
+        )
+        self.maps: dict = {}
+        self.executions = 0
+
+    def record(self, label: str, start: float, end: float):
+        stats = self.states[label]
+        stats["count"] += 1
+        stats["total_s"] += end - start
+        stats["max_s"] = max(stats["max_s"], end - start)
+
+    def run_machine(self, arn: str, data, start: float):
+        """Runs an execution; returns its output, end time and critical path."""
+        name, definition = self.machines[arn]
+        self.executions += 1
+        context = {
+            "Execution": {"Id": f"{arn}:execution-{self.executions}"},
+            "StateMachine": {"Id": arn},
+        }
+        return self.run_states(definition, data, start, context, name)
+
+    def run_states(self, definition: dict, data, t: float, context: dict, prefix: str):
+        name = definition["StartAt"]
+        path: list[tuple[str, float, float]] = []
+        while True:
+            state = definition["States"][name]
+            label = f"{prefix}/{name}"
+            context = {
+                **context,
+                "State": {"Name": name, "EnteredTime": t, "RetryCount": 0},
+            }
+            data, end, sub_path, next_name = self.run_state(
+                state, data, t, context, label
+            )
+            self.record(label, t, end)
+            path.extend(sub_path if sub_path is not None else [(label, t, end)])
+            t = end
+            if next_name is None:
+                return data, t, path
+            name = next_name
+
+    def run_state(self, state: dict, data, t: float, context: dict, label: str):
+        kind = state["Type"]
+        if kind == "Succeed":
+            return self.output(state, data, context), t, None, None
+        if kind == "Fail":
+            raise StatesError(state.get("Error", "States.Fail"), state.get("Cause", ""))
+        if kind == "Wait":
+            seconds = state.get("Seconds")
+            if seconds is None:
+                seconds = get_path(data, state["SecondsPath"], context)
+            return data, t + seconds, None, self.next_state(state)
+        if kind == "Choice":
+            effective = self.input(state, data, context)
+            for rule in state["Choices"]:
+                if matches(rule, effective, context):
+                    return data, t, None, rule["Next"]
+            if "Default" not in state:
+                raise StatesError("States.NoChoiceMatched", label)
+            return data, t, None, state["Default"]
+        if kind == "Pass":
+            effective = self.input(state, data, context)
+            if "Parameters" in state:
+                result = render(state["Parameters"], effective, context)
+            else:
+                result = state.get("Result", effective)
+            return (
+                self.result(state, data, result, context),
+                t,
+                None,
+                self.next_state(state),
+            )
+        if kind in ("Task", "Map"):
+            return self.run_with_retries(state, data, t, context, label)
+        raise StatesError("States.Runtime", f"Unsupported state type {kind}")
+
+    def run_with_retries(self, state: dict, data, t: float, context: dict, label: str):
+        attempts: defaultdict[int, int] = defaultdict(int)
+        path: list[tuple[str, float, float]] = []
+        while True:
+            try:
+                effective = self.input(state, data, context)
+                if state["Type"] == "Map":
+                    result, end, sub_path = self.run_map(
+                        state, effective, t, context, label
+                    )
+                else:
+                    params = render(
+                        state.get("Parameters", effective), effective, context
+                    )
+                    result, end, sub_path = self.run_task(
+                        state["Resource"], params, t, label
+                    )
+                if "ResultSelector" in state:
+                    result = render(state["ResultSelector"], result, context)
+                output = self.result(state, data, result, context)
+                return output, end, path + sub_path, self.next_state(state)
+            except StatesError as e:
+                for i, retrier in enumerate(state.get("Retry", [])):
+                    if not error_matches(retrier["ErrorEquals"], e.error):
+                        continue
+                    if attempts[i] < retrier.get("MaxAttempts", 3):
+                        delay = (
+                            retrier.get("IntervalSeconds", 1)
+                            * retrier.get("BackoffRate", 2.0) ** attempts[i]
+                        )
+                        attempts[i] += 1
+                        path.append((f"{label} (retry wait)", t, t + delay))
+                        t += delay
+                        context = {
+                            **context,
+                            "State": {
+                                **context["State"],
+                                "RetryCount": sum(attempts.values()),
+                            },
+                        }
+                        break
+                    retrier = None
+                    break
+                else:
+                    retrier = None
+                if retrier is not None:
+                    continue
+                for catcher in state.get("Catch", []):
+                    if error_matches(catcher["ErrorEquals"], e.error):
+                        error = {"Error": e.error, "Cause": e.cause}
+                        output = (
+                            set_path(data, catcher.get("ResultPath", "$"), error)
+                            if catcher.get("ResultPath", "$") is not None
+                            else data
+                        )
+                        return output, t, path + [(label, t, t)], catcher["Next"]
+                raise
+
+    def run_task(self, resource: str, params, t: float, label: str):
+        if resource == "arn:aws:states:::lambda:invoke":
+            payload, end = self.invoke(
+                params["FunctionName"], params.get("Payload", {}), t
+            )
+            return {"Payload": payload, "StatusCode": 200}, end, [(label, t, end)]
+        if resource == "arn:aws:states:::states:startExecution.sync":
+            execution_input = params.get("Input", {})
+            if isinstance(execution_input, str):
+                execution_input = json.loads(execution_input)
+            output, end, path = self.run_machine(
+                params["StateMachineArn"], execution_input, t
+            )
+            return {"Output": json.dumps(output), "Status": "SUCCEEDED"}, end, path
+        if resource.startswith("arn:aws:states:::aws-sdk:"):
+            service, action = resource.rsplit(":", 2)[-2:]
+            end = t + self.sdk_latency
+            if service == "rds":
+                return self.rds.call(action, params, t), end, [(label, t, end)]
+            client = boto3.client(SDK_SERVICES.get(service, service))
+            method = re.sub(r"(?<!^)(?=[A-Z])", "_", action).lower()
+            response = getattr(client, method)(**params)
+            response.pop("ResponseMetadata", None)
+            return response, end, [(label, t, end)]
+        # A Lambda ARN as the resource invokes the function with the input
+        result, end = self.invoke(resource, params, t)
+        return result, end, [(label, t, end)]
+
+    def invoke(self, arn: str, payload, t: float):
+        """Invokes a handler in-process; returns its result and simulated end time."""
+        handler = self.handlers[arn]
+        self.clock = t
+        started = time.perf_counter()
+        try:
+            with (
+                contextlib.redirect_stdout(io.StringIO()),
+                contextlib.redirect_stderr(io.StringIO()),
+            ):
+                result = handler(json.loads(json.dumps(payload)), None)
+        except Exception as e:
+            raise StatesError(type(e).__name__, str(e))
+        finally:
+            elapsed = time.perf_counter() - started
+        return json.loads(json.dumps(result, default=str)), (
+            t + self.lambda_overhead + elapsed * self.time_scale
+        )
+
+    def run_map(self, state: dict, effective, t: float, context: dict, label: str):
+        """
+        Runs the Map iterations in list order on MaxConcurrency slots: each
+        item starts when the earliest slot frees up. The critical path runs
+        through the items of the slot that finishes last.
+        """
+        items = get_path(effective, state.get("ItemsPath", "$"), context)
+        processor = state.get("ItemProcessor") or state["Iterator"]
+        selector = state.get("ItemSelector") or state.get("Parameters")
+        slots = min(state.get("MaxConcurrency") or len(items), len(items)) or 1
+        free = [(t, slot) for slot in range(slots)]
+        chains: list[list[tuple[str, float, float]]] = [[] for _ in range(slots)]
+        outputs, busy = [], 0.0
+
+        for index, item in enumerate(items):
+            start, slot = heapq.heappop(free)
+            item_context = {**context, "Map": {"Item": {"Index": index, "Value": item}}}
+            item_input = render(selector, effective, item_context) if selector else item
+            output, end, path = self.run_states(
+                processor, item_input, start, item_context, label
+            )
+            outputs.append(output)
+            chains[slot] = chains[slot] + path
+            busy += end - start
+            heapq.heappush(free, (end, slot))
+
+        ends = {slot: end for end, slot in free}
+        end = max(ends.values(), default=t)
+        last_slot = max(ends, key=lambda slot: ends[slot]) if ends else 0
+        capacity = slots * (end - t)
+        self.maps[label] = {
+            "items": len(items),
+            "max_concurrency": state.get("MaxConcurrency", 0),
+            "slots": slots,
+            "duration_s": round(end - t, 3),
+            "busy_slot_s": round(busy, 3),
+            "idle_slot_s": round(capacity - busy, 3),
+            "tail_idle_slot_s": round(sum(end - e for e in ends.values()), 3),
+            "utilisation": round(busy / capacity, 3) if capacity else 1.0,
+        }
+        return outputs, end, chains[last_slot] if items else []
+
+    def input(self, state: dict, data, context: dict):
+        if "InputPath" in state and state["InputPath"] is None:
+            return {}
+        return get_path(data, state.get("InputPath", "$"), context)
+
+    def result(self, state: dict, data, result, context: dict):
+        if "ResultPath" in state and state["ResultPath"] is None:
+            output = data
+        else:
+            output = set_path(data, state.get("ResultPath", "$"), result)
+        return self.output(state, output, context)
+
+    def output(self, state: dict, data, context: dict):
+        if "OutputPath" in state and state["OutputPath"] is None:
+            return {}
+        return get_path(data, state.get("OutputPath", "$"), context)
+
+    @staticmethod
+    def next_state(state: dict):
+        return None if state.get("End") else state["Next"]
+
+
+def summarise_path(path: list) -> list:
+    """Time per state along the critical path, in order of first appearance."""
+    totals: dict = {}
+    for label, start, end in path:
+        entry = totals.setdefault(label, {"state": label, "count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += end - start
+    return [
+        {**entry, "seconds": round(entry["seconds"], 3)}
+        for entry in totals.values()
+        if entry["seconds"] > 0
+    ]
+
+
+def simulate(profile: str, scale: float, args) -> dict:
+    db = FakeDatabase(build_profile(profile, scale))
+
+    with mock_aws():
+        boto3.setup_default_session(region_name=REGION)
+        boto3.client("s3").create_bucket(
+            Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION}
+        )
+        secret_arn = boto3.client("secretsmanager").create_secret(
+            Name="benchmark-db-password", SecretString="password"
+        )["ARN"]
+        boto3.client("dynamodb").create_table(
+            TableName=PROGRESS_TABLE,
+            KeySchema=[
+                {"AttributeName": "run", "KeyType": "HASH"},
+                {"AttributeName": "table", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "run", "AttributeType": "S"},
+                {"AttributeName": "table", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        os.environ.update(
+            DATABASE_PW_SECRET_ARN=secret_arn,
+            DATABASE_REFRESH_MODE=args.refresh_mode,
+            OUTPUT_TABLE_FORMAT="parquet",
+            OUTPUT_PARQUET_FILE_SIZE=args.parquet_file_size,
+            OUTPUT_BUCKET=BUCKET,
+            EXPORT_PROGRESS_TABLE=PROGRESS_TABLE,
+            MAX_CONCURRENCY=str(args.max_concurrency),
+        )
+
+        rds = SimulatedRds(args.rds_create_seconds, args.rds_delete_seconds)
+        simulator = Simulator(
+            {}, {}, rds, args.lambda_overhead, args.sdk_latency, args.time_scale
+        )
+        sys.modules["pymssql"] = fake_pymssql(db)
+        sys.modules["pytds"] = fake_pytds(simulator, args.restore_seconds)
+        for name in LAMBDAS.values():
+            simulator.handlers[lambda_arn(name)] = load_handler(name).handler
+
+        arns = {
+            name: state_machine_arn(name)
+            for name in ("db-restore", "db-export", "db-delete")
+        }
+        variables = {
+            **{variable: lambda_arn(name) for variable, name in LAMBDAS.items()},
+            "MasterUserPassword": "password",
+            "ParameterGroupName": "parameter-group",
+            "OptionGroupName": "option-group",
+            "VpcSecurityGroupIds": ["sg-local"],
+            "DbSubnetGroupName": "subnet-group",
+            "DatabaseExportStateMachineArn": arns["db-export"],
+            "Engine": "sqlserver-se",
+            "EngineVersion": "16.00",
+            "LambdaArn": arns["db-delete"],
+            "prepare_database": False,
+            "max_concurrency": args.max_concurrency,
+        }
+        for name, arn in arns.items():
+            simulator.machines[arn] = (
+                name,
+                render_template(REPO_ROOT / f"{name}.asl.json.tpl", variables),
+            )
+
+        execution_input = {
+            "name": NAME,
+            "environment": ENVIRONMENT,
+            "db_name": DB_NAME,
+            "extraction_timestamp": EXTRACTION_TIMESTAMP,
+            "output_bucket": BUCKET,
+            "bak_upload_bucket": BUCKET,
+            "bak_upload_key": f"{DB_NAME}.bak",
+        }
+        if args.machine == "export":
+            # The export as started by the restore machine
+            identifier = f"{NAME}-{ENVIRONMENT}-sql-server-backup-export"
+            rds.instances[identifier] = {"available_at": 0.0}
+            execution_input = {
+                **execution_input,
+                "db_endpoint": f"{identifier}.local",
+                "db_username": "admin",
+                "tables_to_export": [],
+                "DbInstanceIdentifier": identifier,
+            }
+
+        started = time.perf_counter()
+        _, end, path = simulator.run_machine(
+            arns[f"db-{args.machine}"], execution_input, 0.0
+        )
+
+    return {
+        "tables": len(db.tables),
+        "rows": sum(t.rows for t in db.tables.values()),
+        "simulated_s": round(end, 3),
+        "real_s": round(time.perf_counter() - started, 3),
+        "critical_path": summarise_path(path),
+        "maps": simulator.maps,
+        "states": {
+            label: {
+                "count": stats["count"],
+                "total_s": round(stats["total_s"], 3),
+                "max_s": round(stats["max_s"], 3),
+            }
+            for label, stats in simulator.states.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--machine", choices=["restore", "export"], default="restore")
+    parser.add_argument("--profile", action="append", choices=PROFILES)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--max-concurrency", type=int, default=5)
+    parser.add_argument("--refresh-mode", default="full")
+    parser.add_argument("--parquet-file-size", default="10")
+    parser.add_argument(
+        "--lambda-overhead",
+        type=float,
+        default=0.5,
+        help="seconds added to every Lambda invocation (invoke, cold start)",
+    )
+    parser.add_argument(
+        "--sdk-latency",
+        type=float,
+        default=0.1,
+        help="seconds taken by every AWS SDK integration task",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="multiplier from measured in-process handler time to simulated time",
+    )
+    parser.add_argument("--rds-create-seconds", type=float, default=900)
+    parser.add_argument("--rds-delete-seconds", type=float, default=300)
+    parser.add_argument("--restore-seconds", type=float, default=600)
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    os.environ.setdefault("AWS_DEFAULT_REGION", REGION)
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "profiles": {
+            profile: simulate(profile, args.scale, args)
+            for profile in (args.profile or PROFILES)
+        },
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
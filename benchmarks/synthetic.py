@@ -0,0 +1,372 @@
+"""
+Synthetic SQL Server stand-in for the benchmarks.
+
+Tables are generated into an in-memory SQLite database attached as the
+"dbo" schema, so the chunk queries produced by the scanner
+(ROW_NUMBER() OVER ... FROM [dbo].[table]) run unchanged. Catalog
+queries (INFORMATION_SCHEMA, sys.*, sp_spaceused) are answered from the
+table definitions. FakeConnection implements the subset of the DB-API
+used by the Lambdas and by pandas.read_sql_query.
+"""
+
+import random
+import re
+import sqlite3
+import string
+import types
+from dataclasses import dataclass, field
+
+# SQL Server type -> approximate on-disk bytes per value
+TYPE_SIZES = {
+    "int": 4,
+    "bigint": 8,
+    "bit": 1,
+    "datetime": 8,
+    "decimal": 9,
+    "varchar": 50,
+    "nvarchar": 100,
+    "varchar(max)": 20000,
+    "varbinary": 256,
+    "varbinary(max)": 8000,
+    "timestamp": 8,
+}
+
+
+@dataclass
+class Column:
+    name: str
+    data_type: str
+    size: int = 0
+
+    @property
+    def bytes(self) -> int:
+        return self.size or TYPE_SIZES.get(self.data_type, 16)
+
+    @property
+    def max_length(self) -> int | None:
+        """INFORMATION_SCHEMA's character_maximum_length: -1 for (max)."""
+        if self.data_type.endswith("(max)"):
+            return -1
+        if "char" in self.data_type or "binary" in self.data_type:
+            return self.bytes
+        return None
+
+    @property
+    def information_schema_type(self) -> str:
+        return self.data_type.replace("(max)", "")
+
+
+@dataclass
+class Table:
+    name: str
+    columns: list[Column]
+    rows: int
+    pk: list[str] = field(default_factory=lambda: ["id"])
+    schema: str = "dbo"
+
+    @property
+    def row_bytes(self) -> int:
+        return sum(c.bytes for c in self.columns)
+
+
+def _text(rng: random.Random, length: int) -> str:
+    return "".join(rng.choices(string.ascii_letters + " ", k=length))
+
+
+def _value(rng: random.Random, col: Column, row: int):
+    if col.name == "id":
+        return row
+    if col.data_type in ("int", "bigint"):
+        return rng.randint(0, 1_000_000)
+    if col.data_type == "bit":
+        return rng.randint(0, 1)
+    if col.data_type == "decimal":
+        return round(rng.random() * 10_000, 2)
+    if col.data_type == "datetime":
+        return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00"
+    if col.data_type == "timestamp":
+        return row.to_bytes(8, "big")
+    if col.data_type.startswith("varbinary"):
+        # Legacy single-byte text stored as binary, as seen in the exports
+        return _text(rng, col.bytes).encode("cp1252")
+    if col.data_type.startswith("nvarchar"):
+        return _text(rng, col.bytes // 2)
+    return _text(rng, col.bytes)
+
+
+def _id_table(name: str, rows: int, columns: list[Column]) -> Table:
+    return Table(name=name, rows=rows, columns=[Column("id", "int"), *columns])
+
+
+def build_profile(profile: str, scale: float = 1.0) -> list[Table]:
+    """Returns the table definitions for a named workload profile."""
+
+    def n(rows: int) -> int:
+        return max(1, int(rows * scale))
+
+    if profile == "wide":
+        cols = [Column(f"c{i:03d}", "int" if i % 2 else "varchar") for i in range(200)]
+        return [_id_table("wide_table", n(20_000), cols)]
+    if profile == "lob":
+        cols = [Column("body", "varchar(max)"), Column("blob", "varbinary(max)")]
+        return [_id_table("lob_table", n(2_000), cols)]
+    if profile == "binary":
+        cols = [
+            Column("rv", "timestamp"),
+            Column("legacy_text", "varbinary"),
+            Column("amount", "decimal"),
+            Column("updated", "datetime"),
+        ]
+        return [_id_table("binary_table", n(50_000), cols)]
+    if profile == "many_small":
+        cols = [Column("name", "nvarchar"), Column("flag", "bit")]
+        return [_id_table(f"small_{i:03d}", n(50), cols) for i in range(200)]
+    raise ValueError(f"Unknown profile: {profile}")
+
+
+PROFILES = ["wide", "lob", "binary", "many_small"]
+
+
+class FakeDatabase:
+    """An in-memory SQLite database populated with synthetic tables."""
+
+    def __init__(self, tables: list[Table], seed: int = 0):
+        self.tables = {t.name: t for t in tables}
+        self.sqlite = sqlite3.connect(":memory:", check_same_thread=False)
+        self.sqlite.execute("ATTACH DATABASE ':memory:' AS dbo")
+        rng = random.Random(seed)
+        for table in tables:
+            col_ddl = ", ".join(f"[{c.name}]" for c in table.columns)
+            self.sqlite.execute(f"CREATE TABLE dbo.[{table.name}] ({col_ddl})")
+            placeholders = ", ".join("?" for _ in table.columns)
+            self.sqlite.executemany(
+                f"INSERT INTO dbo.[{table.name}] VALUES ({placeholders})",
+                (
+                    tuple(_value(rng, c, row) for c in table.columns)
+                    for row in range(1, table.rows + 1)
+                ),
+            )
+        self.sqlite.commit()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(t.rows * t.row_bytes for t in self.tables.values())
+
+    def connect(self, **kwargs) -> "FakeConnection":
+        return FakeConnection(self)
+
+
+def _search(pattern: str, sql: str) -> str:
+    """The first group of pattern in sql, which the fake database must find."""
+    match = re.search(pattern, sql)
+    if match is None:
+        raise ValueError(f"Unexpected query: {sql}")
+    return match.group(1)
+
+
+class FakeCursor:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.description: list[tuple] | None = None
+        self._rows: list[tuple] = []
+        self._position = 0
+        self.arraysize = 1
+        self.queries = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def _result(self, names: list[str], rows: list[tuple]):
+        self.description = [(n, None, None, None, None, None, None) for n in names]
+        self._rows = list(rows)
+        self._position = 0
+
+    def _table(self, name: str) -> Table | None:
+        return self.db.tables.get(name)
+
+    def execute(self, sql: str, params: tuple | None = None):
+        self.queries += 1
+        flat = " ".join(sql.split())
+        lowered = flat.lower()
+        params = tuple(params or ())
+        tables = self.db.tables.values()
+
+        # Session settings and query hints have no SQLite equivalent
+        if lowered.startswith("set "):
+            return self._result([], [])
+        sql = re.sub(r"\s+OPTION \([^)]*\)$", "", sql)
+
+        if lowered.startswith("select name from sys.schemas"):
+            return self._result(["name"], [("dbo",)])
+        if "from information_schema.tables" in lowered:
+            return self._result(
+                ["TABLE_SCHEMA", "TABLE_NAME"], [(t.schema, t.name) for t in tables]
+            )
+        if "i.is_primary_key = 1" in lowered:
+            return self._result(
+                ["schema_name", "table_name", "column_name", "key_ordinal"],
+                [
+                    (t.schema, t.name, col, i + 1)
+                    for t in tables
+                    for i, col in enumerate(t.pk)
+                ],
+            )
+        if lowered.startswith("exec sp_spaceused"):
+            name = _search(r"N'[^.]+\.([^']+)'", flat)
+            t = self._table(name)
+            if t is None:
+                raise ValueError(f"Unknown table: {name}")
+            kb = f"{max(1, t.rows * t.row_bytes // 1024):,} KB"
+            return self._result(
+                ["name", "rows", "reserved", "data", "index_size", "unused"],
+                [(t.name, str(t.rows), kb, kb, "0 KB", "0 KB")],
+            )
+        if "sys.partition_schemes" in lowered:
+            # The synthetic tables are not partitioned
+            return self._result(["name", "name", "partition_number", "rows"], [])
+        if "from sys.tables t" in lowered:
+            ts = _search(r"'([^']*)' AS extraction_timestamp", flat)
+            return self._result(
+                [
+                    "table_name",
+                    "original_row_count",
+                    "exported_row_count",
+                    "extraction_timestamp",
+                ],
+                [(t.name, t.rows, None, ts) for t in tables],
+            )
+        if "information_schema.columns" in lowered:
+            t = self._table(params[1])
+            cols = t.columns if t else []
+            if "count(*)" in lowered:
+                return self._result([""], [(0,)])
+            if "'timestamp', 'rowversion'" in lowered:
+                return self._result(
+                    ["COLUMN_NAME"],
+                    [(c.name,) for c in cols if c.data_type == "timestamp"],
+                )
+            if "character_maximum_length = -1" in lowered:
+                return self._result(
+                    ["column_name"],
+                    [(c.name,) for c in cols if c.data_type.endswith("(max)")],
+                )
+            if "character_maximum_length" in lowered.split("from")[0]:
+                return self._result(
+                    ["column_name", "data_type", "character_maximum_length"],
+                    [(c.name, c.information_schema_type, c.max_length) for c in cols],
+                )
+            if "data_type" in lowered.split("from")[0]:
+                return self._result(
+                    ["column_name", "data_type"],
+                    [(c.name, c.information_schema_type) for c in cols],
+                )
+            return self._result(["column_name"], [(c.name,) for c in cols])
+
+        # Data queries run on SQLite as generated by the scanner, but for
+        # the T-SQL conversions of a server-side projection
+        sql = re.sub(r"CONVERT\(varchar\(\d+\), (\[[^\]]+\]), 2\)", r"hex(\1)", sql)
+        sql = re.sub(r" AS (n?varchar)\(max\)\)", r" AS \1)", sql)
+        cur = self.db.sqlite.execute(sql)
+        self._result([d[0] for d in cur.description], cur.fetchall())
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size: int | None = None):
+        end = self._position + (size or self.arraysize)
+        rows = self._rows[self._position : end]
+        self._position = min(end, len(self._rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._position :]
+        self._position = len(self._rows)
+        return rows
+
+    def nextset(self):
+        return None
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.db)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def fake_pymssql(db: FakeDatabase) -> types.ModuleType:
+    """A pymssql stand-in module whose connect() opens the fake database."""
+    module = types.ModuleType("pymssql")
+    module.connect = db.connect  # type: ignore[attr-defined]
+    return module
+
+
+class FakeBatchReader:
+    """arrow-odbc's batch reader over a result of the fake database."""
+
+    def __init__(self, cursor: FakeCursor, batch_size: int):
+        import pyarrow as pa
+
+        if cursor.description is None:
+            raise ValueError("The query returned no result set")
+        names = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+        self.batches = [
+            pa.RecordBatch.from_arrays(
+                [pa.array(list(col)) for col in zip(*rows[i : i + batch_size])],
+                names,
+            )
+            for i in range(0, len(rows), batch_size)
+        ]
+        self.schema = (
+            self.batches[0].schema
+            if self.batches
+            else pa.schema([(name, pa.null()) for name in names])
+        )
+
+    def __iter__(self):
+        return iter(self.batches)
+
+
+def fake_drivers(db: FakeDatabase) -> dict[str, types.ModuleType]:
+    """
+    Stand-ins for the modules of every export driver (see
+    database_export/drivers.py), all reading the fake database. They share
+    its SQLite reads, so comparing drivers measures the exporter's work per
+    driver, such as building tuples or casting Arrow columns, rather than
+    the drivers' own TDS or ODBC decoding.
+    """
+    pytds = types.ModuleType("pytds")
+    pytds.connect = db.connect  # type: ignore[attr-defined]
+
+    def read_arrow_batches_from_odbc(
+        query, connection_string, batch_size=50_000, parameters=None, **kwargs
+    ):
+        # Session settings are sent ahead of the query; SQLite has none
+        query = re.sub(r"^(SET [^;]*; )*", "", query)
+        cursor = db.connect().cursor()
+        cursor.execute(query.replace("?", "%s"), tuple(parameters or ()))
+        if not cursor.description:
+            return None
+        return FakeBatchReader(cursor, batch_size)
+
+    arrow_odbc = types.ModuleType("arrow_odbc")
+    arrow_odbc.read_arrow_batches_from_odbc = read_arrow_batches_from_odbc  # type: ignore[attr-defined]
+    return {"pymssql": fake_pymssql(db), "pytds": pytds, "arrow_odbc": arrow_odbc}
@@ -1,8 +1,43 @@
 {
-  "Comment": "For tables: creates metadata in Glue Catalog, exports data to S3, returns row count table, then triggers a state machine to export view definitions or to delete the RDS DB instance.",
-  "StartAt": "Run Export Scanner Lambda",
+  "Comment": "For tables: creates metadata in Glue Catalog, exports data to S3, publishes and validates each table as soon as its last chunk is exported, then the tables left over, then triggers a state machine to export view definitions or to delete the RDS DB instance.",
+  "StartAt": "${prepare_database ? "Prepare Database" : "Run Export Scanner Lambda"}",
   "TimeoutSeconds": 10800,
   "States": {
+%{ if prepare_database ~}
+    "Prepare Database": {
+      "Type": "Task",
+      "Resource": "arn:aws:states:::lambda:invoke",
+      "Parameters": {
+        "FunctionName": "${DatabaseExportPreparerLambdaArn}",
+        "Payload.$": "$"
+      },
+      "Retry": [
+        {
+          "ErrorEquals": [
+            "Lambda.ServiceException",
+            "Lambda.AWSLambdaException",
+            "Lambda.SdkClientException",
+            "Lambda.TooManyRequestsException"
+          ],
+          "IntervalSeconds": 1,
+          "MaxAttempts": 3,
+          "BackoffRate": 2,
+          "JitterStrategy": "FULL"
+        }
+      ],
+      "Catch": [
+        {
+          "ErrorEquals": [
+            "States.ALL"
+          ],
+          "ResultPath": "$.prepare_error",
+          "Next": "Run Export Scanner Lambda"
+        }
+      ],
+      "ResultPath": null,
+      "Next": "Run Export Scanner Lambda"
+    },
+%{ endif ~}
     "Run Export Scanner Lambda": {
       "Type": "Task",
       "Resource": "arn:aws:states:::lambda:invoke",
@@ -46,7 +81,11 @@
         "chunk": {
           "table.$": "$$.Map.Item.Value.table",
           "query.$": "$$.Map.Item.Value.query",
-          "database.$": "$$.Map.Item.Value.database"
+          "database.$": "$$.Map.Item.Value.database",
+          "chunk_index.$": "$$.Map.Item.Value.chunk_index",
+          "output_path.$": "$$.Map.Item.Value.output_path",
+          "encoding_profile.$": "$$.Map.Item.Value.encoding_profile",
+          "key_columns.$": "$$.Map.Item.Value.key_columns"
         },
         "db_endpoint.$": "$.db_endpoint",
         "db_username.$": "$.db_username",
@@ -65,7 +104,10 @@
           "Invoke Export Processor - Chunk Export": {
             "Type": "Task",
             "Resource": "arn:aws:states:::lambda:invoke",
-            "OutputPath": "$.Payload",
+            "ResultSelector": {
+              "table_complete.$": "$.Payload.table_complete"
+            },
+            "ResultPath": "$.export_result",
             "Parameters": {
               "FunctionName": "${DatabaseExportProcessorLambdaArn}",
               "Payload": {
@@ -75,7 +117,8 @@
                 "db_username.$": "$.db_username",
                 "output_bucket.$": "$.output_bucket",
                 "name.$": "$.name",
-                "extraction_timestamp.$": "$.extraction_timestamp"
+                "extraction_timestamp.$": "$.extraction_timestamp",
+                "retry_count.$": "$$.State.RetryCount"
               }
             },
             "Retry": [
@@ -102,6 +145,71 @@
                 "Next": "Send EventBridge Event"
               }
             ],
+            "Next": "Table Complete?"
+          },
+          "Table Complete?": {
+            "Type": "Choice",
+            "Choices": [
+              {
+                "Variable": "$.export_result.table_complete",
+                "BooleanEquals": true,
+                "Next": "Finalise Completed Table"
+              }
+            ],
+            "Default": "Chunk Succeeded"
+          },
+          "Finalise Completed Table": {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+              "FunctionName": "${DatabaseExportFinaliserLambdaArn}",
+              "Payload": {
+                "chunk": {
+                  "table.$": "$.chunk.table",
+                  "database.$": "$.chunk.database",
+                  "extraction_timestamp.$": "$.extraction_timestamp"
+                }
+              }
+            },
+            "Retry": [
+              {
+                "ErrorEquals": [
+                  "States.ALL"
+                ],
+                "IntervalSeconds": 5,
+                "MaxAttempts": 3,
+                "BackoffRate": 1,
+                "JitterStrategy": "NONE"
+              }
+            ],
+            "ResultPath": null,
+            "Next": "Validate Completed Table"
+          },
+          "Validate Completed Table": {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+              "FunctionName": "${ExportValidationRowCountUpdaterLambdaArn}",
+              "Payload": {
+                "chunk": {
+                  "table.$": "$.chunk.table",
+                  "database.$": "$.chunk.database",
+                  "extraction_timestamp.$": "$.extraction_timestamp"
+                }
+              }
+            },
+            "Retry": [
+              {
+                "ErrorEquals": [
+                  "States.ALL"
+                ],
+                "IntervalSeconds": 5,
+                "MaxAttempts": 3,
+                "BackoffRate": 1,
+                "JitterStrategy": "NONE"
+              }
+            ],
+            "ResultPath": null,
             "Next": "Chunk Succeeded"
           },
           "Send EventBridge Event": {
@@ -131,17 +239,32 @@
             "Parameters": {
                   "database.$": "$.chunk.database",
                   "table.$": "$.chunk.table",
+                  "chunk_index.$": "$.chunk.chunk_index",
+                  "extraction_timestamp.$": "$.extraction_timestamp",
                   "status": "TIMED_OUT"
             },
+            "ResultPath": "$.timeout_result",
+            "Next": "Write Timeout Result"
+          },
+          "Write Timeout Result": {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::aws-sdk:s3:putObject",
+            "Parameters": {
+              "Bucket.$": "$.output_bucket",
+              "Key.$": "States.Format('export_results/{}/{}/{}/chunk-{}.json', $.chunk.database, $.extraction_timestamp, $.chunk.table, $.chunk.chunk_index)",
+              "Body.$": "States.JsonToString($.timeout_result)"
+            },
+            "ResultPath": null,
             "Next": "Chunk Succeeded"
           },
           "Chunk Succeeded": {
-            "Type": "Succeed"
+            "Type": "Succeed",
+            "OutputPath": null
           }
         }
       },
       "Next": "Transform Output",
-      "ResultPath": "$.LambdaResult"
+      "ResultPath": null
     },
     "Transform Output": {
       "Type": "Task",
@@ -149,7 +272,10 @@
       "Parameters": {
         "FunctionName": "${TransformOutputLambdaArn}",
         "Payload": {
-          "chunks.$": "$.LambdaResult"
+          "tables.$": "$.LambdaResult.Payload.tables",
+          "output_bucket.$": "$.output_bucket",
+          "db_name.$": "$.db_name",
+          "extraction_timestamp.$": "$.extraction_timestamp"
         }
       },
       "Retry": [
@@ -184,8 +310,31 @@
         "ProcessorConfig": {
           "Mode": "INLINE"
         },
-        "StartAt": "Invoke RowCount Updater",
+        "StartAt": "Finalise Table",
         "States": {
+          "Finalise Table": {
+            "Type": "Task",
+            "Resource": "arn:aws:states:::lambda:invoke",
+            "Parameters": {
+              "FunctionName": "${DatabaseExportFinaliserLambdaArn}",
+              "Payload": {
+                "chunk.$": "$.chunk"
+              }
+            },
+            "Retry": [
+              {
+                "ErrorEquals": [
+                  "States.ALL"
+                ],
+                "IntervalSeconds": 5,
+                "MaxAttempts": 3,
+                "BackoffRate": 1,
+                "JitterStrategy": "NONE"
+              }
+            ],
+            "ResultPath": null,
+            "Next": "Invoke RowCount Updater"
+          },
           "Invoke RowCount Updater": {
             "Type": "Task",
             "Resource": "arn:aws:states:::lambda:invoke",
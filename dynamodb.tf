@@ -0,0 +1,32 @@
+# Per-table chunk completion of each export run, used to validate a table as
+# soon as its last chunk is exported
+#trivy:ignore:AVD-AWS-0024 Point-in-time recovery not required for short-lived run state.
+resource "aws_dynamodb_table" "export_progress" {
+  #checkov:skip=CKV_AWS_28:Point-in-time recovery not required for short-lived run state
+  name         = "${var.name}-${var.environment}-export-progress"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "run"
+  range_key    = "table"
+
+  attribute {
+    name = "run"
+    type = "S"
+  }
+
+  attribute {
+    name = "table"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = var.kms_key_arn
+  }
+
+  tags = var.tags
+}
@@ -51,10 +51,12 @@ resource "aws_iam_role_policy" "state_machine" {
             module.database_restore_status.lambda_function_arn,
             module.database_export_scanner.lambda_function_arn,
             module.database_export_processor.lambda_function_arn,
+            module.database_export_finaliser.lambda_function_arn,
             module.export_validation_rowcount_updater.lambda_function_arn,
             module.transform_output.lambda_function_arn
           ],
-          var.get_views ? [module.database_views_scanner[0].lambda_function_arn] : []
+          var.get_views ? [module.database_views_scanner[0].lambda_function_arn] : [],
+          var.prepare_database ? [module.database_export_preparer[0].lambda_function_arn] : []
         )
       },
       {
@@ -77,6 +79,15 @@ resource "aws_iam_role_policy" "state_machine" {
         Resource = [
           "arn:aws:events:${data.aws_region.current.region}:${data.aws_caller_identity.current.account_id}:event-bus/default"
         ]
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "s3:PutObject"
+        ],
+        Resource = [
+          "${module.s3-bucket-parquet-exports.bucket.arn}/export_results/*"
+        ]
       }
     ]
   })
@@ -1,3 +1,22 @@
+locals {
+  # CloudWatch namespace for the EMF metrics logged by the Lambdas
+  metrics_namespace = "DatabaseExport/${var.name}-${var.environment}"
+
+  # Also used by the scanner to estimate the cost of a plan-only run
+  export_processor_memory_size = 4096
+
+  # Also used by the export chunk duration alarm
+  export_processor_timeout = 900
+
+  # Settings of the Lambdas' AWS clients. The rate limits are for the whole
+  # export: Lambdas that run alone get all of it, and those run by the
+  # export Map, up to max_concurrency at once, their share
+  api_clients     = jsonencode(var.api_clients)
+  api_clients_map = jsonencode(merge(var.api_clients, {
+    rate_limits = { for service, rate in var.api_clients.rate_limits : service => rate / var.max_concurrency }
+  }))
+}
+
 data "aws_iam_policy_document" "upload_checker_lambda_function" {
   statement {
     // Allow the lambda to read the uploaded .bak files from the S3 bucket
@@ -49,10 +68,16 @@ module "upload_checker" {
     MAX_CONCURRENCY       = var.max_concurrency
     ENVIRONMENT           = var.environment
     DB_NAME               = var.db_name
+    METRICS_NAMESPACE     = local.metrics_namespace
+    API_CLIENTS           = local.api_clients
   }
 
   source_path = [{
     path = "${path.module}/lambda_functions/upload_checker/main.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   tags = var.tags
@@ -120,13 +145,24 @@ data "aws_iam_policy_document" "data_restore_lambda_function" {
     actions = [
       "s3:GetObject",
       "s3:PutObject",
-      "s3:DeleteObject"
+      "s3:DeleteObject",
+      "s3:AbortMultipartUpload"
     ]
     resources = [
       "${module.s3-bucket-parquet-exports.bucket.arn}/*"
     ]
   }
 
+  statement {
+    actions = [
+      "dynamodb:BatchWriteItem",
+      "dynamodb:UpdateItem"
+    ]
+    resources = [
+      aws_dynamodb_table.export_progress.arn
+    ]
+  }
+
   statement {
     actions = [
       "glue:*"
@@ -185,6 +221,8 @@ module "database_restore" {
     UPLOADS_BUCKET         = module.s3-bucket-backup-uploads.bucket.id
     DATABASE_PW_SECRET_ARN = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
     ENVIRONMENT            = var.environment
+    METRICS_NAMESPACE      = local.metrics_namespace
+    API_CLIENTS            = local.api_clients
   }
 
   source_path = [{
@@ -193,6 +231,10 @@ module "database_restore" {
       "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
       ":zip",
     ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   tags = var.tags
@@ -223,6 +265,8 @@ module "database_restore_status" {
   environment_variables = {
     DATABASE_PW_SECRET_ARN = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
     ENVIRONMENT            = var.environment
+    METRICS_NAMESPACE      = local.metrics_namespace
+    API_CLIENTS            = local.api_clients
   }
 
   source_path = [{
@@ -231,6 +275,10 @@ module "database_restore_status" {
       "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
       ":zip",
     ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   tags = var.tags
@@ -259,10 +307,28 @@ module "database_export_scanner" {
   policy_json        = data.aws_iam_policy_document.data_restore_lambda_function.json
 
   environment_variables = {
-    DATABASE_PW_SECRET_ARN   = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
-    DATABASE_REFRESH_MODE    = var.database_refresh_mode
-    OUTPUT_PARQUET_FILE_SIZE = var.output_parquet_file_size
-    ENVIRONMENT              = var.environment
+    DATABASE_PW_SECRET_ARN             = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
+    DATABASE_REFRESH_MODE              = var.database_refresh_mode
+    OUTPUT_PARQUET_FILE_SIZE           = var.output_parquet_file_size
+    OUTPUT_TABLE_FORMAT                = var.output_table_format
+    ICEBERG_SNAPSHOT_RETENTION_SECONDS = var.iceberg_snapshot_retention_seconds
+    SKIP_UNCHANGED_CHUNKS              = var.skip_unchanged_chunks
+    VIEWS_TO_EXPORT                    = jsonencode(var.views_to_export)
+    EXPORT_PROGRESS_TABLE              = aws_dynamodb_table.export_progress.name
+    MAX_CONCURRENCY                    = var.max_concurrency
+    CHUNK_KEYS                         = jsonencode(var.chunk_keys)
+    TABLE_ENCODING_PROFILES            = jsonencode(var.table_encoding_profiles)
+    ENCODING_PROFILE_SIZE_CLASSES      = jsonencode(var.encoding_profile_size_classes)
+    ENCODING_PROFILES                  = jsonencode(var.encoding_profiles)
+    OUTPUT_PARTITIONING                = jsonencode(var.table_partitioning)
+    TABLE_FILTERS                      = jsonencode(var.table_filters)
+    LOB_OFFLOAD                        = jsonencode(var.lob_offload)
+    SERVER_SIDE_PROJECTION             = var.server_side_projection
+    MAX_OUTPUT_PARTITIONS              = var.max_output_partitions
+    EXPORT_MEMORY_MB                   = local.export_processor_memory_size
+    ENVIRONMENT                        = var.environment
+    METRICS_NAMESPACE                  = local.metrics_namespace
+    API_CLIENTS                        = local.api_clients
   }
 
   source_path = [{
@@ -271,6 +337,12 @@ module "database_export_scanner" {
       "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
       ":zip",
     ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/progress.py"
   }]
 
   layers = [
@@ -280,6 +352,55 @@ module "database_export_scanner" {
   tags = var.tags
 }
 
+#trivy:ignore:AVD-AWS-0066 X-Ray tracing not currently required. Logs sent to CloudWatch.
+module "database_export_preparer" {
+  count = var.prepare_database ? 1 : 0
+
+  # Commit hash for v8.1.2
+  source = "git::https://github.com/terraform-aws-modules/terraform-aws-lambda?ref=a7db1252f2c2048ab9a61254869eea061eae1318"
+
+  function_name   = "${var.name}-${var.environment}-database-export-preparer"
+  description     = "Lambda to index and update statistics on the restored database before the export"
+  handler         = "main.handler"
+  runtime         = "python3.12"
+  memory_size     = 512
+  timeout         = 900
+  architectures   = ["x86_64"]
+  build_in_docker = false
+
+  # VPC Config - Lambda function needs to be in the same VPC as the RDS instance
+  vpc_subnet_ids         = var.database_subnet_ids
+  vpc_security_group_ids = [aws_security_group.database_restore.id]
+  attach_network_policy  = true
+
+  attach_policy_json = true
+  policy_json        = data.aws_iam_policy_document.data_restore_lambda_function.json
+
+  environment_variables = {
+    DATABASE_PW_SECRET_ARN      = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
+    PREPARE_TIME_BUDGET_SECONDS = var.prepare_time_budget_seconds
+    PREPARE_MIN_INDEX_ROWS      = var.prepare_min_index_rows
+    PREPARE_WORKERS             = var.max_concurrency
+    CHUNK_KEYS                  = jsonencode(var.chunk_keys)
+    METRICS_NAMESPACE           = local.metrics_namespace
+    API_CLIENTS                 = local.api_clients
+  }
+
+  source_path = [{
+    path = "${path.module}/lambda_functions/database_export_preparer/"
+    commands = [
+      "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
+      ":zip",
+    ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
+  }]
+
+  tags = var.tags
+}
+
 #trivy:ignore:AVD-AWS-0066 X-Ray tracing not currently required. Logs sent to CloudWatch.
 module "database_export_processor" {
   # Commit hash for v8.1.2
@@ -288,8 +409,8 @@ module "database_export_processor" {
   description     = "Lambda to export data for ${var.name} ${var.environment}"
   handler         = "main.handler"
   runtime         = "python3.12"
-  memory_size     = 4096
-  timeout         = 900
+  memory_size     = local.export_processor_memory_size
+  timeout         = local.export_processor_timeout
   architectures   = ["x86_64"]
   build_in_docker = false
 
@@ -305,15 +426,82 @@ module "database_export_processor" {
     DATABASE_PW_SECRET_ARN = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
     OUTPUT_BUCKET          = module.s3-bucket-parquet-exports.bucket.id
     DATABASE_REFRESH_MODE  = var.database_refresh_mode
+    OUTPUT_TABLE_FORMAT    = var.output_table_format
     ENVIRONMENT            = var.environment
+    METRICS_NAMESPACE      = local.metrics_namespace
+    API_CLIENTS            = local.api_clients_map
+    PROFILE_SAMPLE_RATE    = var.export_profile_sample_rate
+    EXPORT_ENGINE          = var.export_engine
+    EXPORT_PROGRESS_TABLE  = aws_dynamodb_table.export_progress.name
+    EXTRACTION_PROFILE     = jsonencode(var.extraction_profile)
+    ENCODING_PROFILES      = jsonencode(var.encoding_profiles)
+    EXPORT_PIPELINE        = jsonencode(var.export_pipeline)
+    LOB_OFFLOAD            = jsonencode(var.lob_offload)
+    EXPORT_DRIVER          = jsonencode(var.export_driver)
   }
 
   source_path = [{
     path = "${path.module}/lambda_functions/database_export/"
+    commands = [
+      "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r ${var.export_engine == "arrow" ? "requirements-arrow.txt" : "requirements.txt"}",
+      ":zip",
+    ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/progress.py"
+  }]
+
+  # The arrow engine packages pyarrow itself and does not need the pandas layer
+  layers = concat(var.export_engine == "arrow" ? [] : [
+    "arn:aws:lambda:${data.aws_region.current.region}:336392948345:layer:AWSSDKPandas-Python312:18"
+  ], var.export_processor_layers)
+
+  tags = var.tags
+}
+
+#trivy:ignore:AVD-AWS-0066 X-Ray tracing not currently required. Logs sent to CloudWatch.
+module "database_export_finaliser" {
+  # Commit hash for v8.1.2
+  source = "git::https://github.com/terraform-aws-modules/terraform-aws-lambda?ref=a7db1252f2c2048ab9a61254869eea061eae1318"
+
+  function_name   = "${var.name}-${var.environment}-database-export-finaliser"
+  description     = "Lambda to publish the exported data files of a table"
+  handler         = "main.handler"
+  runtime         = "python3.12"
+  memory_size     = 2048
+  timeout         = 900
+  architectures   = ["x86_64"]
+  build_in_docker = false
+
+  # VPC Config - Lambda function needs to be in the same VPC as the RDS instance
+  vpc_subnet_ids         = var.database_subnet_ids
+  vpc_security_group_ids = [aws_security_group.database_restore.id]
+  attach_network_policy  = true
+
+  attach_policy_json = true
+  policy_json        = data.aws_iam_policy_document.data_restore_lambda_function.json
+
+  environment_variables = {
+    DATABASE_REFRESH_MODE = var.database_refresh_mode
+    OUTPUT_TABLE_FORMAT   = var.output_table_format
+    OUTPUT_BUCKET         = module.s3-bucket-parquet-exports.bucket.id
+    METRICS_NAMESPACE     = local.metrics_namespace
+    API_CLIENTS           = local.api_clients_map
+  }
+
+  source_path = [{
+    path = "${path.module}/lambda_functions/database_export_finaliser/"
     commands = [
       "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
       ":zip",
     ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   layers = [
@@ -350,10 +538,16 @@ module "export_validation_rowcount_updater" {
     DATABASE_REFRESH_MODE    = var.database_refresh_mode
     OUTPUT_PARQUET_FILE_SIZE = var.output_parquet_file_size
     OUTPUT_BUCKET            = module.s3-bucket-parquet-exports.bucket.id
+    METRICS_NAMESPACE        = local.metrics_namespace
+    API_CLIENTS              = local.api_clients_map
   }
 
   source_path = [{
     path = "${path.module}/lambda_functions/export_validation_rowcount_updater/main.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   layers = [
@@ -382,14 +576,30 @@ module "transform_output" {
   vpc_security_group_ids = [aws_security_group.database_restore.id]
   attach_network_policy  = true
 
+  attach_policy_json = true
+  policy_json        = data.aws_iam_policy_document.data_restore_lambda_function.json
+
+  environment_variables = {
+    METRICS_NAMESPACE                = local.metrics_namespace
+    API_CLIENTS                      = local.api_clients
+    EXPORT_PROGRESS_TABLE            = aws_dynamodb_table.export_progress.name
+    RECORD_RUN_HISTORY               = var.record_run_history
+    RUN_HISTORY_TRAILING_RUNS        = var.run_history_trailing_runs
+    RUN_HISTORY_REGRESSION_THRESHOLD = var.run_history_regression_threshold
+  }
+
   source_path = [{
     path = "${path.module}/lambda_functions/transform_output/main.py"
+  }, {
+    path = "${path.module}/lambda_functions/transform_output/run_history.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/progress.py"
   }]
 
-  layers = [
-    "arn:aws:lambda:${data.aws_region.current.region}:336392948345:layer:AWSSDKPandas-Python312:18"
-  ]
-
   tags = var.tags
 }
 
@@ -419,6 +629,8 @@ module "database_views_scanner" {
 
   environment_variables = {
     DATABASE_PW_SECRET_ARN = data.aws_secretsmanager_secret_version.master_user_secret.secret_arn
+    METRICS_NAMESPACE      = local.metrics_namespace
+    API_CLIENTS            = local.api_clients
   }
 
   source_path = [{
@@ -427,6 +639,10 @@ module "database_views_scanner" {
       "pip3.12 install --platform=manylinux2014_x86_64 --only-binary=:all: --no-compile --target=. -r requirements.txt",
       ":zip",
     ]
+  }, {
+    path = "${path.module}/lambda_functions/shared/telemetry.py"
+  }, {
+    path = "${path.module}/lambda_functions/shared/aws_clients.py"
   }]
 
   layers = [
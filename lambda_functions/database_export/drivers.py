@@ -0,0 +1,170 @@
+"""
+SQL Server drivers for the extraction path.
+
+Every driver returns a DB-API style connection, whose cursors run the
+rowversion lookup and session settings and, in the pipelined export, fetch
+the chunk in batches. The driver is chosen by the EXPORT_DRIVER JSON:
+
+    pymssql     FreeTDS through pymssql, the default
+    pytds       the pure-Python python-tds, as used by the restore Lambdas
+    arrow_odbc  Microsoft's ODBC driver through arrow-odbc, which reads
+                result sets straight into Arrow record batches
+
+A connection with a read_table(query, batch_rows) method returns the chunk
+as an Arrow table without building a Python tuple per row first; the
+others are read with cursor.fetchall()/fetchmany(). Drivers are imported
+on first use, so only the one in use adds to the cold start. arrow_odbc
+needs arrow-odbc and the ODBC driver in a Lambda layer.
+"""
+
+import json
+import os
+import re
+
+DRIVERS = ("pymssql", "pytds", "arrow_odbc")
+
+# Settings when EXPORT_DRIVER does not set them
+DEFAULT_DRIVER = {
+    "name": "pymssql",
+    # Name of the ODBC driver arrow_odbc connects with
+    "odbc_driver": "ODBC Driver 18 for SQL Server",
+    # arrow_odbc buffers (max) columns at this size per value; longer values
+    # are an error rather than truncated
+    "max_text_kb": 1024,
+}
+
+
+def load_settings() -> dict:
+    """Reads the EXPORT_DRIVER JSON; settings left out keep their default."""
+    settings = json.loads(os.environ.get("EXPORT_DRIVER", "{}") or "{}")
+    settings = {**DEFAULT_DRIVER, **settings}
+    if settings["name"] not in DRIVERS:
+        raise Exception(f"Unknown export driver: {settings['name']}")
+    return settings
+
+
+def connect(settings: dict, server: str, user: str, password: str, database: str):
+    if settings["name"] == "pytds":
+        import pytds
+
+        return pytds.connect(
+            server=server, database=database, user=user, password=password
+        )
+    if settings["name"] == "arrow_odbc":
+        return ArrowOdbcConnection(
+            f"Driver={{{settings['odbc_driver']}}};Server={server};"
+            f"Database={database};TrustServerCertificate=yes",
+            user,
+            password,
+            int(settings["max_text_kb"] * 1024),
+        )
+    import pymssql
+
+    return pymssql.connect(
+        server=server,
+        user=user,
+        password=password,
+        database=database,
+        tds_version="7.4",
+    )
+
+
+class ArrowOdbcConnection:
+    """
+    The DB-API subset the exporter uses, over arrow-odbc. arrow-odbc opens
+    a connection per query, so session settings (SET statements) are kept
+    and sent ahead of every later query instead.
+    """
+
+    def __init__(
+        self, connection_string: str, user: str, password: str, max_text_size: int
+    ):
+        self.connection_string = connection_string
+        self.user = user
+        self.password = password
+        self.max_text_size = max_text_size
+        self.session: list[str] = []
+
+    def cursor(self):
+        return ArrowOdbcCursor(self)
+
+    def close(self):
+        pass
+
+    def read_batches(self, query: str, params: tuple = (), batch_rows: int = 0):
+        """The query's record batch reader, or None without a result set."""
+        from arrow_odbc import read_arrow_batches_from_odbc
+
+        # pymssql style %s parameters are ODBC ? parameters, passed as text
+        query = re.sub(r"%s", "?", query)
+        return read_arrow_batches_from_odbc(
+            query="".join(f"{s}; " for s in ["SET NOCOUNT ON", *self.session]) + query,
+            connection_string=self.connection_string,
+            user=self.user,
+            password=self.password,
+            parameters=[None if p is None else str(p) for p in params] or None,
+            batch_size=batch_rows or 50_000,
+            max_text_size=self.max_text_size,
+            max_binary_size=self.max_text_size,
+        )
+
+    def read_table(self, query: str, batch_rows: int = 0):
+        import pyarrow as pa
+
+        reader = self.read_batches(query, batch_rows=batch_rows)
+        return pa.Table.from_batches(list(reader), reader.schema)
+
+
+class ArrowOdbcCursor:
+    """A cursor of ArrowOdbcConnection, with rows as tuples."""
+
+    def __init__(self, conn: ArrowOdbcConnection):
+        self.conn = conn
+        self.description: list[tuple] | None = None
+        self.reader = None
+        self.rows: list[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query: str, params: tuple = ()):
+        if query.lstrip().upper().startswith("SET "):
+            self.conn.session.append(query.strip())
+            return
+        reader = self.conn.read_batches(query, params)
+        self.rows = []
+        self.reader = iter(reader) if reader else None
+        self.description = (
+            [(name, None, None, None, None, None, None) for name in reader.schema.names]
+            if reader
+            else None
+        )
+
+    def fetchmany(self, size: int = 1) -> list:
+        while self.reader and len(self.rows) < size:
+            try:
+                batch = next(self.reader)
+            except StopIteration:
+                self.reader = None
+                break
+            columns = [column.to_pylist() for column in batch.columns]
+            self.rows.extend(zip(*columns))
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self) -> list:
+        rows = []
+        while batch := self.fetchmany(50_000):
+            rows.extend(batch)
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        self.reader = None
+        self.rows = []
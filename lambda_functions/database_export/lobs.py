@@ -0,0 +1,173 @@
+"""
+Out-of-line export of large LOB values.
+
+A varchar(max), nvarchar(max), varbinary(max) or legacy LOB value of
+threshold_kb or more is written to an S3 object of its own, and the Parquet
+file holds its s3:// reference in place of the value. Two columns are
+added beside each LOB column the scanner tagged the chunk with:
+
+    <column>_lob_length  the value's length in bytes, UTF-8 for text
+    <column>_lob_sha256  the hex SHA-256 of those bytes
+
+both null for values kept inline. Objects are keyed by their hash under
+_lobs/<database>/, so a value repeated across rows, chunks or runs is
+stored once, and are uploaded by a thread pool while the chunk encodes. At
+most twice upload_concurrency values are held waiting for their upload.
+They live outside the table prefixes, so a full refresh does not delete
+them.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections.abc import Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import telemetry
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# Settings when LOB_OFFLOAD does not set them
+DEFAULT_LOB_OFFLOAD = {
+    "enabled": False,
+    "threshold_kb": 256,
+    "upload_concurrency": 8,
+}
+
+LOB_PREFIX = "_lobs"
+
+# Added beside each LOB column; the scanner adds the same to the catalog
+LOB_SIBLING_SUFFIXES = ("_lob_length", "_lob_sha256")
+
+
+def load_settings() -> dict:
+    """Reads the LOB_OFFLOAD JSON; settings left out keep their default."""
+    settings = json.loads(os.environ.get("LOB_OFFLOAD", "{}") or "{}")
+    return {**DEFAULT_LOB_OFFLOAD, **settings}
+
+
+def lob_key(db_name: str, digest: str) -> str:
+    return f"{LOB_PREFIX}/{db_name}/{digest[:2]}/{digest}"
+
+
+def to_bytes(value) -> bytes:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return str(value).encode("utf-8")
+
+
+class LobOffloader:
+    """
+    Replaces the large LOB values of a chunk's rows with S3 references,
+    uploading the values in the background. wait() returns once every
+    upload finished, and must be called before the chunk is reported done.
+    Binary values kept inline are decoded with `decode`, as the column
+    would otherwise be, since a column of references is no longer binary.
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        db_name: str,
+        threshold: int,
+        concurrency: int,
+        decode=None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.db_name = db_name
+        self.threshold = threshold
+        self.decode = decode or (lambda value: value)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        # Bounds the values held for upload, as MultipartUpload does its parts
+        self.slots = threading.Semaphore(concurrency * 2)
+        self.uploads: list[Future] = []
+        self.seen: set[str] = set()
+        self.lock = threading.Lock()
+        # Values replaced by references, whether or not their object was
+        # already stored, and the objects and bytes this chunk uploaded
+        self.count = 0
+        self.uploaded = 0
+        self.bytes = 0
+
+    def offload(
+        self, rows: list, columns: list, lob_columns: Sequence[str]
+    ) -> tuple[list, list]:
+        """
+        Returns the rows and columns with the large values of lob_columns
+        replaced by references, and their length and hash columns appended.
+        """
+        positions = [columns.index(col) for col in lob_columns if col in columns]
+        if not positions:
+            return rows, columns
+        columns = columns + [
+            columns[i] + suffix for i in positions for suffix in LOB_SIBLING_SUFFIXES
+        ]
+        offloaded = []
+        for row in rows:
+            row = list(row)
+            extra: list[str | None] = []
+            for i in positions:
+                value = row[i]
+                body = None if value is None else to_bytes(value)
+                if body is None or len(body) < self.threshold:
+                    row[i] = self.decode(value)
+                    extra += [None, None]
+                    continue
+                digest = hashlib.sha256(body).hexdigest()
+                row[i] = f"s3://{self.bucket}/{lob_key(self.db_name, digest)}"
+                extra += [str(len(body)), digest]
+                self._submit(digest, body)
+                with self.lock:
+                    self.count += 1
+            offloaded.append(tuple(row + extra))
+        return offloaded, columns
+
+    def _submit(self, digest: str, body: bytes):
+        with self.lock:
+            if digest in self.seen:
+                return
+            self.seen.add(digest)
+        self.slots.acquire()
+        self.uploads.append(self.pool.submit(self._upload, digest, body))
+
+    def _upload(self, digest: str, body: bytes):
+        key = lob_key(self.db_name, digest)
+        try:
+            with telemetry.phase("LobUpload"):
+                # Already stored by an earlier chunk or run
+                try:
+                    self.s3.head_object(Bucket=self.bucket, Key=key)
+                    return
+                except ClientError as e:
+                    if e.response["Error"]["Code"] not in (
+                        "404",
+                        "NoSuchKey",
+                        "NotFound",
+                    ):
+                        raise
+                self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        finally:
+            self.slots.release()
+        with self.lock:
+            self.uploaded += 1
+            self.bytes += len(body)
+
+    def wait(self) -> tuple[int, int, int]:
+        """
+        Waits for the uploads, returning the values offloaded and the
+        objects and bytes uploaded.
+        """
+        try:
+            for future in self.uploads:
+                future.result()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+        telemetry.count("LobsOffloaded", self.count)
+        telemetry.count("LobsUploaded", self.uploaded)
+        telemetry.count("LobBytes", self.bytes, "Bytes")
+        return self.count, self.uploaded, self.bytes
@@ -1,18 +1,65 @@
 import os
-import boto3
+import json
+import time
 import logging
-import pymssql
-import pandas as pd
-import awswrangler as wr
+import aws_clients
+import telemetry
+import progress
+import profiling
+import pipeline
+import lobs
+import drivers
+import pyarrow as pa
+import pyarrow.parquet as pq
+from collections.abc import Sequence
+from typing import Any
+from urllib.parse import urlparse
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # AWS clients
-secretmanager = boto3.client("secretsmanager")
+secretmanager = aws_clients.client("secretsmanager")
+s3 = aws_clients.client("s3")
+
+# Extraction settings when EXTRACTION_PROFILE does not set them: the
+# driver and server defaults
+DEFAULT_EXTRACTION_PROFILE: dict[str, Any] = {
+    "isolation_level": None,
+    "maxdop": 0,
+    "query_hints": [],
+    "keep_order": True,
+    "packet_size": 0,
+    "fetch_size": 0,
+}
+
+# Parquet encoding profiles a table can be written with, by name. More
+# profiles can be defined, or these overridden, in ENCODING_PROFILES
+ENCODING_PROFILES = {
+    # Snappy with the pyarrow defaults, as before profiles existed
+    "default": {"compression": "snappy"},
+    # Smallest files, for large tables that are mostly scanned in full
+    "compact": {
+        "compression": "zstd",
+        "compression_level": 9,
+        "row_group_size": 1_048_576,
+    },
+    # Large tables filtered by primary key: small row groups, page indexes
+    # and key bloom filters let Athena skip most of each file
+    "point_lookup": {
+        "compression": "zstd",
+        "compression_level": 3,
+        "row_group_size": 131_072,
+        "write_page_index": True,
+        "bloom_filter_keys": True,
+        "bloom_filter_fpp": 0.01,
+    },
+}
 
 # Exports the data to parquet files in S3
+# pandas is imported on first use: the "arrow" engine never loads it, so the
+# exporter can be deployed with only pyarrow and boto3
 
 
 def safe_decode(val):
@@ -52,7 +99,7 @@ def get_secret_value(secret_arn: str) -> str:
         raise
 
 
-def decode_columns(df: pd.DataFrame, rowversion_cols: set) -> pd.DataFrame:
+def decode_columns(df, rowversion_cols: set):
     """Decode binary columns to string."""
     for col in df.columns:
         non_nulls = df[col].dropna()
@@ -68,76 +115,497 @@ def decode_columns(df: pd.DataFrame, rowversion_cols: set) -> pd.DataFrame:
     return df
 
 
+def load_extraction_profile() -> dict:
+    """
+    Reads the EXTRACTION_PROFILE JSON. Settings left out keep the driver and
+    server defaults:
+
+        isolation_level  session isolation level, e.g. "READ UNCOMMITTED"
+        maxdop           MAXDOP query hint for the chunk queries
+        query_hints      further OPTION (...) hints, e.g. ["FAST 10000"]
+        keep_order       false drops the final ORDER BY rn of chunk queries
+        packet_size      TDS packet size in bytes
+        fetch_size       rows fetched per round trip; 0 fetches all at once
+    """
+    profile = json.loads(os.environ.get("EXTRACTION_PROFILE", "{}") or "{}")
+    return {**DEFAULT_EXTRACTION_PROFILE, **profile}
+
+
+def configure_packet_size(packet_size: int):
+    """
+    pymssql has no packet size argument, so the size is set through a
+    FreeTDS config file that is read on every connect.
+    """
+    if not packet_size:
+        return
+    path = "/tmp/freetds.conf"
+    with open(path, "w") as f:
+        f.write(f"[global]\n\tinitial block size = {int(packet_size)}\n")
+    os.environ["FREETDSCONF"] = path
+
+
+def apply_session_profile(conn, profile: dict):
+    if profile["isolation_level"]:
+        cursor = conn.cursor()
+        cursor.execute(f"SET TRANSACTION ISOLATION LEVEL {profile['isolation_level']}")
+        cursor.close()
+
+
+def profile_query(query: str, profile: dict) -> str:
+    """Applies the profile's ordering and query hints to a chunk query."""
+    if not profile["keep_order"] and query.endswith(" ORDER BY rn"):
+        query = query[: -len(" ORDER BY rn")]
+    hints = list(profile["query_hints"])
+    if profile["maxdop"]:
+        hints.insert(0, f"MAXDOP {int(profile['maxdop'])}")
+    if hints:
+        query = f"{query} OPTION ({', '.join(hints)})"
+    return query
+
+
+def read_chunk(conn, query: str, fetch_size: int = 0) -> tuple[list, list[str]]:
+    """Runs the chunk query, timing the first result and the full fetch separately."""
+    cursor = conn.cursor()
+    with telemetry.phase("QueryFirstByte"):
+        cursor.execute(query)
+    with telemetry.phase("Fetch"):
+        if fetch_size:
+            rows = []
+            while batch := cursor.fetchmany(fetch_size):
+                rows.extend(batch)
+        else:
+            rows = cursor.fetchall()
+    columns = [col[0] for col in cursor.description]
+    cursor.close()
+    return rows, columns
+
+
+def read_chunk_table(conn, query: str, fetch_size: int = 0):
+    """Runs the chunk query on a columnar driver, returning its Arrow table."""
+    with telemetry.phase("Fetch"):
+        return conn.read_table(query, fetch_size)
+
+
+def to_string_column(values: list, is_rowversion: bool) -> list:
+    """Formats one column with str(), decoding binary values; NULLs stay null."""
+    if is_rowversion:
+        return [v.hex() for v in values]
+    first = next((v for v in values if v is not None), None)
+    if isinstance(first, (bytes, bytearray)):
+        values = [safe_decode(v) for v in values]
+    return [None if v is None else str(v) for v in values]
+
+
+def build_table_arrow(rows: list, columns: list[str], rowversion_cols: set):
+    """Builds the all-string Arrow table of the chunk without pandas."""
+    return pa.table(
+        {
+            col: pa.array(
+                to_string_column([row[i] for row in rows], col in rowversion_cols),
+                pa.string(),
+            )
+            for i, col in enumerate(columns)
+            if col != "rn"
+        }
+    )
+
+
+def to_string_array(column, is_rowversion: bool):
+    """
+    Formats one column of a columnar driver's result as to_string_column
+    would: cast by Arrow for the types it formats the same as str(), else
+    through Python values.
+    """
+    if (
+        pa.types.is_string(column.type)
+        or pa.types.is_large_string(column.type)
+        or pa.types.is_integer(column.type)
+        or pa.types.is_decimal(column.type)
+        or pa.types.is_date(column.type)
+    ):
+        return column.cast(pa.string())
+    return pa.array(to_string_column(column.to_pylist(), is_rowversion), pa.string())
+
+
+def build_table_columnar(table, rowversion_cols: set):
+    """Builds the all-string Arrow table of a chunk read by a columnar driver."""
+    return pa.table(
+        {
+            col: to_string_array(column, col in rowversion_cols)
+            for col, column in zip(table.column_names, table.columns)
+            if col != "rn"
+        }
+    )
+
+
+def build_table_pandas(rows: list, columns: list[str], rowversion_cols: set):
+    """Builds the all-string Arrow table of the chunk the way read_sql_query would."""
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    df = decode_columns(df, rowversion_cols).astype(str)
+    df = df.drop(columns=["rn"], errors="ignore")
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def load_encoding_profile(name: str) -> dict:
+    """Returns the named profile, with any ENCODING_PROFILES override applied."""
+    custom = json.loads(os.environ.get("ENCODING_PROFILES", "{}") or "{}")
+    profiles = {**ENCODING_PROFILES, **custom}
+    if name not in profiles:
+        raise Exception(f"Unknown encoding profile: {name}")
+    # Settings left unset in Terraform arrive as nulls
+    return {key: value for key, value in profiles[name].items() if value is not None}
+
+
+def parquet_options(table, profile: dict, key_columns: list, rows: int = 0) -> dict:
+    """
+    Translates an encoding profile into pq.write_table() arguments. Bloom
+    filters are sized for `rows` rows, by default the rows of the table.
+    """
+    options = {"compression": profile.get("compression", "snappy")}
+    for option in (
+        "compression_level",
+        "row_group_size",
+        "use_dictionary",
+        "dictionary_pagesize_limit",
+        "write_page_index",
+    ):
+        if option in profile:
+            options[option] = profile[option]
+    keys = [col for col in key_columns if col in table.column_names]
+    rows = rows or table.num_rows
+    if profile.get("bloom_filter_keys") and keys and rows:
+        options["bloom_filter_options"] = {
+            col: {"ndv": rows, "fpp": profile.get("bloom_filter_fpp", 0.05)}
+            for col in keys
+        }
+    return options
+
+
+def write_parquet(table, output_path: str, options: dict | None = None) -> int:
+    """Encodes the table as a Parquet file and uploads it, returning its size."""
+    options = options or {"compression": "snappy"}
+    with telemetry.phase("Encode"):
+        buffer = pa.BufferOutputStream()
+        try:
+            pq.write_table(table, buffer, **options)
+        except TypeError:
+            # Bloom filters need a newer pyarrow than some deployments have
+            if "bloom_filter_options" not in options:
+                raise
+            logger.warning("pyarrow cannot write bloom filters, writing without")
+            options = {k: v for k, v in options.items() if k != "bloom_filter_options"}
+            buffer = pa.BufferOutputStream()
+            pq.write_table(table, buffer, **options)
+        body = buffer.getvalue().to_pybytes()
+
+    url = urlparse(output_path)
+    with telemetry.phase("Upload"):
+        s3.put_object(Bucket=url.netloc, Key=url.path.lstrip("/"), Body=body)
+    return len(body)
+
+
+def export_chunk_pipelined(
+    conn,
+    query: str,
+    output_path: str,
+    rowversion_cols: set,
+    extraction_timestamp: str | None,
+    encoding_profile: dict,
+    key_columns: list,
+    settings: dict,
+    lob_offloader: lobs.LobOffloader | None = None,
+    lob_columns: Sequence[str] = (),
+) -> tuple[int, int, int]:
+    """
+    Exports the chunk with the fetch, encode and upload stages overlapped
+    (see pipeline.py), returning its rows, Arrow bytes and Parquet bytes.
+    extraction_timestamp, if set, is added as a column. Large values of
+    lob_columns are handed to lob_offloader batch by batch.
+    """
+
+    def build_batch(rows, columns):
+        if lob_offloader:
+            rows, columns = lob_offloader.offload(rows, columns, lob_columns)
+        table = build_table_arrow(rows, columns, rowversion_cols)
+        if extraction_timestamp:
+            table = table.append_column(
+                "extraction_timestamp",
+                pa.array([extraction_timestamp] * table.num_rows, pa.string()),
+            )
+        return table
+
+    # Bloom filters are written per row group
+    row_group_rows = encoding_profile.get("row_group_size", settings["batch_rows"])
+    url = urlparse(output_path)
+    upload = pipeline.MultipartUpload(
+        s3,
+        url.netloc,
+        url.path.lstrip("/"),
+        settings["part_size_mb"] * 1024 * 1024,
+        settings["upload_concurrency"],
+    )
+    cursor = conn.cursor()
+    rows, bytes_read = pipeline.export_chunk(
+        cursor,
+        query,
+        build_batch,
+        upload,
+        lambda table: parquet_options(
+            table, encoding_profile, key_columns, row_group_rows
+        ),
+        settings,
+    )
+    cursor.close()
+    return rows, bytes_read, upload.size
+
+
+def write_chunk_result(bucket: str, result: dict):
+    """
+    Stores the chunk's result in S3 rather than in the state machine payload,
+    where transform_output aggregates the results of all chunks.
+    """
+    key = (
+        f"export_results/{result['database']}/{result['extraction_timestamp']}/"
+        f"{result['table']}/chunk-{result['chunk_index']}.json"
+    )
+    s3.put_object(Bucket=bucket, Key=key, Body=json.dumps(result).encode())
+
+
+@telemetry.instrument("database-export")
+@profiling.profiled
 def handler(event, context):
     # === Environment & Event Variables ===
     db_endpoint = event["db_endpoint"]
     db_username = event["db_username"]
     db_pw_secret_arn = os.environ["DATABASE_PW_SECRET_ARN"]
-    output_bucket = event["output_bucket"]
     database_refresh_mode = os.environ["DATABASE_REFRESH_MODE"]
+    output_table_format = os.environ.get("OUTPUT_TABLE_FORMAT", "parquet")
+    export_engine = os.environ.get("EXPORT_ENGINE", "pandas")
+    output_bucket = os.environ["OUTPUT_BUCKET"]
+    extraction_profile = load_extraction_profile()
+    started = time.perf_counter()
+    started_at = time.time()
     extraction_timestamp = event["extraction_timestamp"]
 
     chunk = event["chunk"]
     db_name = chunk["database"]
     db_table = chunk["table"]
-    db_query = chunk["query"]
+    db_query = profile_query(chunk["query"], extraction_profile)
+    output_path = chunk["output_path"]
+    telemetry.set_dimensions(Database=db_name, Table=db_table)
+    telemetry.set_property("chunk_index", chunk.get("chunk_index"))
 
     # === Get Password ===
-    db_password = get_secret_value(db_pw_secret_arn)
+    with telemetry.phase("SecretFetch"):
+        db_password = get_secret_value(db_pw_secret_arn)
 
-    # === Connect to SQL Server & Fetch Data ===
-    try:
-        logger.info(f"Connecting to {db_endpoint}, db: {db_name}, table: {db_table}")
-        conn = pymssql.connect(
-            server=db_endpoint,
-            user=db_username,
-            password=db_password,
-            database=db_name,
-            tds_version="7.4",
+    # Only the arrow engine converts a chunk batch by batch: pandas infers
+    # the column types from the whole chunk
+    pipeline_settings = pipeline.load_settings()
+    use_pipeline = pipeline_settings["enabled"] and export_engine == "arrow"
+    if pipeline_settings["enabled"] and not use_pipeline:
+        logger.warning("EXPORT_PIPELINE needs the arrow engine, exporting sequentially")
+    encoding_profile = chunk.get("encoding_profile", "default")
+    # The scanner's chunk query already converted the rowversion, binary and
+    # legacy text columns (see get_projection in the scanner)
+    projected = chunk.get("projected", False)
+    # Large values of the LOB columns tagged by the scanner go to S3 objects
+    # of their own, uploaded while the chunk is encoded
+    lob_settings = lobs.load_settings()
+    lob_columns = chunk.get("lob_columns", [])
+    lob_offloader = None
+    if lob_settings["enabled"] and lob_columns:
+        lob_offloader = lobs.LobOffloader(
+            s3,
+            output_bucket,
+            db_name,
+            int(lob_settings["threshold_kb"] * 1024),
+            lob_settings["upload_concurrency"],
+            decode=safe_decode,
         )
-        df = pd.read_sql_query(db_query, conn)
-        logger.info(f"Fetched {len(df)} rows from {db_name}.{db_table}")
-    except Exception as e:
-        logger.exception(f"Failed to fetch data from SQL Server: {e}")
-        raise
-
-    # === Get rowversion and timestamp data type columns ===
-    row_version_cols = get_rowversion_cols(conn, table=db_table, schema="dbo")
-    logger.info(
-        f"Columns with datatype 'timestamp' or 'rowversion' for {db_table}: {row_version_cols}"
+    # Hive partition values live in the S3 path, not in the data file
+    add_timestamp = (
+        output_table_format == "iceberg" or database_refresh_mode != "incremental"
     )
 
-    # === Decode and Clean Data ===
+    # === Connect to SQL Server ===
+    driver_settings = drivers.load_settings()
     try:
-        df = decode_columns(df, row_version_cols).astype(str)
-        df["extraction_timestamp"] = extraction_timestamp
+        logger.info(
+            f"Connecting to {db_endpoint} with {driver_settings['name']}, "
+            f"db: {db_name}, table: {db_table}"
+        )
+        configure_packet_size(extraction_profile["packet_size"])
+        with telemetry.phase("Connect"):
+            conn = drivers.connect(
+                driver_settings, db_endpoint, db_username, db_password, db_name
+            )
+            apply_session_profile(conn, extraction_profile)
     except Exception as e:
-        logger.exception(f"Failed during decoding or transformation: {e}")
+        logger.exception(f"Failed to connect to SQL Server: {e}")
         raise
 
-    try:
-        output_path = f"s3://{output_bucket}/{db_name}/{db_table}/"
-        logger.info(
-            f"Writing to S3: {output_path}"
-            f"{' partitioned by extraction_timestamp' if database_refresh_mode == 'incremental' else ''}"
+    if use_pipeline:
+        # === Fetch, Decode and Write to S3 at once ===
+        try:
+            row_version_cols = set()
+            if not projected:
+                with telemetry.phase("Query"):
+                    row_version_cols = get_rowversion_cols(
+                        conn, table=db_table, schema="dbo"
+                    )
+            logger.info(f"Streaming {db_name}.{db_table} to S3: {output_path}")
+            row_count, bytes_read, bytes_written = export_chunk_pipelined(
+                conn,
+                db_query,
+                output_path,
+                row_version_cols,
+                extraction_timestamp if add_timestamp else None,
+                load_encoding_profile(encoding_profile),
+                chunk.get("key_columns", []),
+                pipeline_settings,
+                lob_offloader,
+                lob_columns,
+            )
+            telemetry.count("Rows", row_count)
+            profiling.checkpoint("export_chunk_pipelined")
+        except Exception as e:
+            logger.exception(f"Failed to export {db_name}.{db_table} to S3: {e}")
+            raise
+    else:
+        # === Fetch Data ===
+        # A columnar driver reads the chunk into Arrow without Python rows,
+        # unless LOB values have to be offloaded from the rows first
+        columnar = (
+            hasattr(conn, "read_table")
+            and export_engine == "arrow"
+            and not lob_offloader
         )
+        rows = result = None
+        try:
+            if columnar:
+                result = read_chunk_table(
+                    conn, db_query, extraction_profile["fetch_size"]
+                )
+                row_count = result.num_rows
+            else:
+                rows, columns = read_chunk(
+                    conn, db_query, extraction_profile["fetch_size"]
+                )
+                row_count = len(rows)
+            profiling.checkpoint("read_chunk")
+            telemetry.count("Rows", row_count)
+            logger.info(f"Fetched {row_count} rows from {db_name}.{db_table}")
+        except Exception as e:
+            logger.exception(f"Failed to fetch data from SQL Server: {e}")
+            raise
+
+        # === Get rowversion and timestamp data type columns ===
+        # A projected chunk query formats them as hex itself
+        row_version_cols = set()
+        if not projected:
+            with telemetry.phase("Query"):
+                row_version_cols = get_rowversion_cols(
+                    conn, table=db_table, schema="dbo"
+                )
+            logger.info(
+                f"Columns with datatype 'timestamp' or 'rowversion' for {db_table}: {row_version_cols}"
+            )
 
-        wr.s3.to_parquet(
-            df=df,
-            path=output_path,
-            database=db_name,
-            table=db_table,
-            dataset=True,
-            mode="append",
-            partition_cols=(
-                ["extraction_timestamp"]
-                if database_refresh_mode == "incremental"
-                else None
-            ),
+        # === Decode and Clean Data ===
+        # The rn helper column from the ROW_NUMBER() chunk query is dropped
+        try:
+            build_table = (
+                build_table_arrow if export_engine == "arrow" else build_table_pandas
+            )
+            with telemetry.phase("Decode"):
+                if columnar:
+                    table = build_table_columnar(result, row_version_cols)
+                else:
+                    if lob_offloader:
+                        rows, columns = lob_offloader.offload(
+                            rows, columns, lob_columns
+                        )
+                    table = build_table(rows, columns, row_version_cols)
+            del rows, result
+            bytes_read = table.nbytes
+            profiling.checkpoint("decode_columns")
+        except Exception as e:
+            logger.exception(f"Failed during decoding or transformation: {e}")
+            raise
+
+        if add_timestamp:
+            table = table.append_column(
+                "extraction_timestamp",
+                pa.array([extraction_timestamp] * row_count, pa.string()),
+            )
+
+        # Pure S3 write: the Glue catalog is updated once per table by the
+        # finaliser, not by every chunk
+        try:
+            logger.info(f"Writing to S3: {output_path}")
+            bytes_written = write_parquet(
+                table,
+                output_path,
+                parquet_options(
+                    table,
+                    load_encoding_profile(encoding_profile),
+                    chunk.get("key_columns", []),
+                ),
+            )
+            profiling.checkpoint("write_parquet")
+        except Exception as e:
+            logger.exception(f"Failed to write to S3 for {db_name}.{db_table}: {e}")
+            raise
+
+    try:
+        telemetry.count("Bytes", bytes_written, "Bytes")
+        lob_count = lob_uploads = lob_bytes = 0
+        if lob_offloader:
+            lob_count, lob_uploads, lob_bytes = lob_offloader.wait()
+            logger.info(
+                f"Offloaded {lob_count} LOB values, uploading {lob_uploads} "
+                f"objects ({lob_bytes} bytes)"
+            )
+
+        logger.info(f"Data export completed: {db_name}.{db_table} ({row_count} rows)")
+        result = {
+            "database": db_name,
+            "table": db_table,
+            "s3_output_path": output_path,
+        }
+        write_chunk_result(
+            output_bucket,
+            {
+                **result,
+                "extraction_timestamp": extraction_timestamp,
+                "chunk_index": chunk.get("chunk_index", 0),
+                "status": "SUCCEEDED",
+                "encoding_profile": encoding_profile,
+                "rows": row_count,
+                "bytes": bytes_written,
+                "bytes_read": bytes_read,
+                "lobs": lob_count,
+                "lob_uploads": lob_uploads,
+                "lob_bytes": lob_bytes,
+                "retries": event.get("retry_count", 0),
+                "started_at": started_at,
+                "finished_at": time.time(),
+                "encode_s": round(telemetry.phase_seconds("Encode"), 3),
+                "duration_s": round(time.perf_counter() - started, 3),
+            },
         )
 
-        logger.info(f"Data export completed: {db_name}.{db_table} ({len(df)} rows)")
-        return {"database": db_name, "table": db_table, "s3_output_path": output_path}
+        # The last chunk of a table to finish triggers its validation
+        with telemetry.phase("Progress"):
+            result["table_complete"] = progress.complete_chunk(
+                progress.run_id(db_name, extraction_timestamp),
+                db_table,
+                chunk.get("chunk_index", 0),
+            )
+        return result
 
     except Exception as e:
         logger.exception(f"Failed to write to S3 for {db_name}.{db_table}: {e}")
@@ -0,0 +1,270 @@
+"""
+Overlapped fetch, encode and upload of one export chunk.
+
+The sequential export fetches the whole chunk, then converts and encodes
+it, then uploads the file, so the Lambda waits on SQL Server, then on the
+CPU, then on S3. The pipeline runs the three stages at once, connected by
+bounded queues so that a slow stage holds back the stages before it:
+
+    fetch   a thread reading batch_rows rows at a time from the cursor
+    encode  the calling thread, converting each batch to Arrow and writing
+            Parquet row groups into a MultipartUpload as they fill up
+    upload  a pool of upload_concurrency threads uploading the file's parts
+
+A chunk then takes about as long as its slowest stage, and holds at most
+queue_depth fetched batches and upload_concurrency parts in memory.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import telemetry
+
+logger = logging.getLogger()
+
+# Settings when EXPORT_PIPELINE does not set them
+DEFAULT_PIPELINE = {
+    "enabled": False,
+    "batch_rows": 50_000,
+    "queue_depth": 4,
+    "part_size_mb": 16,
+    "upload_concurrency": 4,
+}
+
+# S3 rejects multipart upload parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Seconds between checks for a stopped pipeline while a queue is full
+QUEUE_POLL_S = 1.0
+
+_END = object()
+
+
+def load_settings() -> dict:
+    """Reads the EXPORT_PIPELINE JSON; settings left out keep their default."""
+    settings = json.loads(os.environ.get("EXPORT_PIPELINE", "{}") or "{}")
+    return {**DEFAULT_PIPELINE, **settings}
+
+
+class MultipartUpload:
+    """
+    A write-only file that uploads what is written to it as the parts of an
+    S3 multipart upload, at most `concurrency` parts at a time: write()
+    blocks while that many are in flight. A file smaller than one part is
+    uploaded with a single PutObject by close().
+    """
+
+    def __init__(self, s3, bucket: str, key: str, part_size: int, concurrency: int):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = bytearray()
+        self.size = 0
+        self.upload_id = None
+        self.parts: list[Future[dict[str, Any]]] = []
+        self.slots = threading.Semaphore(concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._submit(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self):
+        pass
+
+    def _submit(self, body: bytes):
+        # A failed part fails the upload: stop encoding as soon as it shows up
+        for future in self.parts:
+            if future.done() and (error := future.exception()):
+                raise error
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key
+            )["UploadId"]
+        self.slots.acquire()
+        self.parts.append(
+            self.pool.submit(self._upload_part, len(self.parts) + 1, body)
+        )
+
+    def _upload_part(self, number: int, body: bytes) -> dict:
+        try:
+            with telemetry.phase("Upload"):
+                response = self.s3.upload_part(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+            return {"ETag": response["ETag"], "PartNumber": number}
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """Uploads the rest of the file and completes the upload."""
+        if self.closed:
+            return
+        try:
+            if self.upload_id is None:
+                with telemetry.phase("Upload"):
+                    self.s3.put_object(
+                        Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer)
+                    )
+            else:
+                if self.buffer:
+                    self._submit(bytes(self.buffer))
+                parts = [future.result() for future in self.parts]
+                with telemetry.phase("Upload"):
+                    self.s3.complete_multipart_upload(
+                        Bucket=self.bucket,
+                        Key=self.key,
+                        UploadId=self.upload_id,
+                        MultipartUpload={"Parts": parts},
+                    )
+            self.buffer.clear()
+        finally:
+            self.closed = True
+            self.pool.shutdown()
+
+    def abort(self):
+        """Discards the parts uploaded so far, so no partial file is left."""
+        self.closed = True
+        self.pool.shutdown(cancel_futures=True)
+        if self.upload_id is not None:
+            try:
+                self.s3.abort_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+                )
+            except Exception as e:
+                logger.warning(f"Failed to abort upload of {self.key}: {e}")
+
+
+def _put(batches: queue.Queue, item, stop: threading.Event):
+    """Blocks while the queue is full, unless the pipeline has stopped."""
+    while not stop.is_set():
+        try:
+            batches.put(item, timeout=QUEUE_POLL_S)
+            return
+        except queue.Full:
+            continue
+
+
+def _fetch(cursor, batch_rows: int, batches: queue.Queue, stop: threading.Event):
+    try:
+        while not stop.is_set():
+            with telemetry.phase("Fetch"):
+                rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            _put(batches, rows, stop)
+    except Exception as e:
+        _put(batches, e, stop)
+    _put(batches, _END, stop)
+
+
+def export_chunk(
+    cursor,
+    query: str,
+    build_batch,
+    upload: MultipartUpload,
+    write_options,
+    settings: dict,
+) -> tuple[int, int]:
+    """
+    Streams the result of the chunk query into `upload` as one Parquet file
+    and returns its (rows, Arrow bytes). build_batch(rows, columns) builds
+    the Arrow table of a batch of rows; every batch has the same schema.
+    write_options(table) returns the pq.write_table() arguments of the
+    file, given its empty table.
+    """
+    with telemetry.phase("QueryFirstByte"):
+        cursor.execute(query)
+    columns = [col[0] for col in cursor.description]
+
+    empty = build_batch([], columns)
+    options = dict(write_options(empty))
+    # Row groups are written, and so uploaded, as they fill up: by default
+    # one per fetched batch
+    row_group_size = options.pop("row_group_size", settings["batch_rows"])
+
+    # Fetched row lists, then an exception or _END
+    batches: queue.Queue[object] = queue.Queue(maxsize=settings["queue_depth"])
+    stop = threading.Event()
+    fetcher = threading.Thread(
+        target=_fetch,
+        args=(cursor, settings["batch_rows"], batches, stop),
+        daemon=True,
+    )
+
+    writer = None
+    pending: list[pa.Table] = []
+    pending_rows = 0
+    row_count = bytes_read = 0
+
+    def write_row_groups(final=False):
+        nonlocal pending, pending_rows
+        while pending_rows >= row_group_size or (final and pending_rows):
+            table = pa.concat_tables(pending)
+            with telemetry.phase("Encode"):
+                writer.write_table(
+                    table.slice(0, row_group_size), row_group_size=row_group_size
+                )
+            rest = table.slice(row_group_size)
+            pending = [rest] if rest.num_rows else []
+            pending_rows = rest.num_rows
+
+    try:
+        try:
+            writer = pq.ParquetWriter(
+                pa.PythonFile(upload, mode="w"), empty.schema, **options
+            )
+        except TypeError:
+            # Bloom filters need a newer pyarrow than some deployments have
+            if "bloom_filter_options" not in options:
+                raise
+            logger.warning("pyarrow cannot write bloom filters, writing without")
+            options.pop("bloom_filter_options")
+            writer = pq.ParquetWriter(
+                pa.PythonFile(upload, mode="w"), empty.schema, **options
+            )
+
+        fetcher.start()
+        while (item := batches.get()) is not _END:
+            if isinstance(item, Exception):
+                raise item
+            with telemetry.phase("Decode"):
+                table = build_batch(item, columns)
+            row_count += table.num_rows
+            bytes_read += table.nbytes
+            pending.append(table)
+            pending_rows += table.num_rows
+            write_row_groups()
+
+        fetcher.join()
+        write_row_groups(final=True)
+        with telemetry.phase("Encode"):
+            writer.close()
+        upload.close()
+    except Exception:
+        # The fetch thread stops at its next batch
+        stop.set()
+        upload.abort()
+        raise
+
+    return row_count, bytes_read
@@ -0,0 +1,142 @@
+"""
+Opt-in cProfile and tracemalloc capture for individual chunk exports.
+
+Profiling is enabled for a chunk when the event (or its chunk) has
+"profile": true, or when PROFILE_SAMPLE_RATE=N is set and the CRC32 of its
+database, table and chunk index is a multiple of N, so about 1 in N chunks
+across all tables is profiled, the same ones on a retry (1 profiles every
+chunk, 0 disables sampling).
+
+The artifacts are uploaded to
+s3://<OUTPUT_BUCKET>/profiles/<db>/<table>/<extraction_timestamp>/chunk-NNNNN/:
+
+    profile.pstats   cProfile stats, for pstats/snakeviz
+    profile.txt      top functions by cumulative time
+    memory.json      peak traced memory and top allocations per checkpoint
+"""
+
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import aws_clients
+
+logger = logging.getLogger()
+
+s3 = aws_clients.client("s3")
+
+# Allocation sites kept per checkpoint in memory.json
+TOP_ALLOCATIONS = 25
+
+_active = None
+
+
+class Profiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.checkpoints = []
+        self.started = time.perf_counter()
+
+    def start(self):
+        tracemalloc.start(10)
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        tracemalloc.stop()
+
+    def checkpoint(self, label: str):
+        """Records the peak traced memory since the previous checkpoint."""
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        self.checkpoints.append(
+            {
+                "label": label,
+                "elapsed_s": round(time.perf_counter() - self.started, 3),
+                "current_bytes": current,
+                "peak_bytes": peak,
+                "top_allocations": [
+                    {
+                        "location": str(stat.traceback[0]),
+                        "size_bytes": stat.size,
+                        "count": stat.count,
+                    }
+                    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+                ],
+            }
+        )
+        tracemalloc.reset_peak()
+
+    def upload(self, bucket: str, prefix: str):
+        with tempfile.NamedTemporaryFile(suffix=".pstats") as f:
+            self.profile.dump_stats(f.name)
+            s3.upload_file(f.name, bucket, f"{prefix}profile.pstats")
+
+        report = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=report)
+        stats.sort_stats("cumulative").print_stats(50)
+        s3.put_object(
+            Bucket=bucket, Key=f"{prefix}profile.txt", Body=report.getvalue().encode()
+        )
+        s3.put_object(
+            Bucket=bucket,
+            Key=f"{prefix}memory.json",
+            Body=json.dumps({"checkpoints": self.checkpoints}, indent=2).encode(),
+        )
+        logger.info(f"Uploaded profile to s3://{bucket}/{prefix}")
+
+
+def should_profile(event: dict) -> bool:
+    chunk = event.get("chunk", {})
+    if event.get("profile") or chunk.get("profile"):
+        return True
+    sample_rate = int(os.environ.get("PROFILE_SAMPLE_RATE", "0") or 0)
+    if sample_rate <= 0:
+        return False
+    key = f"{chunk.get('database')}/{chunk.get('table')}:{chunk.get('chunk_index', 0)}"
+    return zlib.crc32(key.encode()) % sample_rate == 0
+
+
+def checkpoint(label: str):
+    """Marks the end of a step; does nothing unless this chunk is profiled."""
+    if _active is not None:
+        _active.checkpoint(label)
+
+
+def profiled(handler):
+    """Decorates the export handler to profile the sampled chunks."""
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _active
+        if not should_profile(event):
+            return handler(event, context)
+
+        chunk = event["chunk"]
+        prefix = (
+            f"profiles/{chunk['database']}/{chunk['table']}/"
+            f"{event['extraction_timestamp']}/chunk-{chunk.get('chunk_index', 0):05d}/"
+        )
+        _active = Profiler()
+        _active.start()
+        try:
+            return handler(event, context)
+        finally:
+            _active.stop()
+            try:
+                _active.upload(os.environ["OUTPUT_BUCKET"], prefix)
+            except Exception as e:
+                logger.warning(f"Failed to upload profile to {prefix}: {e}")
+            _active = None
+
+    return wrapper
@@ -0,0 +1,230 @@
+import os
+import time
+import logging
+import aws_clients
+import telemetry
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+s3 = aws_clients.client("s3")
+glue = aws_clients.client("glue")
+athena = aws_clients.client("athena")
+
+# Glue accepts at most 100 partitions per BatchCreatePartition call
+PARTITION_BATCH_SIZE = 100
+
+# Publishes the data files written by the export chunks of one table
+# Iceberg: commits all files of the run as a single snapshot, then expires
+# the snapshots replaced by it
+# Parquet: registers the run's Hive partitions in bulk
+
+
+@telemetry.phase("AthenaQuery")
+def run_athena_query(query, database, bucket):
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={"Database": database},
+        ResultConfiguration={"OutputLocation": f"s3://{bucket}/athena-results/"},
+    )
+    query_id = response["QueryExecutionId"]
+
+    while True:
+        status = athena.get_query_execution(QueryExecutionId=query_id)
+        state = status["QueryExecution"]["Status"]["State"]
+        if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
+            break
+        time.sleep(2)
+
+    if state != "SUCCEEDED":
+        reason = status["QueryExecution"]["Status"].get("StateChangeReason", "unknown")
+        raise Exception(f"Athena query failed: {state} - {reason}")
+
+    return query_id
+
+
+def list_data_files(bucket: str, prefix: str) -> list[str]:
+    """Returns the s3:// paths of all Parquet files under the prefix."""
+    paginator = s3.get_paginator("list_objects_v2")
+    files = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".parquet"):
+                files.append(f"s3://{bucket}/{obj['Key']}")
+    return sorted(files)
+
+
+def list_partition_values(
+    bucket: str, table_prefix: str, search_prefix: str
+) -> list[list[str]]:
+    """
+    Returns the distinct Hive partition values (key=value path segments
+    below the table prefix) of the files under the search prefix.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    partitions = set()
+    for page in paginator.paginate(Bucket=bucket, Prefix=search_prefix):
+        for obj in page.get("Contents", []):
+            segments = obj["Key"][len(table_prefix) :].split("/")[:-1]
+            if segments and all("=" in seg for seg in segments):
+                partitions.add(tuple(seg.split("=", 1)[1] for seg in segments))
+    return [list(p) for p in sorted(partitions)]
+
+
+def register_partitions(db_name: str, db_table: str, partition_values: list):
+    """Registers Hive partitions in bulk, skipping those that already exist."""
+    table = glue.get_table(DatabaseName=db_name, Name=db_table)["Table"]
+    storage = table["StorageDescriptor"]
+    partition_keys = [key["Name"] for key in table.get("PartitionKeys", [])]
+
+    partition_inputs = []
+    for values in partition_values:
+        path = "/".join(f"{k}={v}" for k, v in zip(partition_keys, values))
+        partition_inputs.append(
+            {
+                "Values": values,
+                "StorageDescriptor": {
+                    **storage,
+                    "Location": f"{storage['Location'].rstrip('/')}/{path}/",
+                },
+            }
+        )
+
+    created = 0
+    with telemetry.phase("Glue"):
+        for i in range(0, len(partition_inputs), PARTITION_BATCH_SIZE):
+            batch = partition_inputs[i : i + PARTITION_BATCH_SIZE]
+            response = glue.batch_create_partition(
+                DatabaseName=db_name, TableName=db_table, PartitionInputList=batch
+            )
+            errors = [
+                err
+                for err in response.get("Errors", [])
+                if err["ErrorDetail"]["ErrorCode"] != "AlreadyExistsException"
+            ]
+            if errors:
+                raise Exception(f"Failed to register partitions: {errors}")
+            created += len(batch) - len(response.get("Errors", []))
+
+    telemetry.count("Partitions", created)
+    logger.info(
+        f"Registered {created} new partitions for {db_name}.{db_table} "
+        f"({len(partition_inputs) - created} already existed)"
+    )
+
+
+def commit_iceberg_table(
+    db_name: str,
+    db_table: str,
+    extraction_timestamp: str,
+    data_files: list[str],
+    database_refresh_mode: str,
+):
+    """
+    Publishes the run's data files in one Iceberg transaction.
+    Full refresh replaces the table contents, incremental appends.
+    """
+    # Only needed for Iceberg output, so Parquet runs skip the import cost
+    import pyarrow.parquet as pq
+    from pyiceberg.catalog import load_catalog
+    from pyiceberg.expressions import AlwaysTrue
+
+    with telemetry.phase("Glue"):
+        catalog = load_catalog("glue", type="glue")
+        table = catalog.load_table((db_name, db_table))
+
+    with telemetry.phase("IcebergCommit"), table.transaction() as tx:
+        if data_files:
+            # Picks up columns added to the source table since the last run
+            with table.io.new_input(data_files[0]).open() as f:
+                file_schema = pq.read_schema(f)
+            with tx.update_schema() as update:
+                update.union_by_name(file_schema)
+
+        if database_refresh_mode != "incremental":
+            tx.delete(AlwaysTrue())
+
+        if data_files:
+            tx.add_files(
+                data_files,
+                snapshot_properties={"extraction_timestamp": extraction_timestamp},
+            )
+
+    logger.info(
+        f"Committed {len(data_files)} files to {db_name}.{db_table} "
+        f"({database_refresh_mode})"
+    )
+
+
+@telemetry.instrument("database-export-finaliser")
+def handler(event, context):
+    chunk = event["chunk"]
+    db_name = chunk["database"]
+    db_table = chunk["table"]
+    extraction_timestamp = chunk["extraction_timestamp"]
+    telemetry.set_dimensions(Database=db_name, Table=db_table)
+
+    output_bucket = os.environ["OUTPUT_BUCKET"]
+    database_refresh_mode = os.environ.get("DATABASE_REFRESH_MODE", "full")
+    output_table_format = os.environ.get("OUTPUT_TABLE_FORMAT", "parquet")
+
+    if output_table_format != "iceberg":
+        table_prefix = f"{db_name}/{db_table}/"
+        search_prefix = f"{table_prefix}extraction_timestamp={extraction_timestamp}/"
+        if database_refresh_mode != "incremental":
+            # Full refresh only has partitions when the table's output is
+            # partitioned by a column, and rewrites all of them
+            with telemetry.phase("Glue"):
+                table = glue.get_table(DatabaseName=db_name, Name=db_table)["Table"]
+            if not table.get("PartitionKeys"):
+                logger.info(f"Nothing to finalise for {db_name}.{db_table}")
+                return {"status": "SKIPPED", "table": f"{db_name}.{db_table}"}
+            search_prefix = table_prefix
+
+        try:
+            with telemetry.phase("S3List"):
+                partition_values = list_partition_values(
+                    output_bucket, table_prefix, search_prefix
+                )
+            register_partitions(db_name, db_table, partition_values)
+            return {
+                "status": "REGISTERED",
+                "table": f"{db_name}.{db_table}",
+                "partitions": len(partition_values),
+            }
+        except Exception as e:
+            logger.error(f"Failed to finalise {db_name}.{db_table}: {str(e)}")
+            raise
+
+    try:
+        data_prefix = f"{db_name}/{db_table}/data/{extraction_timestamp}/"
+        with telemetry.phase("S3List"):
+            data_files = list_data_files(output_bucket, data_prefix)
+        telemetry.count("DataFiles", len(data_files))
+        logger.info(
+            f"Found {len(data_files)} data files in s3://{output_bucket}/{data_prefix}"
+        )
+
+        commit_iceberg_table(
+            db_name,
+            db_table,
+            extraction_timestamp,
+            data_files,
+            database_refresh_mode,
+        )
+
+        # Expire snapshots older than the table's retention and remove the
+        # data files only they referenced
+        run_athena_query(f'VACUUM "{db_name}"."{db_table}"', db_name, output_bucket)
+        logger.info(f"Vacuumed {db_name}.{db_table}")
+
+        return {
+            "status": "COMMITTED",
+            "table": f"{db_name}.{db_table}",
+            "data_files": len(data_files),
+        }
+
+    except Exception as e:
+        logger.error(f"Failed to finalise {db_name}.{db_table}: {str(e)}")
+        raise
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import logging
+import pymssql
+import aws_clients
+import telemetry
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+secretmanager = aws_clients.client("secretsmanager")
+
+# Name of the indexes created on chunking keys. They are not dropped: the
+# restored DB instance is deleted after the export
+CHUNK_KEY_INDEX = "ix_export_chunk_key"
+
+# Prepares the restored database for the export, before the scanner runs:
+# indexes the chunking key of large tables that have no index on it and
+# refreshes the statistics of the tables to export, largest tables first,
+# in parallel and within a time budget
+
+
+def get_secret_value(secret_arn: str) -> str:
+    """Fetch secret string from Secrets Manager."""
+    try:
+        response = secretmanager.get_secret_value(SecretId=secret_arn)
+        return response["SecretString"]
+    except Exception:
+        logger.exception("Error fetching secret: %s", secret_arn)
+        raise
+
+
+def get_tables(cursor):
+    """
+    Returns {"schema.table": {"rows", "primary_key", "indexes"}} for the
+    user tables, where indexes lists the key columns of each index in order.
+    """
+    cursor.execute(
+        """
+        SELECT s.name, t.name, SUM(p.rows)
+        FROM sys.tables t
+        JOIN sys.schemas s ON t.schema_id = s.schema_id
+        JOIN sys.partitions p ON p.object_id = t.object_id AND p.index_id <= 1
+        WHERE t.is_ms_shipped = 0 AND t.name NOT LIKE 'aspnet%%'
+        GROUP BY s.name, t.name
+        """
+    )
+    tables = {
+        f"{schema}.{table}": {"rows": int(rows), "primary_key": [], "indexes": {}}
+        for schema, table, rows in cursor.fetchall()
+    }
+
+    cursor.execute(
+        """
+        SELECT s.name, t.name, i.name, i.is_primary_key, c.name
+        FROM sys.indexes i
+        JOIN sys.index_columns ic
+          ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+        JOIN sys.columns c
+          ON ic.object_id = c.object_id AND ic.column_id = c.column_id
+        JOIN sys.tables t ON i.object_id = t.object_id
+        JOIN sys.schemas s ON t.schema_id = s.schema_id
+        WHERE ic.key_ordinal > 0 AND i.is_disabled = 0
+        ORDER BY s.name, t.name, i.index_id, ic.key_ordinal
+        """
+    )
+    for schema, table, index, is_primary_key, column in cursor.fetchall():
+        info = tables.get(f"{schema}.{table}")
+        if info is None:
+            continue
+        info["indexes"].setdefault(index, []).append(column)
+        if is_primary_key:
+            info["primary_key"].append(column)
+    return tables
+
+
+def is_indexed(key_columns: list, indexes: dict) -> bool:
+    """Whether an index has the key columns as its leading key columns."""
+    return any(
+        columns[: len(key_columns)] == key_columns for columns in indexes.values()
+    )
+
+
+def plan_preparation(tables: dict, chunk_keys: dict, min_index_rows: int) -> list:
+    """
+    Returns the statements to run, largest tables first. A table's chunking
+    key is its primary key or, for tables without one, its entry in
+    chunk_keys.
+    """
+    steps = []
+    for full_table, info in sorted(
+        tables.items(), key=lambda item: item[1]["rows"], reverse=True
+    ):
+        schema, table = full_table.split(".")
+        key_columns = info["primary_key"] or chunk_keys.get(full_table, [])
+        if (
+            key_columns
+            and info["rows"] >= min_index_rows
+            and not is_indexed(key_columns, info["indexes"])
+        ):
+            columns = ", ".join(f"[{col}]" for col in key_columns)
+            steps.append(
+                {
+                    "table": full_table,
+                    "action": "CreateIndex",
+                    "sql": f"CREATE NONCLUSTERED INDEX [{CHUNK_KEY_INDEX}] "
+                    f"ON [{schema}].[{table}] ({columns}) WITH (SORT_IN_TEMPDB = ON)",
+                }
+            )
+        steps.append(
+            {
+                "table": full_table,
+                "action": "UpdateStatistics",
+                "sql": f"UPDATE STATISTICS [{schema}].[{table}]",
+            }
+        )
+    return steps
+
+
+def run_step(connect, step: dict, deadline: float) -> dict:
+    """Runs one statement, skipping it if the time budget has run out."""
+    remaining = int(deadline - time.monotonic())
+    result = {"table": step["table"], "action": step["action"], "duration_s": 0.0}
+    if remaining <= 0:
+        return {**result, "status": "SKIPPED"}
+
+    # The query timeout cancels a statement still running at the deadline
+    started = time.perf_counter()
+    conn = None
+    try:
+        conn = connect(remaining)
+        cursor = conn.cursor()
+        cursor.execute(step["sql"])
+        conn.commit()
+        status = "SUCCEEDED"
+    except Exception as e:
+        logger.warning(f"{step['action']} failed for {step['table']}: {e}")
+        status = "FAILED"
+    finally:
+        if conn is not None:
+            conn.close()
+    return {
+        **result,
+        "status": status,
+        "duration_s": round(time.perf_counter() - started, 1),
+    }
+
+
+def run_table_steps(connect, steps: list, deadline: float) -> list:
+    """Runs a table's steps in order: its index is built before its statistics."""
+    return [run_step(connect, step, deadline) for step in steps]
+
+
+@telemetry.instrument("database-export-preparer")
+def handler(event, context):
+    # Retrieve configuration from environment variables
+    db_endpoint = event["db_endpoint"]
+    db_username = event["db_username"]
+    db_name = event["db_name"]
+    tables_to_export = event.get("tables_to_export") or []
+    db_pw_secret_arn = os.environ["DATABASE_PW_SECRET_ARN"]
+    time_budget = int(os.environ.get("PREPARE_TIME_BUDGET_SECONDS", "600"))
+    min_index_rows = int(os.environ.get("PREPARE_MIN_INDEX_ROWS", "1000000"))
+    workers = int(os.environ.get("PREPARE_WORKERS", "4"))
+    # {"schema.table": [ordered key columns]} for tables without a primary key
+    chunk_keys = json.loads(os.environ.get("CHUNK_KEYS", "{}") or "{}")
+    telemetry.set_dimensions(Database=db_name)
+    deadline = time.monotonic() + time_budget
+
+    with telemetry.phase("SecretFetch"):
+        db_password = get_secret_value(db_pw_secret_arn)
+
+    def connect(timeout=0):
+        return pymssql.connect(
+            server=db_endpoint,
+            user=db_username,
+            password=db_password,
+            database=db_name,
+            timeout=timeout,
+        )
+
+    with telemetry.phase("Connect"):
+        conn = connect()
+    with telemetry.phase("Query"):
+        tables = get_tables(conn.cursor())
+    conn.close()
+
+    if tables_to_export:
+        tables = {t: info for t, info in tables.items() if t in tables_to_export}
+    steps = plan_preparation(tables, chunk_keys, min_index_rows)
+    logger.info(
+        f"{len(steps)} preparation steps for {len(tables)} tables, "
+        f"{time_budget}s budget, {workers} workers"
+    )
+
+    # Tables are prepared in parallel, largest first, each on its own
+    # connection
+    by_table = {}
+    for step in steps:
+        by_table.setdefault(step["table"], []).append(step)
+
+    results = []
+    with telemetry.phase("Prepare"):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(run_table_steps, connect, table_steps, deadline)
+                for table_steps in by_table.values()
+            ]
+            for future in as_completed(futures):
+                for result in future.result():
+                    results.append(result)
+                    logger.info(
+                        f"{result['action']} {result['table']}: "
+                        f"{result['status']} in {result['duration_s']}s"
+                    )
+
+    statuses = Counter(result["status"] for result in results)
+    for action in ("CreateIndex", "UpdateStatistics"):
+        telemetry.count(
+            f"{action}Steps",
+            sum(
+                1
+                for r in results
+                if r["action"] == action and r["status"] == "SUCCEEDED"
+            ),
+        )
+    telemetry.count("FailedSteps", statuses["FAILED"])
+    telemetry.count("SkippedSteps", statuses["SKIPPED"])
+
+    return {
+        "steps": len(steps),
+        "succeeded": statuses["SUCCEEDED"],
+        "failed": statuses["FAILED"],
+        "skipped": statuses["SKIPPED"],
+    }
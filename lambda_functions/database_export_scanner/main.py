@@ -1,13 +1,22 @@
 import os
-import boto3
+import json
 import time
 import math
+import heapq
 import logging
 import pymssql
+import aws_clients
+import telemetry
+import progress
 import pandas as pd
 import warnings
 import awswrangler as wr
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from urllib.parse import urlparse
+from itertools import pairwise
+from collections.abc import Sequence, Set as AbstractSet
+from typing import Any
 
 warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy connectable")
 
@@ -15,10 +24,31 @@ warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy conne
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-secretmanager = boto3.client("secretsmanager")
-glue = boto3.client("glue")
-s3 = boto3.client("s3")
-athena = boto3.client("athena")
+secretmanager = aws_clients.client("secretsmanager")
+glue = aws_clients.client("glue")
+s3 = aws_clients.client("s3")
+athena = aws_clients.client("athena")
+
+# Cost model for ordering the chunks: fixed Lambda, connection and upload
+# overhead per chunk, plus the SQL Server data size over the export rate
+CHUNK_OVERHEAD_S = 5.0
+DEFAULT_EXPORT_KB_PER_S = 4096.0
+
+# Names of the exporter's built-in Parquet encoding profiles
+BUILTIN_ENCODING_PROFILES = ("default", "compact", "point_lookup")
+
+# Lambda price per GB-second (x86, us-east-1) for the plan-only cost estimate
+LAMBDA_PRICE_PER_GB_S = 0.0000166667
+
+# Granularities of output partitioning by a date column, coarsest first, and
+# the Hive partition value of rows where the column is NULL
+PARTITION_GRANULARITIES = ["year", "month", "day"]
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+DEFAULT_MAX_OUTPUT_PARTITIONS = 1000
+
+# Columns the exporter adds beside each offloaded LOB column, holding the
+# length and SHA-256 of values stored out of line (see database_export/lobs.py)
+LOB_SIBLING_SUFFIXES = ("_lob_length", "_lob_sha256")
 
 # Scans the data in the RDS DB Instance
 # Creates the database and tables in Glue Catalog
@@ -26,6 +56,7 @@ athena = boto3.client("athena")
 # Gets the row count and populates this in the row_count_table in Athena
 
 
+@telemetry.phase("AthenaQuery")
 def run_athena_query(query, database, bucket):
     response = athena.start_query_execution(
         QueryString=query,
@@ -162,21 +193,174 @@ def calculate_rows_per_chunk(row_count, size_kb, target_mb=10):
         return 0.0, 0
 
 
+def get_columns(cursor, schema, table):
+    """Column names of a table or view, in order."""
+    cursor.execute(
+        """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s
+        ORDER BY ordinal_position
+    """,
+        (schema, table),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def resolve_table_filter(cursor, schema, table, spec):
+    """
+    Resolves a TABLE_FILTERS entry ({"include_columns", "exclude_columns",
+    "where"}) against the table's columns. Returns {"columns", "where"},
+    with columns None to export them all, or None if nothing is filtered.
+    """
+    if not spec:
+        return None
+    include = spec.get("include_columns") or []
+    exclude = spec.get("exclude_columns") or []
+    columns = None
+    if include or exclude:
+        all_columns = get_columns(cursor, schema, table)
+        lookup = {col.lower() for col in all_columns}
+        unknown = [col for col in include + exclude if col.lower() not in lookup]
+        if unknown:
+            raise Exception(f"Unknown filter columns for {schema}.{table}: {unknown}")
+        included = {col.lower() for col in include} or lookup
+        excluded = {col.lower() for col in exclude}
+        columns = [col for col in all_columns if col.lower() in included - excluded]
+        if not columns:
+            raise Exception(f"Column filters leave no columns of {schema}.{table}")
+    where = spec.get("where") or None
+    if columns is None and where is None:
+        return None
+    return {"columns": columns, "where": where}
+
+
+def is_filtered(table_filter):
+    """Whether a table filter limits the columns or rows exported."""
+    return bool(table_filter and (table_filter["columns"] or table_filter["where"]))
+
+
+def get_projection(cursor, schema, table, table_filter=None, lob_columns=()):
+    """
+    The select expression of each exported column, in order, with the
+    conversions the exporter would otherwise do in Python done by SQL
+    Server instead: rowversions formatted as lowercase hex, binary columns
+    (legacy single-byte text) decoded in the database collation's code
+    page, and char/varchar/text columns converted from their collation to
+    nvarchar. Binary LOB columns that are offloaded keep their bytes.
+    """
+    cursor.execute(
+        """
+        SELECT column_name, data_type, character_maximum_length
+        FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s
+        ORDER BY ordinal_position
+    """,
+        (schema, table),
+    )
+    projection = {}
+    for col, data_type, length in cursor.fetchall():
+        if table_filter and table_filter["columns"]:
+            if col not in table_filter["columns"]:
+                continue
+        data_type = data_type.lower()
+        size = "max" if length is None or length == -1 or length > 4000 else length
+        if data_type in ("timestamp", "rowversion"):
+            projection[col] = f"LOWER(CONVERT(varchar(16), [{col}], 2))"
+        elif data_type in ("binary", "varbinary") and col not in lob_columns:
+            projection[col] = (
+                f"CAST(CAST([{col}] AS varchar({size})) AS nvarchar({size}))"
+            )
+        elif data_type in ("char", "varchar", "text"):
+            projection[col] = f"CAST([{col}] AS nvarchar({size}))"
+        else:
+            projection[col] = f"[{col}]"
+    return projection
+
+
+def select_list(table_filter):
+    """
+    The select list of a chunk query: the filter's columns, or *, or the
+    filter's projection (see get_projection).
+    """
+    if table_filter and table_filter.get("projection"):
+        return ", ".join(
+            expression if expression == f"[{col}]" else f"{expression} AS [{col}]"
+            for col, expression in table_filter["projection"].items()
+        )
+    if not table_filter or not table_filter["columns"]:
+        return "*"
+    return ", ".join(f"[{col}]" for col in table_filter["columns"])
+
+
+def filter_predicate(table_filter, where=None):
+    """Adds the filter's row predicate, if any, to a chunk's own predicate."""
+    row_filter = table_filter and table_filter["where"]
+    if not row_filter:
+        return where
+    if not where:
+        return f"({row_filter})"
+    return f"({row_filter}) AND ({where})"
+
+
+def get_filtered_table_stats(cursor, schema, table, rows, size_kb, table_filter):
+    """
+    Scales a table's row count and size to what a filter exports: the rows
+    matching its predicate and, of those, the share of the sampled row
+    bytes held by its columns.
+    """
+    full_table = f"[{schema}].[{table}]"
+    where = filter_predicate(table_filter)
+    if where:
+        cursor.execute(f"SELECT COUNT_BIG(*) FROM {full_table} WHERE {where}")
+        filtered_rows = int(cursor.fetchone()[0])
+        size_kb = size_kb * filtered_rows / rows if rows else 0.0
+        rows = filtered_rows
+    if table_filter["columns"] and rows:
+        all_columns = get_columns(cursor, schema, table)
+        projected = " + ".join(
+            f"ISNULL(DATALENGTH([{col}]), 0)" for col in table_filter["columns"]
+        )
+        total = " + ".join(f"ISNULL(DATALENGTH([{col}]), 0)" for col in all_columns)
+        sample = f"SELECT TOP 1000 * FROM {full_table}"
+        if where:
+            sample = f"{sample} WHERE {where}"
+        cursor.execute(
+            f"SELECT AVG(CAST({projected} AS FLOAT)), AVG(CAST({total} AS FLOAT)) "
+            f"FROM ({sample}) s"
+        )
+        projected_bytes, total_bytes = cursor.fetchone()
+        if total_bytes:
+            size_kb = size_kb * (projected_bytes or 0.0) / total_bytes
+    logger.info(f"{schema}.{table}: filtered to {rows} rows, {size_kb:.0f} KB")
+    return rows, size_kb
+
+
+def flat_query(template, **parts):
+    """
+    The template as a one-liner, with the parts inserted afterwards: they
+    can hold user filters and column names whose whitespace must be kept.
+    """
+    return " ".join(template.split()).format(**parts)
+
+
 def generate_chunk_query_by_rownum(
-    schema, table, pk_columns, rows_per_chunk, chunk_index
+    schema, table, pk_columns, rows_per_chunk, chunk_index, where=None, columns="*"
 ):
     if not pk_columns:
         raise ValueError("Primary key column list cannot be empty.")
 
     order_clause = ", ".join(f"[{col}]" for col in pk_columns)
     full_table = f"[{schema}].[{table}]"
+    if where:
+        full_table = f"{full_table} WHERE {where}"
 
     start_row = chunk_index * rows_per_chunk + 1
     end_row = start_row + rows_per_chunk - 1
 
-    query = f"""
+    query = """
     WITH Ordered AS (
-        SELECT *, ROW_NUMBER() OVER (ORDER BY {order_clause}) AS rn
+        SELECT {columns}, ROW_NUMBER() OVER (ORDER BY {order_clause}) AS rn
         FROM {full_table}
     )
     SELECT *
@@ -186,7 +370,41 @@ def generate_chunk_query_by_rownum(
     """
 
     # Normalize query to a flat one-liner
-    return " ".join(query.strip().split())
+    return flat_query(
+        query,
+        columns=columns,
+        order_clause=order_clause,
+        full_table=full_table,
+        start_row=start_row,
+        end_row=end_row,
+    )
+
+
+def get_chunk_output_path(
+    output_table_format,
+    database_refresh_mode,
+    bucket,
+    db_name,
+    table,
+    extraction_timestamp,
+    chunk_index,
+    partition_path="",
+):
+    """
+    Returns the S3 path of the data file written by a chunk.
+    Names are deterministic so a retried chunk overwrites its own file.
+    partition_path is the chunk's output partition ("key=value/..."), if any.
+    """
+    table_path = f"s3://{bucket}/{db_name}/{table}/"
+    file_name = f"part-{chunk_index:05d}.parquet"
+    if output_table_format == "iceberg":
+        return f"{table_path}data/{extraction_timestamp}/{file_name}"
+    if database_refresh_mode == "incremental":
+        return (
+            f"{table_path}extraction_timestamp={extraction_timestamp}/"
+            f"{partition_path}{file_name}"
+        )
+    return f"{table_path}{partition_path}{extraction_timestamp}-{file_name}"
 
 
 def ensure_glue_database(glue_client, glue_db, description=None):
@@ -233,6 +451,7 @@ def delete_glue_table(
     glue_db: str,
     table_name: str,
     database_refresh_mode: str,
+    keep_paths: AbstractSet[str] = frozenset(),
 ):
     try:
         # 1. Get Glue table location
@@ -254,8 +473,13 @@ def delete_glue_table(
 
             for page in pages:
                 if "Contents" in page:
-                    objects = [{"Key": obj["Key"]} for obj in page["Contents"]]
-                    s3.delete_objects(Bucket=bucket, Delete={"Objects": objects})
+                    objects = [
+                        {"Key": obj["Key"]}
+                        for obj in page["Contents"]
+                        if obj["Key"] not in keep_paths
+                    ]
+                    if objects:
+                        s3.delete_objects(Bucket=bucket, Delete={"Objects": objects})
                     deleted_files += len(objects)
 
             logger.info(f"Deleted {deleted_files} objects from s3://{bucket}/{prefix}")
@@ -281,6 +505,33 @@ def delete_glue_table(
         return {"status": "ERROR", "message": str(e)}
 
 
+def get_lob_columns(cursor, schema, table, table_filter=None):
+    """
+    The (max) and legacy LOB columns of a table or view, in order, of those
+    its filter exports.
+    """
+    cursor.execute(
+        """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s
+            AND (character_maximum_length = -1
+                 OR data_type IN ('text', 'ntext', 'image', 'xml'))
+        ORDER BY ordinal_position
+    """,
+        (schema, table),
+    )
+    columns = [row[0] for row in cursor.fetchall()]
+    if table_filter and table_filter["columns"]:
+        columns = [col for col in columns if col in table_filter["columns"]]
+    return columns
+
+
+def lob_sibling_columns(lob_columns):
+    """The length and hash columns the exporter adds for the LOB columns."""
+    return [col + suffix for col in lob_columns for suffix in LOB_SIBLING_SUFFIXES]
+
+
 def sort_cols(cols: list[dict], field: str):
     cols_conv = [{k.capitalize(): v.lower() for k, v in col.items()} for col in cols]
     return sorted(cols_conv, key=lambda c: c[field.capitalize()])
@@ -299,6 +550,9 @@ def create_glue_table(
     bucket: str,
     table_properties: dict,
     cursor,
+    partition_keys: Sequence[str] = (),
+    include_columns: list | None = None,
+    lob_columns: Sequence[str] = (),
 ):
     # fetch column metadata
     cursor.execute(
@@ -311,13 +565,21 @@ def create_glue_table(
     )
     cols = cursor.fetchall()
     # DONE: Fix column types
-    columns = [{"Name": cn, "Type": "string"} for cn, dt in cols]
+    columns = [
+        {"Name": cn, "Type": "string"}
+        for cn, dt in cols
+        if include_columns is None or cn in include_columns
+    ]
+    columns += [
+        {"Name": cn, "Type": "string"} for cn in lob_sibling_columns(lob_columns)
+    ]
 
     # Add extraction_timestamp column for full mode
     if database_refresh_mode != "incremental":
         columns.append({"Name": "extraction_timestamp", "Type": "string"})
 
     s3_path = f"s3://{bucket}/{db_name}/{table}/"
+    table_input: dict[str, Any]
     if database_refresh_mode == "incremental":
         table_input = {
             "Name": table,
@@ -333,7 +595,8 @@ def create_glue_table(
                     "Parameters": {},
                 },
             },
-            "PartitionKeys": [{"Name": "extraction_timestamp", "Type": "string"}],
+            "PartitionKeys": [{"Name": "extraction_timestamp", "Type": "string"}]
+            + [{"Name": key, "Type": "string"} for key in partition_keys],
             "TableType": "EXTERNAL_TABLE",
             "Parameters": table_properties,
         }
@@ -352,6 +615,9 @@ def create_glue_table(
                     "Parameters": {},
                 },
             },
+            "PartitionKeys": [
+                {"Name": key, "Type": "string"} for key in partition_keys
+            ],
             "TableType": "EXTERNAL_TABLE",
             "Parameters": table_properties,
         }
@@ -363,7 +629,10 @@ def create_glue_table(
         response = glue.get_table(DatabaseName=glue_db, Name=table)
         old_columns_glue = response["Table"]["StorageDescriptor"]["Columns"]
         old_columns = [col for col in old_columns_glue if is_not_rn(col)]
-        if sort_cols(columns, "Name") != sort_cols(old_columns, "Name"):
+        old_partition_keys = response["Table"].get("PartitionKeys", [])
+        if sort_cols(columns, "Name") != sort_cols(
+            old_columns, "Name"
+        ) or old_partition_keys != table_input.get("PartitionKeys", []):
             logger.info(sort_cols(columns, "Name"))
             logger.info(sort_cols(old_columns, "Name"))
             glue.update_table(DatabaseName=glue_db, TableInput=table_input)
@@ -376,6 +645,1229 @@ def create_glue_table(
         logger.error("Error creating Glue table %s.%s: %s", glue_db, table, e)
 
 
+def is_iceberg_table(glue_db: str, table_name: str):
+    """Returns True/False for an existing table, or None if it does not exist."""
+    try:
+        response = glue.get_table(DatabaseName=glue_db, Name=table_name)
+    except glue.exceptions.EntityNotFoundException:
+        return None
+    parameters = response["Table"].get("Parameters", {})
+    return parameters.get("table_type", "").upper() == "ICEBERG"
+
+
+def create_iceberg_table(
+    database_refresh_mode: str,
+    db_name: str,
+    schema: str,
+    table: str,
+    bucket: str,
+    snapshot_retention_seconds: int,
+    cursor,
+    include_columns: list | None = None,
+    lob_columns: Sequence[str] = (),
+):
+    """
+    Creates the Iceberg table for an exported table if it does not exist.
+    Data is only ever published by the per-table commit in the finaliser,
+    so the table keeps serving the previous snapshot during the export.
+    """
+    # A Hive table left over from a parquet-format export has to go first
+    if is_iceberg_table(db_name, table) is False:
+        logger.info(f"Replacing Hive table {db_name}.{table} with an Iceberg table")
+        delete_glue_table(
+            glue_db=db_name, table_name=table, database_refresh_mode="full"
+        )
+
+    cursor.execute(
+        """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s
+        ORDER BY ordinal_position
+    """,
+        (schema, table),
+    )
+    columns = [
+        row[0]
+        for row in cursor.fetchall()
+        if include_columns is None or row[0] in include_columns
+    ]
+    columns += lob_sibling_columns(lob_columns)
+    if "extraction_timestamp" not in columns:
+        columns.append("extraction_timestamp")
+
+    column_ddl = ",\n            ".join(f"`{col}` STRING" for col in columns)
+    partition_ddl = (
+        "PARTITIONED BY (extraction_timestamp)"
+        if database_refresh_mode == "incremental"
+        else ""
+    )
+    create_query = f"""
+        CREATE TABLE IF NOT EXISTS `{db_name}`.`{table}` (
+            {column_ddl}
+        )
+        {partition_ddl}
+        LOCATION 's3://{bucket}/{db_name}/{table}/'
+        TBLPROPERTIES (
+        'table_type' = 'ICEBERG',
+        'format' = 'parquet',
+        'vacuum_max_snapshot_age_seconds' = '{snapshot_retention_seconds}'
+        )
+        """
+    run_athena_query(create_query, db_name, bucket)
+    logger.info("Ensured Iceberg table %s.%s exists.", db_name, table)
+
+
+def get_table_partitions(cursor, schema, table, where=None):
+    """
+    Returns the partition function, partitioning column and row count of
+    each partition of a table's heap or clustered index, or None if the
+    table is not partitioned. With a where predicate, only the matching
+    rows of each partition are counted.
+    """
+    cursor.execute(
+        """
+        SELECT pf.name, c.name, p.partition_number, p.rows
+        FROM sys.tables t
+        JOIN sys.schemas s ON t.schema_id = s.schema_id
+        JOIN sys.indexes i ON i.object_id = t.object_id AND i.index_id <= 1
+        JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+        JOIN sys.partition_functions pf ON pf.function_id = ps.function_id
+        JOIN sys.index_columns ic
+          ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+         AND ic.partition_ordinal = 1
+        JOIN sys.columns c
+          ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+        JOIN sys.partitions p
+          ON p.object_id = i.object_id AND p.index_id = i.index_id
+        WHERE s.name = %s AND t.name = %s
+        ORDER BY p.partition_number
+        """,
+        (schema, table),
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    partitioning = {
+        "function": rows[0][0],
+        "column": rows[0][1],
+        "rows": {int(number): int(count) for _, _, number, count in rows},
+    }
+    if where:
+        partition = f"$PARTITION.[{rows[0][0]}]([{rows[0][1]}])"
+        cursor.execute(
+            f"SELECT {partition}, COUNT_BIG(*) FROM [{schema}].[{table}] "
+            f"WHERE {where} GROUP BY {partition}"
+        )
+        counts = {int(number): int(count) for number, count in cursor.fetchall()}
+        partitioning["rows"] = {
+            number: counts.get(number, 0) for number in partitioning["rows"]
+        }
+    return partitioning
+
+
+def partition_predicate(partitioning, partition_number):
+    """$PARTITION filter that limits a query to one partition."""
+    return (
+        f"$PARTITION.[{partitioning['function']}]([{partitioning['column']}])"
+        f" = {partition_number}"
+    )
+
+
+def plan_partition_chunks(
+    schema,
+    table,
+    pk_columns,
+    partitioning,
+    rows_per_chunk,
+    row_size_kb,
+    output_path_for,
+    db_name,
+    table_filter=None,
+):
+    """
+    Splits a partitioned table into chunks that each read a single
+    partition, sized from the partition's own row count. The $PARTITION
+    filter lets SQL Server eliminate the other partitions, and ROW_NUMBER()
+    only sorts the rows of that partition.
+    Chunk indexes run on across partitions; the first chunk index of each
+    partition is kept in partitioning["first_chunk"].
+    """
+    chunks = []
+    partitioning["first_chunk"] = {}
+    for partition_number, partition_rows in partitioning["rows"].items():
+        if partition_rows == 0:
+            continue
+        where = filter_predicate(
+            table_filter, partition_predicate(partitioning, partition_number)
+        )
+        partitioning["first_chunk"][partition_number] = len(chunks)
+        if not pk_columns:
+            num_chunks = 1
+        else:
+            num_chunks = (partition_rows + rows_per_chunk - 1) // rows_per_chunk
+        for local_index in range(num_chunks):
+            chunk_index = len(chunks)
+            if pk_columns:
+                query = generate_chunk_query_by_rownum(
+                    schema,
+                    table,
+                    pk_columns,
+                    rows_per_chunk,
+                    local_index,
+                    where,
+                    select_list(table_filter),
+                )
+                chunk_rows = min(
+                    rows_per_chunk, partition_rows - local_index * rows_per_chunk
+                )
+            else:
+                query = (
+                    f"SELECT {select_list(table_filter)} FROM [{schema}].[{table}] "
+                    f"WHERE {where}"
+                )
+                chunk_rows = partition_rows
+            chunks.append(
+                {
+                    "database": db_name,
+                    "table": table,
+                    "query": query,
+                    "chunk_index": chunk_index,
+                    "output_path": output_path_for(chunk_index),
+                    "estimated_kb": round(chunk_rows * row_size_kb, 1),
+                    "partition_number": partition_number,
+                }
+            )
+
+    logger.info(
+        f"{schema}.{table}: {len(chunks)} chunks over "
+        f"{len(partitioning['first_chunk'])} non-empty partitions "
+        f"of {partitioning['function']}({partitioning['column']})"
+    )
+    return chunks
+
+
+def output_partition_keys(column, granularity):
+    """Hive partition key names for a date column at a granularity."""
+    depth = PARTITION_GRANULARITIES.index(granularity) + 1
+    return [f"{column}_{g}" for g in PARTITION_GRANULARITIES[:depth]]
+
+
+def get_output_partition_rows(cursor, schema, table, column, granularity, where=None):
+    """
+    Returns {(year, month, day): rows} for the values of a date column,
+    truncated to the granularity, of the rows matching where, if given.
+    Rows where the column is NULL are counted under a tuple of Nones.
+    """
+    depth = PARTITION_GRANULARITIES.index(granularity) + 1
+    parts = ", ".join(
+        f"{part}([{column}])" for part in ["YEAR", "MONTH", "DAY"][:depth]
+    )
+    where_clause = f" WHERE {where}" if where else ""
+    cursor.execute(
+        f"SELECT {parts}, COUNT_BIG(*) FROM [{schema}].[{table}]{where_clause} "
+        f"GROUP BY {parts}"
+    )
+    return {
+        tuple(None if v is None else int(v) for v in row[:-1]): int(row[-1])
+        for row in cursor.fetchall()
+    }
+
+
+def roll_up_output_partitions(partition_rows, granularity, max_partitions):
+    """
+    Coarsens the granularity (day to month to year) until there are at most
+    max_partitions partitions. Returns the granularity and the partition row
+    counts, or (None, None) if even yearly partitions are too many.
+    """
+    while len(partition_rows) > max_partitions:
+        depth = PARTITION_GRANULARITIES.index(granularity)
+        if depth == 0:
+            return None, None
+        granularity = PARTITION_GRANULARITIES[depth - 1]
+        rolled = {}
+        for values, rows in partition_rows.items():
+            rolled[values[:depth]] = rolled.get(values[:depth], 0) + rows
+        partition_rows = rolled
+    return granularity, partition_rows
+
+
+def output_partition_predicate(column, values):
+    """
+    Sargable filter for the rows of one output partition: a half-open date
+    range on the column, so an index on it can be used.
+    """
+    if values[0] is None:
+        return f"[{column}] IS NULL"
+    year, month, day = (list(values) + [None, None])[:3]
+    lower = date(year, month or 1, day or 1)
+    if day:
+        upper = lower + timedelta(days=1)
+    elif month:
+        upper = date(year + month // 12, month % 12 + 1, 1)
+    else:
+        upper = date(year + 1, 1, 1)
+    return f"[{column}] >= '{lower:%Y%m%d}' AND [{column}] < '{upper:%Y%m%d}'"
+
+
+def output_partition_path(keys, values):
+    """Hive path segments ("key=value/...") of one output partition."""
+    if values[0] is None:
+        formatted = [HIVE_DEFAULT_PARTITION] * len(keys)
+    else:
+        formatted = [str(values[0])] + [f"{v:02d}" for v in values[1:]]
+    return "".join(f"{k}={v}/" for k, v in zip(keys, formatted))
+
+
+def plan_output_partition_chunks(
+    cursor,
+    schema,
+    table,
+    pk_columns,
+    spec,
+    max_partitions,
+    rows_per_chunk,
+    row_size_kb,
+    output_path_for,
+    db_name,
+    table_filter=None,
+):
+    """
+    Splits a table into chunks that each read the rows of a single output
+    partition, a year, month or day of spec["column"], and write them below
+    that partition's Hive path. Each partition is split on its own, so only
+    its last file is smaller than the target size.
+    Returns the chunks and the output partitioning used, or (None, None) if
+    the table has too many partitions even by year.
+    """
+    column = spec["column"]
+    requested = spec.get("granularity") or "month"
+    if requested not in PARTITION_GRANULARITIES:
+        raise Exception(
+            f"Unknown partition granularity for {schema}.{table}: {requested}"
+        )
+
+    granularity, partition_rows = roll_up_output_partitions(
+        get_output_partition_rows(
+            cursor, schema, table, column, requested, filter_predicate(table_filter)
+        ),
+        requested,
+        max_partitions,
+    )
+    if granularity is None:
+        logger.warning(
+            f"{schema}.{table}: more than {max_partitions} yearly partitions "
+            f"of {column}, exporting without output partitioning"
+        )
+        return None, None
+    if granularity != requested:
+        logger.warning(
+            f"{schema}.{table}: more than {max_partitions} partitions by "
+            f"{requested} of {column}, partitioning by {granularity}"
+        )
+
+    keys = output_partition_keys(column, granularity)
+    chunks = []
+    for values, partition_rows_count in sorted(
+        partition_rows.items(), key=lambda item: (item[0][0] is None, item[0])
+    ):
+        where = filter_predicate(
+            table_filter, output_partition_predicate(column, values)
+        )
+        partition_path = output_partition_path(keys, values)
+        if not pk_columns:
+            num_chunks = 1
+        else:
+            num_chunks = (partition_rows_count + rows_per_chunk - 1) // rows_per_chunk
+        for local_index in range(num_chunks):
+            chunk_index = len(chunks)
+            if pk_columns:
+                query = generate_chunk_query_by_rownum(
+                    schema,
+                    table,
+                    pk_columns,
+                    rows_per_chunk,
+                    local_index,
+                    where,
+                    select_list(table_filter),
+                )
+                chunk_rows = min(
+                    rows_per_chunk, partition_rows_count - local_index * rows_per_chunk
+                )
+            else:
+                query = (
+                    f"SELECT {select_list(table_filter)} FROM [{schema}].[{table}] "
+                    f"WHERE {where}"
+                )
+                chunk_rows = partition_rows_count
+            chunks.append(
+                {
+                    "database": db_name,
+                    "table": table,
+                    "query": query,
+                    "chunk_index": chunk_index,
+                    "output_path": output_path_for(chunk_index, partition_path),
+                    "estimated_kb": round(chunk_rows * row_size_kb, 1),
+                }
+            )
+
+    logger.info(
+        f"{schema}.{table}: {len(chunks)} chunks over {len(partition_rows)} "
+        f"output partitions by {granularity} of {column}"
+    )
+    return chunks, {"column": column, "granularity": granularity, "keys": keys}
+
+
+def plan_table_chunks(
+    cursor,
+    schema,
+    table,
+    pk_columns,
+    output_parquet_file_size,
+    output_path_for,
+    db_name,
+    extraction_timestamp,
+    output_partitioning=None,
+    max_output_partitions=DEFAULT_MAX_OUTPUT_PARTITIONS,
+    table_filter=None,
+):
+    """
+    Splits a table into export chunks of roughly output_parquet_file_size MiB.
+    Returns a dict with the chunk list and the rows per chunk used.
+    Tables with an output_partitioning spec ({"column", "granularity"}) are
+    split by output partition, and the plan's "output_partitioning" records
+    the partition keys.
+    A table_filter (see resolve_table_filter) limits the chunk queries to
+    its columns and rows, and the chunks are sized for those alone. The
+    filtered row count is kept in table_filter["rows"]. Its projection, if
+    any, is the select list of the chunk queries.
+    """
+    full_table = f"{schema}.{table}"
+
+    # Calculate the number of chunks
+    rows, size_kb = get_table_stats(cursor, schema, table)
+    if is_filtered(table_filter):
+        rows, size_kb = get_filtered_table_stats(
+            cursor, schema, table, rows, size_kb, table_filter
+        )
+        table_filter["rows"] = rows
+    if not rows or rows == 0:
+        logger.info(f"Skipping row size calculation: rows={rows}, table={table}")
+        row_size_kb = 0
+    else:
+        row_size_kb = size_kb / rows
+
+    parquet_row_kb, rows_for_limit_parquet = calculate_rows_per_chunk(
+        row_count=rows, size_kb=size_kb, target_mb=output_parquet_file_size
+    )
+
+    num_chunks = (
+        (rows + rows_for_limit_parquet - 1) // rows_for_limit_parquet
+        if rows_for_limit_parquet
+        else 1
+    )
+
+    logger.info("-" * 90)
+    logger.info(
+        f"{'Table':<40} {'Rows':>10} {'Chunks':>8} {'SQL KB/Row':>12} {'Parquet KB/Row':>16}"
+    )
+    logger.info(
+        f"{full_table:<40} {rows:>10} {num_chunks:>8} {row_size_kb:>12.4f} {parquet_row_kb:>16.4f}"
+    )
+    logger.info("-" * 90)
+
+    chunks = []
+    if rows == 0 or rows_for_limit_parquet == 0:
+        return {"chunks": chunks, "rows_per_chunk": 0}
+
+    # Tables partitioned on output are chunked within their output partitions
+    if output_partitioning:
+        chunks, output_partitioning = plan_output_partition_chunks(
+            cursor,
+            schema,
+            table,
+            pk_columns,
+            output_partitioning,
+            max_output_partitions,
+            rows_for_limit_parquet,
+            row_size_kb,
+            output_path_for,
+            db_name,
+            table_filter,
+        )
+        if chunks is not None:
+            return {
+                "chunks": chunks,
+                "rows_per_chunk": rows_for_limit_parquet,
+                "output_partitioning": output_partitioning,
+            }
+        chunks = []
+
+    # Partitioned tables are chunked within their partitions
+    partitioning = get_table_partitions(
+        cursor, schema, table, filter_predicate(table_filter)
+    )
+    if partitioning:
+        chunks = plan_partition_chunks(
+            schema,
+            table,
+            pk_columns,
+            partitioning,
+            rows_for_limit_parquet,
+            row_size_kb,
+            output_path_for,
+            db_name,
+            table_filter,
+        )
+        return {
+            "chunks": chunks,
+            "rows_per_chunk": rows_for_limit_parquet,
+            "partitioning": partitioning,
+        }
+
+    if not pk_columns:
+        # No key to range over: the whole table is a single chunk
+        query = f"SELECT {select_list(table_filter)} FROM [{schema}].[{table}]"
+        if table_filter and table_filter["where"]:
+            query = f"{query} WHERE {filter_predicate(table_filter)}"
+        chunks.append(
+            {
+                "database": db_name,
+                "table": table,
+                "extraction_timestamp": extraction_timestamp,
+                "query": query,
+                "chunk_index": 0,
+                "output_path": output_path_for(0),
+                "estimated_kb": round(size_kb, 1),
+            }
+        )
+        return {"chunks": chunks, "rows_per_chunk": rows}
+
+    for chunk_index in range(num_chunks):
+        query = generate_chunk_query_by_rownum(
+            schema,
+            table,
+            pk_columns,
+            rows_for_limit_parquet,
+            chunk_index,
+            filter_predicate(table_filter),
+            select_list(table_filter),
+        )
+        chunk_rows = min(
+            rows_for_limit_parquet, rows - chunk_index * rows_for_limit_parquet
+        )
+        chunk_info = {
+            "database": db_name,
+            "table": table,
+            "query": query,
+            "chunk_index": chunk_index,
+            "output_path": output_path_for(chunk_index),
+            "estimated_kb": round(chunk_rows * row_size_kb, 1),
+        }
+        chunks.append(chunk_info)
+
+    return {
+        "chunks": chunks,
+        "rows_per_chunk": rows_for_limit_parquet,
+        "select_list": select_list(table_filter),
+    }
+
+
+def sql_literal(value) -> str:
+    """Renders a key value read from SQL Server as a T-SQL literal."""
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return f"0x{value.hex()}"
+    if isinstance(value, datetime):
+        if value.tzinfo:
+            return f"'{value.isoformat()}'"
+        # Milliseconds, so the literal also converts to a datetime column
+        return f"'{value.isoformat(timespec='milliseconds')}'"
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'"
+    text = str(value).replace("'", "''")
+    return f"N'{text}'"
+
+
+def key_at_least(key_columns: list, values: tuple) -> str:
+    """Lexicographic (k1, k2, ...) >= (v1, v2, ...) as a T-SQL predicate."""
+    return literals_at_least(key_columns, [sql_literal(value) for value in values])
+
+
+def literals_at_least(key_columns: list, literals: list) -> str:
+    """key_at_least() of key values already rendered as T-SQL literals."""
+    col, value = f"[{key_columns[0]}]", literals[0]
+    if len(key_columns) == 1:
+        return f"{col} >= {value}"
+    rest = literals_at_least(key_columns[1:], literals[1:])
+    return f"({col} > {value} OR ({col} = {value} AND {rest}))"
+
+
+def plan_key_range_chunks(
+    cursor,
+    schema,
+    view,
+    key_columns,
+    output_parquet_file_size,
+    output_path_for,
+    db_name,
+    table_filter=None,
+):
+    """
+    Splits a view, or a table without a primary key, into export chunks of
+    roughly output_parquet_file_size MiB. Chunks are ranges of the ordered
+    key columns with boundaries read once here, so each chunk query is a
+    plain WHERE that SQL Server can answer with an index seek (or push down
+    to a view's base tables), rather than a ROW_NUMBER() over the whole
+    relation per chunk. Rows with a NULL key column go to the first chunk.
+    A table_filter limits the chunks to its columns and rows, as for tables.
+    """
+    full_view = f"[{schema}].[{view}]"
+    row_filter = filter_predicate(table_filter)
+    where_clause = f" WHERE {row_filter}" if row_filter else ""
+
+    cursor.execute(f"SELECT COUNT_BIG(*) FROM {full_view}{where_clause}")
+    rows = int(cursor.fetchone()[0])
+    if row_filter:
+        table_filter["rows"] = rows
+
+    # Views have no sp_spaceused, so the row size of the exported columns
+    # is sampled for both
+    columns = (table_filter and table_filter["columns"]) or get_columns(
+        cursor, schema, view
+    )
+    row_bytes = " + ".join(f"ISNULL(DATALENGTH([{col}]), 0)" for col in columns)
+    cursor.execute(
+        f"SELECT AVG(CAST({row_bytes} AS FLOAT)) "
+        f"FROM (SELECT TOP 1000 * FROM {full_view}{where_clause}) s"
+    )
+    avg_row_bytes = cursor.fetchone()[0] or 0.0
+
+    _, rows_per_chunk = calculate_rows_per_chunk(
+        row_count=rows,
+        size_kb=rows * avg_row_bytes / 1024,
+        target_mb=output_parquet_file_size,
+    )
+
+    def chunk(chunk_index, where=None, chunk_rows=rows):
+        query = f"SELECT {select_list(table_filter)} FROM {full_view}"
+        where = filter_predicate(table_filter, where)
+        if where:
+            query = f"{query} WHERE {where}"
+        return {
+            "database": db_name,
+            "table": view,
+            "query": query,
+            "chunk_index": chunk_index,
+            "output_path": output_path_for(chunk_index),
+            "estimated_kb": round(chunk_rows * avg_row_bytes / 1024, 1),
+        }
+
+    if rows == 0:
+        return {"chunks": [], "rows_per_chunk": 0}
+    if not key_columns or not rows_per_chunk or rows <= rows_per_chunk:
+        return {"chunks": [chunk(0)], "rows_per_chunk": rows}
+
+    keys = ", ".join(f"[{col}]" for col in key_columns)
+    not_null = " AND ".join(f"[{col}] IS NOT NULL" for col in key_columns)
+    any_null = " OR ".join(f"[{col}] IS NULL" for col in key_columns)
+    query = """
+    SELECT {keys}
+    FROM (
+        SELECT {keys}, ROW_NUMBER() OVER (ORDER BY {keys}) AS rn
+        FROM {full_view}
+        WHERE {where}
+    ) t
+    WHERE (rn - 1) % {rows_per_chunk} = 0
+    ORDER BY rn
+    """
+    cursor.execute(
+        flat_query(
+            query,
+            keys=keys,
+            full_view=full_view,
+            where=filter_predicate(table_filter, not_null),
+            rows_per_chunk=rows_per_chunk,
+        )
+    )
+    boundaries = [tuple(row) for row in cursor.fetchall()]
+
+    chunks = []
+    for chunk_index, lower in enumerate(boundaries):
+        where = [not_null]
+        if chunk_index > 0:
+            where.append(key_at_least(key_columns, lower))
+        if chunk_index + 1 < len(boundaries):
+            upper = boundaries[chunk_index + 1]
+            where.append(f"NOT {key_at_least(key_columns, upper)}")
+        predicate = " AND ".join(where)
+        if chunk_index == 0:
+            predicate = f"({predicate}) OR ({any_null})"
+        chunks.append(
+            chunk(
+                chunk_index,
+                predicate,
+                min(rows_per_chunk, rows - chunk_index * rows_per_chunk),
+            )
+        )
+
+    logger.info(f"{schema}.{view}: {rows} rows, {len(chunks)} chunks by ({keys})")
+    return {"chunks": chunks, "rows_per_chunk": rows_per_chunk}
+
+
+def estimate_chunk_seconds(chunk, throughput_kb_per_s):
+    """
+    Estimated export time of a chunk from its planned size, at the chunk's
+    own throughput_kb_per_s if it has one. A chunk's overhead_s replaces
+    CHUNK_OVERHEAD_S, e.g. 0 when its throughput already includes it.
+    """
+    throughput_kb_per_s = chunk.get("throughput_kb_per_s") or throughput_kb_per_s
+    overhead_s = chunk.get("overhead_s", CHUNK_OVERHEAD_S)
+    return overhead_s + chunk.get("estimated_kb", 0.0) / throughput_kb_per_s
+
+
+def order_chunks_lpt(chunks, throughput_kb_per_s):
+    """
+    Orders the chunks longest first. The export Map starts items in list
+    order as its concurrency slots free up, so this is LPT scheduling: the
+    large chunks start early and the small ones fill the gaps at the end.
+    """
+    return sorted(
+        chunks,
+        key=lambda c: estimate_chunk_seconds(c, throughput_kb_per_s),
+        reverse=True,
+    )
+
+
+def predict_makespan(chunks, max_concurrency, throughput_kb_per_s):
+    """Simulates the Map over the ordered chunks and returns its duration in seconds."""
+    slots = [0.0] * max(1, min(max_concurrency, len(chunks)))
+    for chunk in chunks:
+        start = heapq.heappop(slots)
+        heapq.heappush(
+            slots, start + estimate_chunk_seconds(chunk, throughput_kb_per_s)
+        )
+    return max(slots, default=0.0)
+
+
+def get_historical_throughput(db_name, bucket, trailing_runs=5):
+    """
+    Returns {table: median rows per Lambda-second} over the last successful
+    runs recorded in export_run_history, or {} if there is no history yet.
+    """
+    try:
+        query_id = run_athena_query(
+            f"""
+            SELECT table_name, approx_percentile(rows_per_s, 0.5)
+            FROM (
+                SELECT table_name, rows_per_s,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY table_name ORDER BY extraction_timestamp DESC
+                       ) AS rn
+                FROM {db_name}.export_run_history
+                WHERE status = 'SUCCEEDED' AND rows_per_s > 0
+            ) t
+            WHERE rn <= {trailing_runs}
+            GROUP BY table_name
+            """,
+            db_name,
+            bucket,
+        )
+    except Exception as e:
+        logger.info(f"No run history for {db_name}, using default throughput: {e}")
+        return {}
+
+    throughput = {}
+    paginator = athena.get_paginator("get_query_results")
+    for page in paginator.paginate(QueryExecutionId=query_id):
+        for row in page["ResultSet"]["Rows"]:
+            table, rows_per_s = [col.get("VarCharValue") for col in row["Data"]]
+            if table != "table_name" and rows_per_s:
+                throughput[table] = float(rows_per_s)
+    return throughput
+
+
+def summarise_plan(
+    table_plans,
+    table_rows,
+    history,
+    max_concurrency,
+    export_kb_per_s,
+    export_memory_mb,
+):
+    """
+    Per-table plan of a plan-only run, with the predicted export time and
+    cost. A table with run history is predicted at its historical rows per
+    Lambda-second, converted to KB/s with its current row size, which
+    already includes the per-chunk overhead; other tables at
+    export_kb_per_s plus CHUNK_OVERHEAD_S per chunk.
+    """
+    tables = {}
+    for full_table, plan in table_plans.items():
+        table = full_table.split(".")[1]
+        estimated_kb = sum(c.get("estimated_kb", 0.0) for c in plan["chunks"])
+        rows = table_rows.get(table, 0)
+        throughput, source = export_kb_per_s, "default"
+        if history.get(table) and rows and estimated_kb:
+            throughput, source = history[table] * estimated_kb / rows, "history"
+        for chunk in plan["chunks"]:
+            chunk["throughput_kb_per_s"] = throughput
+            if source == "history":
+                chunk["overhead_s"] = 0.0
+        tables[full_table] = {
+            "chunks": len(plan["chunks"]),
+            "rows": rows,
+            "estimated_kb": round(estimated_kb, 1),
+            "throughput_kb_per_s": round(throughput, 1),
+            "throughput_source": source,
+            "predicted_lambda_s": round(
+                sum(estimate_chunk_seconds(c, export_kb_per_s) for c in plan["chunks"]),
+                1,
+            ),
+        }
+
+    chunks = order_chunks_lpt(
+        [chunk for plan in table_plans.values() for chunk in plan["chunks"]],
+        export_kb_per_s,
+    )
+    makespan = predict_makespan(chunks, max_concurrency, export_kb_per_s)
+    lambda_s = sum(t["predicted_lambda_s"] for t in tables.values())
+    return {
+        "plan_only": True,
+        "tables": tables,
+        "chunks": len(chunks),
+        "estimated_kb": round(sum(t["estimated_kb"] for t in tables.values()), 1),
+        "max_concurrency": max_concurrency,
+        "predicted_makespan_s": round(makespan, 1),
+        "predicted_lambda_s": round(lambda_s, 1),
+        "estimated_cost_usd": round(
+            lambda_s * export_memory_mb / 1024 * LAMBDA_PRICE_PER_GB_S, 4
+        ),
+    }
+
+
+def check_encoding_profiles(table_profiles, size_classes, custom_profiles):
+    """
+    Fails the plan on a profile name neither built in nor in
+    ENCODING_PROFILES, rather than every chunk of the table in the exporter.
+    """
+    known = set(BUILTIN_ENCODING_PROFILES) | set(custom_profiles)
+    names = set(table_profiles.values()) | {c["profile"] for c in size_classes}
+    unknown = sorted(names - known)
+    if unknown:
+        raise Exception(f"Unknown encoding profiles: {', '.join(unknown)}")
+
+
+def choose_encoding_profile(full_table, size_kb, table_profiles, size_classes):
+    """
+    Picks a table's Parquet encoding profile: its own entry in
+    table_profiles, else the largest size class it reaches, else "default".
+    """
+    table = full_table.split(".")[1]
+    if full_table in table_profiles:
+        return table_profiles[full_table]
+    if table in table_profiles:
+        return table_profiles[table]
+    for size_class in sorted(
+        size_classes, key=lambda c: c["min_size_mb"], reverse=True
+    ):
+        if size_kb / 1024 >= size_class["min_size_mb"]:
+            return size_class["profile"]
+    return "default"
+
+
+def assign_encoding_profile(
+    plan, full_table, key_columns, table_profiles, size_classes
+):
+    """Tags each chunk with its table's encoding profile and key columns."""
+    size_kb = sum(chunk.get("estimated_kb", 0.0) for chunk in plan["chunks"])
+    profile = choose_encoding_profile(full_table, size_kb, table_profiles, size_classes)
+    for chunk in plan["chunks"]:
+        chunk["encoding_profile"] = profile
+        chunk["key_columns"] = list(key_columns)
+
+
+def assign_lob_columns(plan, lob_columns):
+    """Tags each chunk with the LOB columns the exporter offloads."""
+    for chunk in plan["chunks"]:
+        chunk["lob_columns"] = list(lob_columns)
+
+
+def mark_projected(plan):
+    """
+    Tags each chunk as selecting ready-to-write values (see get_projection),
+    so the exporter neither looks up the rowversion columns nor decodes.
+    """
+    for chunk in plan["chunks"]:
+        chunk["projected"] = True
+
+
+def has_uncomparable_columns(cursor, schema, table) -> bool:
+    """Whether the table has columns BINARY_CHECKSUM cannot see."""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM information_schema.columns
+        WHERE table_schema=%s AND table_name=%s
+          AND data_type IN (
+            'text', 'ntext', 'image', 'xml', 'sql_variant',
+            'geography', 'geometry', 'hierarchyid'
+          )
+    """,
+        (schema, table),
+    )
+    return bool(cursor.fetchone()[0])
+
+
+def get_chunk_fingerprints(
+    cursor, schema, table, pk_columns, rows_per_chunk, partitioning=None
+):
+    """
+    Returns {chunk_index: (row_count, checksum)} for the planned chunks of a
+    partitioned table, by ROW_NUMBER() position within each partition, or
+    of a table without a primary key, its single chunk. Computed on the
+    server in a single pass over the table.
+    """
+    full_table = f"[{schema}].[{table}]"
+    if partitioning:
+        # Chunks are numbered within each partition, as planned
+        partition = (
+            f"$PARTITION.[{partitioning['function']}]([{partitioning['column']}])"
+        )
+        order_clause = ", ".join(f"[{col}]" for col in pk_columns) or "(SELECT NULL)"
+        local_index = f"(rn - 1) / {rows_per_chunk}" if pk_columns else "0"
+        query = f"""
+        SELECT partition_number, {local_index} AS local_index,
+               COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*))
+        FROM (
+            SELECT *, {partition} AS partition_number,
+                   ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {order_clause}) AS rn
+            FROM {full_table}
+        ) Ordered
+        GROUP BY partition_number, {local_index}
+        """
+        cursor.execute(" ".join(query.strip().split()))
+        first_chunk = partitioning["first_chunk"]
+        return {
+            first_chunk[int(number)] + int(idx): (int(rows), int(checksum or 0))
+            for number, idx, rows, checksum in cursor.fetchall()
+            if int(number) in first_chunk
+        }
+
+    query = f"""
+    SELECT 0 AS chunk_index, COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*))
+    FROM {full_table}
+    """
+    cursor.execute(" ".join(query.strip().split()))
+    return {
+        int(idx): (int(rows), int(checksum or 0))
+        for idx, rows, checksum in cursor.fetchall()
+    }
+
+
+def key_range_predicate(pk_columns, lower, upper):
+    """Keys from lower (literals, None for no bound) up to, not including, upper."""
+    where = []
+    if lower:
+        where.append(literals_at_least(pk_columns, lower))
+    if upper:
+        where.append(f"NOT {literals_at_least(pk_columns, upper)}")
+    return " AND ".join(where)
+
+
+def split_key_range(cursor, full_table, pk_columns, rows_per_chunk, predicate=""):
+    """
+    The keys, as literals, that split the rows matching predicate into
+    ranges of rows_per_chunk rows: every rows_per_chunk-th key but the first.
+    """
+    keys = ", ".join(f"[{col}]" for col in pk_columns)
+    query = """
+    SELECT {keys}
+    FROM (
+        SELECT {keys}, ROW_NUMBER() OVER (ORDER BY {keys}) AS rn
+        FROM {full_table}
+        WHERE {where}
+    ) t
+    WHERE (rn - 1) % {rows_per_chunk} = 0 AND rn > 1
+    ORDER BY rn
+    """
+    cursor.execute(
+        flat_query(
+            query,
+            keys=keys,
+            full_table=full_table,
+            where=predicate or "1 = 1",
+            rows_per_chunk=rows_per_chunk,
+        )
+    )
+    return [[sql_literal(value) for value in row] for row in cursor.fetchall()]
+
+
+def fingerprint_key_ranges(
+    cursor, schema, table, pk_columns, rows_per_chunk, boundaries=None
+):
+    """
+    Splits a table into ranges of its primary key and returns them as
+    [lower, rows, checksum], the first with no lower bound. The boundaries
+    of the previous run are kept, so an insert or delete only changes the
+    fingerprint of the range it falls in; a range grown past twice
+    rows_per_chunk is split again and an empty one merged with the range
+    before it. Without boundaries the table is split as planned.
+    """
+    full_table = f"[{schema}].[{table}]"
+
+    def fingerprint(predicate):
+        where = f" WHERE {predicate}" if predicate else ""
+        cursor.execute(
+            f"SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) "
+            f"FROM {full_table}{where}"
+        )
+        rows, checksum = cursor.fetchone()
+        return int(rows), int(checksum or 0)
+
+    if boundaries is None:
+        boundaries = split_key_range(cursor, full_table, pk_columns, rows_per_chunk)
+
+    ranges = []
+    for lower, upper in zip([None, *boundaries], [*boundaries, None]):
+        predicate = key_range_predicate(pk_columns, lower, upper)
+        rows, checksum = fingerprint(predicate)
+        if rows <= 2 * rows_per_chunk:
+            ranges.append([lower, rows, checksum])
+            continue
+        edges = [
+            lower,
+            *split_key_range(cursor, full_table, pk_columns, rows_per_chunk, predicate),
+            upper,
+        ]
+        for low, high in pairwise(edges):
+            ranges.append(
+                [low, *fingerprint(key_range_predicate(pk_columns, low, high))]
+            )
+
+    merged = []
+    for lower, rows, checksum in ranges:
+        if merged and not rows:
+            continue
+        if merged and not merged[-1][1]:
+            # The table's first range is empty: it takes this one's rows
+            merged[-1] = [merged[-1][0], rows, checksum]
+            continue
+        merged.append([lower, rows, checksum])
+    return merged
+
+
+def plan_fingerprinted_chunks(plan, schema, table, pk_columns, ranges, output_path_for):
+    """
+    Replaces the ROW_NUMBER() chunks of an unpartitioned table by chunks of
+    its key ranges, keeping the tags (encoding profile, LOB columns, ...) the
+    planned chunks had. Returns {chunk_index: (rows, checksum)}.
+    """
+    template = plan["chunks"][0]
+    rows = sum(rows for _, rows, _ in ranges)
+    kb_per_row = sum(c.get("estimated_kb", 0.0) for c in plan["chunks"]) / max(rows, 1)
+    uppers = [lower for lower, _, _ in ranges[1:]] + [None]
+    chunks, fingerprints = [], {}
+    for chunk_index, ((lower, rows, checksum), upper) in enumerate(zip(ranges, uppers)):
+        query = f"SELECT {plan['select_list']} FROM [{schema}].[{table}]"
+        predicate = key_range_predicate(pk_columns, lower, upper)
+        if predicate:
+            query = f"{query} WHERE {predicate}"
+        chunks.append(
+            {
+                **template,
+                "query": query,
+                "chunk_index": chunk_index,
+                "output_path": output_path_for(chunk_index),
+                "estimated_kb": round(rows * kb_per_row, 1),
+            }
+        )
+        fingerprints[chunk_index] = (rows, checksum)
+    plan["chunks"] = chunks
+    return fingerprints
+
+
+def load_fingerprint_store(bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+        return json.loads(response["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return {"chunks": {}}
+
+
+def skip_unchanged_chunks_for(
+    cursor,
+    schema,
+    table,
+    pk_columns,
+    plan,
+    db_name,
+    bucket,
+    extraction_timestamp,
+    output_path_for,
+):
+    """
+    Compares the planned chunks with the fingerprints stored by the previous
+    run. Unchanged chunks are not exported: their previous data file is
+    copied to the chunk's new output path instead.
+    Tables with a primary key and no partitions are chunked by the key
+    ranges of the previous run, so that rows inserted or deleted only change
+    the chunks they fall in; partitioned tables are compared by ROW_NUMBER()
+    position within each partition.
+    Returns the chunks still to export and the S3 keys carried forward.
+    """
+    if not plan["chunks"]:
+        return plan["chunks"], set()
+    if has_uncomparable_columns(cursor, schema, table):
+        logger.info(f"Not fingerprinting {schema}.{table}: non-comparable columns")
+        return plan["chunks"], set()
+
+    store_key = f"chunk_fingerprints/{db_name}/{table}.json"
+    store = load_fingerprint_store(bucket, store_key)
+    previous = store["chunks"]
+
+    key_ranges = None
+    if pk_columns and "select_list" in plan:
+        boundaries = None
+        if store.get("key_columns") == list(pk_columns):
+            boundaries = store.get("boundaries")
+        key_ranges = fingerprint_key_ranges(
+            cursor, schema, table, pk_columns, plan["rows_per_chunk"], boundaries
+        )
+        fingerprints = plan_fingerprinted_chunks(
+            plan, schema, table, pk_columns, key_ranges, output_path_for
+        )
+    else:
+        fingerprints = get_chunk_fingerprints(
+            cursor,
+            schema,
+            table,
+            pk_columns,
+            plan["rows_per_chunk"],
+            plan.get("partitioning"),
+        )
+
+    to_export, carried_keys, stored = [], set(), {}
+    for chunk in plan["chunks"]:
+        rows, checksum = fingerprints.get(chunk["chunk_index"], (0, 0))
+        new_key = urlparse(chunk["output_path"]).path.lstrip("/")
+        stored[chunk["query"]] = {
+            "rows": rows,
+            "checksum": checksum,
+            "output_path": chunk["output_path"],
+        }
+        old = previous.get(chunk["query"])
+        if old and old["rows"] == rows and old["checksum"] == checksum:
+            old_key = urlparse(old["output_path"]).path.lstrip("/")
+            try:
+                s3.copy_object(
+                    Bucket=bucket,
+                    Key=new_key,
+                    CopySource={"Bucket": bucket, "Key": old_key},
+                )
+                carried_keys.add(new_key)
+                continue
+            except Exception as e:
+                logger.warning(f"Cannot carry forward {old_key}, re-exporting: {e}")
+        to_export.append(chunk)
+
+    store = {"extraction_timestamp": extraction_timestamp, "chunks": stored}
+    if key_ranges:
+        store["key_columns"] = list(pk_columns)
+        store["boundaries"] = [lower for lower, _, _ in key_ranges[1:]]
+    s3.put_object(Bucket=bucket, Key=store_key, Body=json.dumps(store))
+    logger.info(
+        f"{schema}.{table}: {len(carried_keys)} unchanged chunks carried forward, "
+        f"{len(to_export)} to export"
+    )
+    return to_export, carried_keys
+
+
+def record_table_stats(df, db_name, output_bucket):
+    """
+    Recreates the table_export_validation Iceberg table with the source row
+    count of every table, through per-batch staging tables.
+    """
+    unique_tables = df["table_name"].unique()
+    batch_size = 90
+    num_batches = math.ceil(len(unique_tables) / batch_size)
+
+    # Drop staging and main validation database tables
+    for i in range(num_batches):
+        staging_table_name = f"staging_table_export_validation_batch_{i}"
+        drop_table_and_data(db_name, staging_table_name, output_bucket)
+
+    drop_table_and_data(db_name, "staging_table_export_validation", output_bucket)
+    drop_table_and_data(db_name, "table_export_validation", output_bucket)
+
+    # Log Table stats for all the database tables
+    create_query = f"""
+        CREATE TABLE IF NOT EXISTS {db_name}.table_export_validation (
+        table_name STRING,
+        original_row_count BIGINT,
+        exported_row_count BIGINT,
+        extraction_timestamp STRING
+        )
+        PARTITIONED BY (table_name)
+        LOCATION 's3://{output_bucket}/table_export_validation/'
+        TBLPROPERTIES (
+        'table_type' = 'ICEBERG',
+        'format' = 'parquet'
+        )
+        """
+    run_athena_query(create_query, db_name, output_bucket)
+    logger.info("Ensured Iceberg table_export_validation exists.")
+
+    columns_types = {
+        "table_name": "string",
+        "original_row_count": "bigint",
+        "exported_row_count": "bigint",
+        "extraction_timestamp": "string",
+    }
+
+    # 1. Extract unique table names and split into chunks
+
+    for i in range(num_batches):
+        batch_tables = unique_tables[i * batch_size : (i + 1) * batch_size]
+        batch_df = df[df["table_name"].isin(batch_tables)]
+
+        staging_table_name = f"staging_table_export_validation_batch_{i}"
+        staging_path = f"s3://{output_bucket}/staging_table_export_validation/"
+
+        logger.info(
+            f"Processing batch {i + 1}/{num_batches}: {len(batch_tables)} tables"
+        )
+
+        # 2. Write batch to S3
+        with telemetry.phase("Write"):
+            wr.s3.to_parquet(
+                df=batch_df, path=staging_path, dataset=True, mode="overwrite"
+            )
+
+        # 3. Register as a Glue table
+        with telemetry.phase("Glue"):
+            wr.catalog.create_parquet_table(
+                database=db_name,
+                table=staging_table_name,
+                path=staging_path,
+                columns_types=columns_types,
+                mode="overwrite",
+            )
+
+        # 4. Insert into Iceberg table using Athena
+        insert_query = f"""
+        INSERT INTO "{db_name}".table_export_validation
+        SELECT * FROM "{db_name}".{staging_table_name}
+        """
+        run_athena_query(insert_query, db_name, output_bucket)
+
+        logger.info(f"Inserted batch {i + 1} successfully")
+
+
+@telemetry.instrument("database-export-scanner")
 def handler(event, context):
     # Retrieve configuration from environment variables
     db_endpoint = event["db_endpoint"]
@@ -387,13 +1879,75 @@ def handler(event, context):
     extraction_timestamp = event["extraction_timestamp"]
     tables_to_export = event["tables_to_export"]
     output_parquet_file_size = float(os.environ["OUTPUT_PARQUET_FILE_SIZE"])
+    output_table_format = os.environ.get("OUTPUT_TABLE_FORMAT", "parquet")
+    skip_unchanged_chunks = (
+        os.environ.get("SKIP_UNCHANGED_CHUNKS", "false").lower() == "true"
+    )
+    snapshot_retention_seconds = int(
+        os.environ.get("ICEBERG_SNAPSHOT_RETENTION_SECONDS", "86400")
+    )
+    # {"schema.view": [ordered key columns]} of views exported as tables
+    views_to_export = json.loads(os.environ.get("VIEWS_TO_EXPORT", "{}") or "{}")
+    # {"schema.table": [ordered key columns]} for tables without a primary key
+    chunk_keys = json.loads(os.environ.get("CHUNK_KEYS", "{}") or "{}")
+    # {"schema.table" or "table": profile} and [{"min_size_mb", "profile"}]
+    table_encoding_profiles = json.loads(
+        os.environ.get("TABLE_ENCODING_PROFILES", "{}") or "{}"
+    )
+    encoding_size_classes = json.loads(
+        os.environ.get("ENCODING_PROFILE_SIZE_CLASSES", "[]") or "[]"
+    )
+    check_encoding_profiles(
+        table_encoding_profiles,
+        encoding_size_classes,
+        json.loads(os.environ.get("ENCODING_PROFILES", "{}") or "{}"),
+    )
+    # {"schema.table" or "table": {"column", "granularity"}} of tables whose
+    # output is partitioned by a date column
+    output_partitioning = json.loads(
+        os.environ.get("OUTPUT_PARTITIONING", "{}") or "{}"
+    )
+    max_output_partitions = int(
+        os.environ.get("MAX_OUTPUT_PARTITIONS", DEFAULT_MAX_OUTPUT_PARTITIONS)
+        or DEFAULT_MAX_OUTPUT_PARTITIONS
+    )
+    # {"schema.table" or "table": {"include_columns", "exclude_columns",
+    # "where"}} limiting the columns and rows exported
+    table_filters = json.loads(os.environ.get("TABLE_FILTERS", "{}") or "{}")
+    # Large values of LOB columns are exported to S3 objects of their own
+    offload_lobs = bool(
+        json.loads(os.environ.get("LOB_OFFLOAD", "{}") or "{}").get("enabled")
+    )
+    # SQL Server formats rowversions and converts binary and legacy text
+    # columns in the chunk queries, rather than the exporter in Python
+    server_side_projection = (
+        os.environ.get("SERVER_SIDE_PROJECTION", "false").lower() == "true"
+    )
+    if output_partitioning and output_table_format == "iceberg":
+        logger.warning("OUTPUT_PARTITIONING is ignored for Iceberg output")
+        output_partitioning = {}
+    max_concurrency = int(
+        event.get("max_concurrency") or os.environ.get("MAX_CONCURRENCY", "5")
+    )
+    # Plans the export and predicts its duration and cost without writing
+    # to Glue, S3 or the progress table
+    plan_only = bool(event.get("plan_only"))
+    export_memory_mb = int(os.environ.get("EXPORT_MEMORY_MB", "4096"))
+    export_kb_per_s = float(
+        os.environ.get("EXPORT_KB_PER_S", DEFAULT_EXPORT_KB_PER_S)
+        or DEFAULT_EXPORT_KB_PER_S
+    )
+    telemetry.set_dimensions(Database=db_name)
 
     # Check that the glue db exists, if not create it
-    ensure_glue_database(glue, db_name, description=f"Catalog for {db_name}")
+    if not plan_only:
+        with telemetry.phase("Glue"):
+            ensure_glue_database(glue, db_name, description=f"Catalog for {db_name}")
 
     # Fetch credentials from AWS Secrets Manager
     try:
-        secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
+        with telemetry.phase("SecretFetch"):
+            secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
         db_password = secret_response["SecretString"]
     except Exception as e:
         logger.error("Error fetching secret: %s", e)
@@ -402,9 +1956,13 @@ def handler(event, context):
     time.sleep(0.5)
 
     try:
-        conn = pymssql.connect(
-            server=db_endpoint, user=db_username, password=db_password, database=db_name
-        )
+        with telemetry.phase("Connect"):
+            conn = pymssql.connect(
+                server=db_endpoint,
+                user=db_username,
+                password=db_password,
+                database=db_name,
+            )
         query = f"""
         SELECT
             t.name AS table_name,
@@ -420,86 +1978,18 @@ def handler(event, context):
         GROUP BY s.name, t.name, p.rows
         """
 
-        df = pd.read_sql_query(query, conn)
+        with telemetry.phase("Query"):
+            df = pd.read_sql_query(query, conn)
         logger.info("Table stats:\n%s", df.to_string(index=False))
 
-        unique_tables = df["table_name"].unique()
-        batch_size = 90
-        num_batches = math.ceil(len(unique_tables) / batch_size)
-
-        # Drop staging and main validation database tables
-        for i in range(num_batches):
-            staging_table_name = f"staging_table_export_validation_batch_{i}"
-            drop_table_and_data(db_name, staging_table_name, output_bucket)
-
-        drop_table_and_data(db_name, "staging_table_export_validation", output_bucket)
-        drop_table_and_data(db_name, "table_export_validation", output_bucket)
-
-        # Log Table stats for all the database tables
-        create_query = f"""
-            CREATE TABLE IF NOT EXISTS {db_name}.table_export_validation (
-            table_name STRING,
-            original_row_count BIGINT,
-            exported_row_count BIGINT,
-            extraction_timestamp STRING
-            )
-            PARTITIONED BY (table_name)
-            LOCATION 's3://{output_bucket}/table_export_validation/'
-            TBLPROPERTIES (
-            'table_type' = 'ICEBERG',
-            'format' = 'parquet'
-            )
-            """
-        run_athena_query(create_query, db_name, output_bucket)
-        logger.info("Ensured Iceberg table_export_validation exists.")
-
-        columns_types = {
-            "table_name": "string",
-            "original_row_count": "bigint",
-            "exported_row_count": "bigint",
-            "extraction_timestamp": "string",
-        }
-
-        # 1. Extract unique table names and split into chunks
-
-        for i in range(num_batches):
-            batch_tables = unique_tables[i * batch_size : (i + 1) * batch_size]
-            batch_df = df[df["table_name"].isin(batch_tables)]
-
-            staging_table_name = f"staging_table_export_validation_batch_{i}"
-            staging_path = f"s3://{output_bucket}/staging_table_export_validation/"
-
-            logger.info(
-                f"Processing batch {i + 1}/{num_batches}: {len(batch_tables)} tables"
-            )
-
-            # 2. Write batch to S3
-            wr.s3.to_parquet(
-                df=batch_df, path=staging_path, dataset=True, mode="overwrite"
-            )
-
-            # 3. Register as a Glue table
-            wr.catalog.create_parquet_table(
+        with telemetry.phase("Connect"):
+            conn = pymssql.connect(
+                server=db_endpoint,
+                user=db_username,
+                password=db_password,
                 database=db_name,
-                table=staging_table_name,
-                path=staging_path,
-                columns_types=columns_types,
-                mode="overwrite",
             )
 
-            # 4. Insert into Iceberg table using Athena
-            insert_query = f"""
-            INSERT INTO "{db_name}".table_export_validation
-            SELECT * FROM "{db_name}".{staging_table_name}
-            """
-            run_athena_query(insert_query, db_name, output_bucket)
-
-            logger.info(f"Inserted batch {i + 1} successfully")
-
-        conn = pymssql.connect(
-            server=db_endpoint, user=db_username, password=db_password, database=db_name
-        )
-
         cursor = conn.cursor()
 
         # get all schemas
@@ -532,100 +2022,317 @@ def handler(event, context):
         else:
             logger.info("No tables_to_export provided — using all pk_map entries")
 
-        # Create glue tables for each schema.table
-        for full_table, pk_columns in pk_map.items():
-            table_prop = {
-                "classification": "parquet",
-                "source_primary_key": ", ".join(pk_columns),
-                "extraction_key": "extraction_timestamp",
-                "extraction_timestamp_column_name": "extraction_timestamp",
-                "extraction_timestamp_column_dtype": "string",
-            }
-            schema, table = full_table.split(".")
-            delete_glue_table(
-                glue_db=db_name,
-                table_name=table,
-                database_refresh_mode=database_refresh_mode,
-            )
-            logger.info(f"Creating glue table: {full_table}")
-            create_glue_table(
-                database_refresh_mode,
-                db_name,
-                schema,
-                table,
-                glue_db=db_name,
-                bucket=output_bucket,
-                table_properties=table_prop,
-                cursor=cursor,
-            )
+        # Tables without a primary key are split by their key in CHUNK_KEYS
+        keyed_tables = {
+            full_table: chunk_keys[full_table]
+            for full_table, pk_columns in pk_map.items()
+            if not pk_columns and chunk_keys.get(full_table)
+        }
 
-        chunks = []
+        # Plan the chunks of each schema.table
+        table_plans = {}
+        resolved_filters = {}
+        table_lob_columns = {}
         for full_table, pk_columns in pk_map.items():
+            if full_table in keyed_tables:
+                continue
             schema, table = full_table.split(".")
-            rows, size_kb = get_table_stats(cursor, schema, table)
-
-            # Calculate the number of chunks
-            rows, size_kb = get_table_stats(cursor, schema, table)
-            if not rows or rows == 0:
-                logger.info(
-                    f"Skipping row size calculation: rows={rows}, table={table}"
+            with telemetry.phase("Plan"):
+                table_filter = resolve_table_filter(
+                    cursor,
+                    schema,
+                    table,
+                    table_filters.get(full_table) or table_filters.get(table),
                 )
-                row_size_kb = 0
-            else:
-                row_size_kb = size_kb / rows
-
-            parquet_row_kb, rows_for_limit_parquet = calculate_rows_per_chunk(
-                row_count=rows, size_kb=size_kb, target_mb=output_parquet_file_size
+                if table_filter:
+                    resolved_filters[full_table] = table_filter
+                if offload_lobs:
+                    table_lob_columns[full_table] = get_lob_columns(
+                        cursor, schema, table, table_filter
+                    )
+                if server_side_projection:
+                    table_filter = table_filter or {"columns": None, "where": None}
+                    table_filter["projection"] = get_projection(
+                        cursor,
+                        schema,
+                        table,
+                        table_filter,
+                        table_lob_columns.get(full_table, []),
+                    )
+                table_plans[full_table] = plan_table_chunks(
+                    cursor,
+                    schema,
+                    table,
+                    pk_columns,
+                    output_parquet_file_size,
+                    lambda chunk_index, partition_path="", table=table: (
+                        get_chunk_output_path(
+                            output_table_format,
+                            database_refresh_mode,
+                            output_bucket,
+                            db_name,
+                            table,
+                            extraction_timestamp,
+                            chunk_index,
+                            partition_path,
+                        )
+                    ),
+                    db_name,
+                    extraction_timestamp,
+                    output_partitioning.get(full_table)
+                    or output_partitioning.get(table),
+                    max_output_partitions,
+                    table_filter,
+                )
+            assign_encoding_profile(
+                table_plans[full_table],
+                full_table,
+                pk_columns,
+                table_encoding_profiles,
+                encoding_size_classes,
             )
-
-            num_chunks = (
-                (rows + rows_for_limit_parquet - 1) // rows_for_limit_parquet
-                if rows_for_limit_parquet
-                else 1
+            if offload_lobs:
+                assign_lob_columns(
+                    table_plans[full_table], table_lob_columns[full_table]
+                )
+            if server_side_projection:
+                mark_projected(table_plans[full_table])
+
+        # Carry forward the files of chunks unchanged since the previous run
+        carried_paths = {}
+        if skip_unchanged_chunks and database_refresh_mode == "full" and not plan_only:
+            for full_table, plan in table_plans.items():
+                # Fingerprints are computed over the table's key ranges and
+                # whole rows, which output partitions and table filters do
+                # not follow
+                if "output_partitioning" in plan or full_table in resolved_filters:
+                    continue
+                schema, table = full_table.split(".")
+                with telemetry.phase("ChunkFingerprint"):
+                    plan["chunks"], carried_paths[full_table] = (
+                        skip_unchanged_chunks_for(
+                            cursor,
+                            schema,
+                            table,
+                            pk_map[full_table],
+                            plan,
+                            db_name,
+                            output_bucket,
+                            extraction_timestamp,
+                            lambda chunk_index, table=table: get_chunk_output_path(
+                                output_table_format,
+                                database_refresh_mode,
+                                output_bucket,
+                                db_name,
+                                table,
+                                extraction_timestamp,
+                                chunk_index,
+                            ),
+                        )
+                    )
+
+        # Plan the selected views and keyed tables without a primary key by
+        # ranges of their key columns
+        for full_view, key_columns in {**keyed_tables, **views_to_export}.items():
+            schema, view = full_view.split(".")
+            with telemetry.phase("Plan"):
+                table_filter = resolve_table_filter(
+                    cursor,
+                    schema,
+                    view,
+                    table_filters.get(full_view) or table_filters.get(view),
+                )
+                if table_filter:
+                    resolved_filters[full_view] = table_filter
+                if offload_lobs:
+                    table_lob_columns[full_view] = get_lob_columns(
+                        cursor, schema, view, table_filter
+                    )
+                if server_side_projection:
+                    table_filter = table_filter or {"columns": None, "where": None}
+                    table_filter["projection"] = get_projection(
+                        cursor,
+                        schema,
+                        view,
+                        table_filter,
+                        table_lob_columns.get(full_view, []),
+                    )
+                table_plans[full_view] = plan_key_range_chunks(
+                    cursor,
+                    schema,
+                    view,
+                    key_columns,
+                    output_parquet_file_size,
+                    lambda chunk_index, view=view: get_chunk_output_path(
+                        output_table_format,
+                        database_refresh_mode,
+                        output_bucket,
+                        db_name,
+                        view,
+                        extraction_timestamp,
+                        chunk_index,
+                    ),
+                    db_name,
+                    table_filter,
+                )
+            assign_encoding_profile(
+                table_plans[full_view],
+                full_view,
+                key_columns,
+                table_encoding_profiles,
+                encoding_size_classes,
             )
+            if offload_lobs:
+                assign_lob_columns(table_plans[full_view], table_lob_columns[full_view])
+            if server_side_projection:
+                mark_projected(table_plans[full_view])
+
+        # Tables exported with a row filter are validated against the number
+        # of rows matching it
+        for full_table, table_filter in resolved_filters.items():
+            if "rows" in table_filter:
+                table = full_table.split(".")[1]
+                df = pd.concat(
+                    [
+                        df[df["table_name"] != table],
+                        pd.DataFrame(
+                            [
+                                {
+                                    "table_name": table,
+                                    "original_row_count": table_filter["rows"],
+                                    "exported_row_count": None,
+                                    "extraction_timestamp": extraction_timestamp,
+                                }
+                            ]
+                        ),
+                    ],
+                    ignore_index=True,
+                )
 
-            logger.info("-" * 90)
-            logger.info(
-                f"{'Table':<40} {'Rows':>10} {'Chunks':>8} {'SQL KB/Row':>12} {'Parquet KB/Row':>16}"
+        if plan_only:
+            cursor.close()
+            table_rows = df.groupby("table_name")["original_row_count"].sum()
+            history = get_historical_throughput(db_name, output_bucket)
+            plan = summarise_plan(
+                table_plans,
+                {table: int(rows) for table, rows in table_rows.items()},
+                history,
+                max_concurrency,
+                export_kb_per_s,
+                export_memory_mb,
             )
             logger.info(
-                f"{full_table:<40} {rows:>10} {num_chunks:>8} {row_size_kb:>12.4f} {parquet_row_kb:>16.4f}"
+                f"Plan only: {plan['chunks']} chunks, predicted export time "
+                f"{plan['predicted_makespan_s']:.0f}s at concurrency "
+                f"{max_concurrency}, {plan['predicted_lambda_s']:.0f} "
+                f"Lambda-seconds, ${plan['estimated_cost_usd']}"
             )
-            logger.info("-" * 90)
+            telemetry.count(
+                "PredictedMakespan", plan["predicted_makespan_s"], "Seconds"
+            )
+            return plan
+
+        # Source row counts for the export validation, which plan-only runs
+        # leave untouched
+        record_table_stats(df, db_name, output_bucket)
 
-            if rows == 0 or rows_for_limit_parquet == 0:
+        # Create glue tables for each schema.table and exported view
+        for full_table, pk_columns in {**pk_map, **views_to_export}.items():
+            table_prop = {
+                "classification": "parquet",
+                "source_primary_key": ", ".join(pk_columns),
+                "extraction_key": "extraction_timestamp",
+                "extraction_timestamp_column_name": "extraction_timestamp",
+                "extraction_timestamp_column_dtype": "string",
+            }
+            table_filter = resolved_filters.get(full_table) or {}
+            if table_filter.get("where"):
+                table_prop["source_row_filter"] = table_filter["where"]
+            include_columns = table_filter.get("columns")
+            lob_columns = table_lob_columns.get(full_table, [])
+            if lob_columns:
+                table_prop["source_lob_columns"] = ", ".join(lob_columns)
+            schema, table = full_table.split(".")
+            if output_table_format == "iceberg":
+                logger.info(f"Creating iceberg table: {full_table}")
+                with telemetry.phase("Glue"):
+                    create_iceberg_table(
+                        database_refresh_mode,
+                        db_name,
+                        schema,
+                        table,
+                        bucket=output_bucket,
+                        snapshot_retention_seconds=snapshot_retention_seconds,
+                        cursor=cursor,
+                        include_columns=include_columns,
+                        lob_columns=lob_columns,
+                    )
                 continue
 
-            if rows > 0 and not pk_columns:
-                query = f"SELECT * FROM [{schema}].[{table}]"
-                chunks.append(
-                    {
-                        "database": db_name,
-                        "table": table,
-                        "extraction_timestamp": extraction_timestamp,
-                        "query": query,
-                    }
+            plan = table_plans.get(full_table, {})
+            partition_keys = plan.get("output_partitioning", {}).get("keys", [])
+            with telemetry.phase("Glue"):
+                delete_glue_table(
+                    glue_db=db_name,
+                    table_name=table,
+                    database_refresh_mode=database_refresh_mode,
+                    keep_paths=carried_paths.get(full_table, set()),
+                )
+                logger.info(f"Creating glue table: {full_table}")
+                create_glue_table(
+                    database_refresh_mode,
+                    db_name,
+                    schema,
+                    table,
+                    glue_db=db_name,
+                    bucket=output_bucket,
+                    table_properties=table_prop,
+                    cursor=cursor,
+                    partition_keys=partition_keys,
+                    include_columns=include_columns,
+                    lob_columns=lob_columns,
                 )
-                # skip the PK-based sampling/partitioning below
-                continue
 
-            if rows == 0 or rows_for_limit_parquet == 0:
-                continue
+        chunks = order_chunks_lpt(
+            [chunk for plan in table_plans.values() for chunk in plan["chunks"]],
+            export_kb_per_s,
+        )
+        makespan = predict_makespan(chunks, max_concurrency, export_kb_per_s)
+        logger.info(
+            f"Predicted export time {makespan:.0f}s for {len(chunks)} chunks "
+            f"at concurrency {max_concurrency}"
+        )
 
-            for chunk_index in range(num_chunks):
-                query = generate_chunk_query_by_rownum(
-                    schema, table, pk_columns, rows_for_limit_parquet, chunk_index
-                )
-                chunk_info = {
-                    "database": db_name,
-                    "table": table,
-                    "query": query,
-                }
-                chunks.append(chunk_info)
+        # Register the number of chunks of each table, so the chunk that
+        # completes a table can start its validation during the export
+        with telemetry.phase("Progress"):
+            progress.register_tables(
+                progress.run_id(db_name, extraction_timestamp),
+                {
+                    full_table.split(".")[1]: len(plan["chunks"])
+                    for full_table, plan in table_plans.items()
+                },
+            )
 
         # Close the cursor and connection
         cursor.close()
         logger.info(f"{len(chunks)} chunks to be processed")
-        return {"chunks": chunks}
+        telemetry.count("Tables", len(table_plans))
+        telemetry.count("Chunks", len(chunks))
+        telemetry.count(
+            "ChunksCarried", sum(len(keys) for keys in carried_paths.values())
+        )
+        # Every planned table is finalised and validated, including tables
+        # with no rows or with all chunks carried forward
+        tables = [
+            {"database": db_name, "table": full_table.split(".")[1]}
+            for full_table in table_plans
+        ]
+        telemetry.count("PredictedMakespan", round(makespan, 1), "Seconds")
+        return {
+            "chunks": chunks,
+            "tables": tables,
+            "predicted_makespan_s": round(makespan, 1),
+        }
     except Exception as e:
         raise e
@@ -1,17 +1,19 @@
 import os
-import boto3
 import pytds
 import logging
+import aws_clients
+import telemetry
 from datetime import datetime
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-secretmanager = boto3.client("secretsmanager")
+secretmanager = aws_clients.client("secretsmanager")
 
 
 # Restores the .bak file to the RDS DB Instance
+@telemetry.instrument("database-restore")
 def handler(event, context):
     # Retrieve configuration from environment variables
     db_endpoint = event["DescribeDBResult"]["DbInstanceDetails"]["Endpoint"]["Address"]
@@ -31,7 +33,8 @@ def handler(event, context):
 
     # Fetch credentials from AWS Secrets Manager
     try:
-        secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
+        with telemetry.phase("SecretFetch"):
+            secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
         db_password = secret_response["SecretString"]
     except Exception as e:
         logger.error("Error fetching secret: %s", e)
@@ -39,14 +42,15 @@ def handler(event, context):
 
     try:
         # Connect to the MS SQL Server database using python-tds
-        conn = pytds.connect(
-            server=db_endpoint,
-            database="master",
-            user=db_username,
-            password=db_password,
-            timeout=5,
-            autocommit=True,
-        )
+        with telemetry.phase("Connect"):
+            conn = pytds.connect(
+                server=db_endpoint,
+                database="master",
+                user=db_username,
+                password=db_password,
+                timeout=5,
+                autocommit=True,
+            )
         cursor = conn.cursor()
         logger.info("Connected to MS SQL Server successfully!")
 
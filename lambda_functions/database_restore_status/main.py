@@ -1,17 +1,19 @@
 import os
-import boto3
 import pytds
 import time
 import logging
+import aws_clients
+import telemetry
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-secretmanager = boto3.client("secretsmanager")
+secretmanager = aws_clients.client("secretsmanager")
 
 
 # Retrieves the status of the restore of the .bak file
+@telemetry.instrument("database-restore-status")
 def handler(event, context):
     # Retrieve configuration from environment variables
     db_endpoint = event["db_endpoint"]
@@ -22,7 +24,8 @@ def handler(event, context):
 
     # Fetch credentials from AWS Secrets Manager
     try:
-        secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
+        with telemetry.phase("SecretFetch"):
+            secret_response = secretmanager.get_secret_value(SecretId=db_pw_secret_arn)
         db_password = secret_response["SecretString"]
     except Exception as e:
         logger.error("Error fetching secret: %s", e)
@@ -32,13 +35,14 @@ def handler(event, context):
 
     try:
         # Connect to the MS SQL Server database using python-tds
-        conn = pytds.connect(
-            server=db_endpoint,
-            database="master",
-            user=db_username,
-            password=db_password,
-            timeout=5,
-        )
+        with telemetry.phase("Connect"):
+            conn = pytds.connect(
+                server=db_endpoint,
+                database="master",
+                user=db_username,
+                password=db_password,
+                timeout=5,
+            )
         cursor = conn.cursor()
         logger.info("Connected to MS SQL Server successfully!")
 
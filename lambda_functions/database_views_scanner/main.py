@@ -1,7 +1,8 @@
 import os
-import boto3
 import logging
 import pymssql
+import aws_clients
+import telemetry
 import pandas as pd
 import awswrangler as wr
 
@@ -10,7 +11,7 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 # AWS clients
-secretmanager = boto3.client("secretsmanager")
+secretmanager = aws_clients.client("secretsmanager")
 
 
 def get_secret_value(secret_arn: str) -> str:
@@ -23,6 +24,7 @@ def get_secret_value(secret_arn: str) -> str:
         raise
 
 
+@telemetry.instrument("database-views-scanner")
 def handler(event, context):
     # === Environment & Event Variables ===
     db_endpoint = event["db_endpoint"]
@@ -31,9 +33,11 @@ def handler(event, context):
     db_name = event["db_name"]
     extraction_timestamp = event["extraction_timestamp"]
     output_bucket = event["output_bucket"]
+    telemetry.set_dimensions(Database=db_name)
 
     # === Get Password ===
-    db_password = get_secret_value(db_pw_secret_arn)
+    with telemetry.phase("SecretFetch"):
+        db_password = get_secret_value(db_pw_secret_arn)
 
     # === Db_query ===
     db_query_views_description = """
@@ -49,15 +53,18 @@ def handler(event, context):
     # === Connect to SQL Server & Fetch Data ===
     try:
         logger.info(f"Connecting to {db_endpoint}, db: {db_name}")
-        conn = pymssql.connect(
-            server=db_endpoint,
-            user=db_username,
-            password=db_password,
-            database=db_name,
-            tds_version="7.4",
-        )
-
-        df = pd.read_sql_query(db_query_views_description, conn)
+        with telemetry.phase("Connect"):
+            conn = pymssql.connect(
+                server=db_endpoint,
+                user=db_username,
+                password=db_password,
+                database=db_name,
+                tds_version="7.4",
+            )
+
+        with telemetry.phase("Query"):
+            df = pd.read_sql_query(db_query_views_description, conn)
+        telemetry.count("Rows", len(df))
         view_count = len(df)
         logger.info(f"Fetched {view_count} view descriptions from {db_name}")
 
@@ -78,14 +85,15 @@ def handler(event, context):
         output_path = f"s3://{output_bucket}/{db_name}/{table_name}/"
         logger.info(f"Writing to S3: {output_path}")
 
-        wr.s3.to_parquet(
-            df=df,
-            path=output_path,
-            database=db_name,
-            table=table_name,
-            dataset=True,
-            mode="overwrite",
-        )
+        with telemetry.phase("Write"):
+            wr.s3.to_parquet(
+                df=df,
+                path=output_path,
+                database=db_name,
+                table=table_name,
+                dataset=True,
+                mode="overwrite",
+            )
 
         logger.info(
             f"Database view descriptions table written successfully to {output_path}"
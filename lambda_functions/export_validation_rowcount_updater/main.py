@@ -1,18 +1,20 @@
 import os
 import logging
-import boto3
 import time
+import aws_clients
+import telemetry
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-athena = boto3.client("athena")
+athena = aws_clients.client("athena")
 
 # Queries the exported data in Athena
 # Returns the row count of each table exported
 # Writes the row count to the row_count_table in Athena
 
 
+@telemetry.phase("AthenaQuery")
 def run_athena_query(query, database, bucket):
     response = athena.start_query_execution(
         QueryString=query,
@@ -43,11 +45,13 @@ def get_query_result(query_id):
         return "0"
 
 
+@telemetry.instrument("export-validation-rowcount-updater")
 def handler(event, context):
     chunk = event["chunk"]
     db_name = chunk["database"]
     db_table = chunk["table"]
     extraction_timestamp = chunk["extraction_timestamp"]
+    telemetry.set_dimensions(Database=db_name, Table=db_table)
 
     stats_table = "table_export_validation"
     output_bucket = os.environ["OUTPUT_BUCKET"]
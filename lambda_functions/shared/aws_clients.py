@@ -0,0 +1,264 @@
+"""
+boto3 clients for the Lambdas that handle API throttling, configured by the
+API_CLIENTS JSON:
+
+    s3 = aws_clients.client("s3")
+
+Up to max_concurrency export Lambdas call Glue, Athena and Secrets Manager
+at once, and a throttled call that fails the task costs a state machine
+retry. Clients made here instead:
+
+    retry   in botocore's adaptive mode, which backs off and slows the
+            client down when it is throttled, up to max_attempts attempts
+    limit   calls to a service in rate_limits to that many per second,
+            from a token bucket shared by every client of the process
+    count   throttled attempts as the Throttles metric and, per service,
+            e.g. GlueThrottles, whether or not the retry then succeeds
+    reuse   the response of an identical earlier or in-flight read in
+            COALESCED_OPERATIONS, such as the repeated get_table calls,
+            counted as CoalescedCalls. A write to the service, or an
+            Athena query for Glue, discards its reused responses, so a
+            read after a write is made again.
+
+Reused responses are discarded at the start of every invocation, via
+telemetry.start(), except those of KEPT_OPERATIONS: a warm Lambda reuses
+its get_secret_value response for reuse_ttl_s seconds, rather than
+fetching the secret again on every invocation.
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from typing import Any
+
+import boto3
+import telemetry
+from botocore.config import Config
+
+# Settings when API_CLIENTS does not set them
+DEFAULT_API_CLIENTS = {
+    "max_attempts": 10,
+    # Calls per second by boto3 service name; services left out are not limited
+    "rate_limits": {},
+    "coalesce": True,
+    # Seconds KEPT_OPERATIONS responses are reused across invocations; 0
+    # still reuses them within an invocation
+    "reuse_ttl_s": 300,
+}
+
+# Reads whose responses are reused within an invocation, by service name
+COALESCED_OPERATIONS = {
+    "glue": ("GetTable", "GetDatabase"),
+    "secretsmanager": ("GetSecretValue",),
+}
+
+# Reads whose responses are also reused by later invocations, up to
+# reuse_ttl_s seconds old: 0 reuses them within the invocation only
+KEPT_OPERATIONS = {"secretsmanager": ("GetSecretValue",)}
+
+# Operations that do not discard reused responses
+READ_PREFIXES = ("Get", "List", "Describe", "Head", "Search", "BatchGet")
+
+# Services whose writes also change another's resources: Athena DDL
+# creates, alters and drops Glue tables
+ALSO_WRITES = {"athena": ("glue",)}
+
+# Error codes of throttled calls, as botocore's retry handler treats them
+THROTTLING_CODES = (
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "SlowDown",
+    "LimitExceededException",
+)
+
+# Seconds a call waits for an identical in-flight call before making its own
+COALESCE_WAIT_S = 60
+
+_lock = threading.Lock()
+_buckets: dict[str, "TokenBucket"] = {}
+# (service, operation, url path, body) -> (http response, parsed, expires),
+# where expires is when reset() discards a KEPT_OPERATIONS response
+_responses: dict[tuple[str, str, str, str], tuple[Any, dict, float]] = {}
+_in_flight: dict[tuple[str, str, str, str], threading.Event] = {}
+# Writes per service, so that a read in flight during a write is not reused
+_writes: dict[str, int] = {}
+
+
+def load_settings() -> dict:
+    """Reads the API_CLIENTS JSON; settings left out keep their default."""
+    settings = json.loads(os.environ.get("API_CLIENTS", "{}") or "{}")
+    return {**DEFAULT_API_CLIENTS, **settings}
+
+
+class TokenBucket:
+    """Allows `rate` calls per second, in bursts of up to a second's worth."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def reset():
+    """
+    Discards the reused responses, e.g. at the start of an invocation, but
+    those of KEPT_OPERATIONS until they expire.
+    """
+    now = time.monotonic()
+    with _lock:
+        for key in list(_responses):
+            if not _kept(key) or _responses[key][2] <= now:
+                del _responses[key]
+
+
+def _kept(key: tuple) -> bool:
+    return key[1] in KEPT_OPERATIONS.get(key[0], ())
+
+
+telemetry.on_start(reset)
+
+
+def client(service: str, **kwargs):
+    """A boto3 client of `service` from the default session, see above."""
+    settings = load_settings()
+    config = Config(
+        retries={"mode": "adaptive", "max_attempts": settings["max_attempts"]}
+    )
+    if "config" in kwargs:
+        config = config.merge(kwargs.pop("config"))
+    new_client = boto3.client(service, config=config, **kwargs)
+
+    events = new_client.meta.events
+    service_id = new_client.meta.service_model.service_id.hyphenize()
+    rate = settings["rate_limits"].get(service)
+    if settings["coalesce"] or rate:
+        events.register(
+            f"before-call.{service_id}",
+            _before_call(service, rate, settings["coalesce"], settings["reuse_ttl_s"]),
+        )
+    if settings["coalesce"]:
+        events.register(f"after-call.{service_id}", _after_call)
+        events.register(f"after-call-error.{service_id}", _after_call_error)
+    events.register(f"needs-retry.{service_id}", _count_throttles)
+    return new_client
+
+
+def _bucket(service: str, rate: float) -> TokenBucket:
+    with _lock:
+        if service not in _buckets:
+            _buckets[service] = TokenBucket(rate)
+        return _buckets[service]
+
+
+def _before_call(service: str, rate: float | None, coalesce: bool, ttl: float):
+    bucket = _bucket(service, rate) if rate else None
+
+    def handler(model, params, context, **kwargs):
+        if coalesce and model.name in COALESCED_OPERATIONS.get(service, ()):
+            key = (service, model.name, params["url_path"], repr(params["body"]))
+            cached, claimed = _reuse(key)
+            if cached is not None:
+                context["coalesced"] = True
+                telemetry.count("CoalescedCalls", 1)
+                http, parsed, _ = cached
+                return http, copy.deepcopy(parsed)
+            if claimed:
+                context["coalesce_key"] = key
+                context["coalesce_writes"] = _writes.get(service, 0)
+                if _kept(key):
+                    context["coalesce_ttl"] = ttl
+        elif coalesce and not model.name.startswith(READ_PREFIXES):
+            _discard(service)
+        if bucket:
+            bucket.acquire()
+
+    return handler
+
+
+def _reuse(key: tuple) -> tuple:
+    """
+    Returns (response, claimed): the response of an identical call, or None
+    and whether this call is the one the next identical calls wait for.
+    """
+    with _lock:
+        if key in _responses:
+            return _responses[key], False
+        in_flight = _in_flight.get(key)
+        if in_flight is None:
+            _in_flight[key] = threading.Event()
+            return None, True
+    # Another thread is making the same call: use its response if it succeeds
+    in_flight.wait(COALESCE_WAIT_S)
+    with _lock:
+        return _responses.get(key), False
+
+
+def _release(key: tuple, response: tuple | None = None, writes: int = 0):
+    with _lock:
+        if response is not None and _writes.get(key[0], 0) == writes:
+            _responses[key] = response
+        in_flight = _in_flight.pop(key, None)
+    if in_flight is not None:
+        in_flight.set()
+
+
+def _discard(service: str):
+    services = (service, *ALSO_WRITES.get(service, ()))
+    with _lock:
+        for written in services:
+            _writes[written] = _writes.get(written, 0) + 1
+        for key in [key for key in _responses if key[0] in services]:
+            del _responses[key]
+
+
+def _after_call(http_response, parsed, context, **kwargs):
+    key = context.pop("coalesce_key", None)
+    if key is None:
+        return
+    if http_response.status_code < 300:
+        expires = time.monotonic() + context.pop("coalesce_ttl", 0.0)
+        response = (http_response, copy.deepcopy(parsed), expires)
+        _release(key, response, context.pop("coalesce_writes", 0))
+    else:
+        _release(key)
+
+
+def _after_call_error(context, **kwargs):
+    key = context.pop("coalesce_key", None)
+    if key is not None:
+        _release(key)
+
+
+def _count_throttles(response, operation, **kwargs):
+    if response is None:
+        return
+    http, parsed = response
+    code = parsed.get("Error", {}).get("Code")
+    if code in THROTTLING_CODES or http.status_code == 429:
+        service_id = operation.service_model.service_id
+        telemetry.count("Throttles", 1)
+        telemetry.count(f"{str(service_id).replace(' ', '')}Throttles", 1)
@@ -0,0 +1,103 @@
+"""
+Per-table chunk completion tracking for an export run, in DynamoDB.
+
+The scanner registers each table with the number of chunks to export. Each
+exported chunk adds its index to the table's set of completed chunks, so a
+retried chunk is only counted once. The chunk that completes the set claims
+the table's validation, which then runs straight away rather than after the
+whole export Map:
+
+    progress.register_tables(run_id(db, ts), {"table": chunk_count, ...})
+    if progress.complete_chunk(run_id(db, ts), "table", chunk_index):
+        ...  # finalise and validate the table
+
+Tables whose chunks never all complete (no chunks, timed out chunks) are
+claimed with claim_table() by the sweep after the Map.
+
+The table name is read from EXPORT_PROGRESS_TABLE. DynamoDB Local can be
+used by setting AWS_ENDPOINT_URL_DYNAMODB.
+"""
+
+import os
+import time
+
+import aws_clients
+
+dynamodb = aws_clients.client("dynamodb")
+
+# Progress items are expired by DynamoDB TTL after a week
+RETENTION_SECONDS = 7 * 24 * 3600
+
+# claimed_by value used by the sweep after the export Map
+SWEEP = "sweep"
+
+
+def run_id(db_name: str, extraction_timestamp: str) -> str:
+    return f"{db_name}/{extraction_timestamp}"
+
+
+def _table_name() -> str:
+    return os.environ["EXPORT_PROGRESS_TABLE"]
+
+
+def register_tables(run: str, chunk_counts: dict):
+    """Records the number of chunks to export for each table of the run."""
+    expires_at = str(int(time.time()) + RETENTION_SECONDS)
+    items = [
+        {
+            "PutRequest": {
+                "Item": {
+                    "run": {"S": run},
+                    "table": {"S": table},
+                    "expected_chunks": {"N": str(count)},
+                    "expires_at": {"N": expires_at},
+                }
+            }
+        }
+        for table, count in chunk_counts.items()
+    ]
+    for i in range(0, len(items), 25):
+        pending = {_table_name(): items[i : i + 25]}
+        while pending:
+            response = dynamodb.batch_write_item(RequestItems=pending)
+            pending = response.get("UnprocessedItems")
+
+
+def claim_table(run: str, table: str, claimant: str) -> bool:
+    """
+    Claims the validation of a table, returning False if it has already been
+    claimed by someone else. The same claimant can claim it again, so a
+    retried chunk still triggers the validation.
+    """
+    try:
+        dynamodb.update_item(
+            TableName=_table_name(),
+            Key={"run": {"S": run}, "table": {"S": table}},
+            UpdateExpression="SET claimed_by = :claimant",
+            ConditionExpression="attribute_not_exists(claimed_by) OR claimed_by = :claimant",
+            ExpressionAttributeValues={":claimant": {"S": claimant}},
+        )
+        return True
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        return False
+
+
+def complete_chunk(run: str, table: str, chunk_index: int) -> bool:
+    """
+    Marks a chunk as exported. Returns True if it was the table's last
+    outstanding chunk and this chunk claimed the table's validation.
+    """
+    response = dynamodb.update_item(
+        TableName=_table_name(),
+        Key={"run": {"S": run}, "table": {"S": table}},
+        UpdateExpression="ADD completed_chunks :chunk",
+        ExpressionAttributeValues={":chunk": {"NS": [str(chunk_index)]}},
+        ReturnValues="ALL_NEW",
+    )
+    item = response["Attributes"]
+    if "expected_chunks" not in item:
+        return False
+    completed = len(item["completed_chunks"]["NS"])
+    if completed < int(item["expected_chunks"]["N"]):
+        return False
+    return claim_table(run, table, f"chunk-{chunk_index}")
@@ -0,0 +1,164 @@
+"""
+Per-phase performance telemetry for the Lambdas, written as CloudWatch
+Embedded Metric Format (EMF) log lines.
+
+CloudWatch extracts the metrics from the function's log group, so no
+PutMetricData calls or extra permissions are needed. Each invocation emits
+a single record:
+
+    @telemetry.instrument("database-export")
+    def handler(event, context):
+        telemetry.set_dimensions(Database=db_name, Table=db_table)
+        with telemetry.phase("Connect"):
+            conn = pymssql.connect(...)
+        telemetry.count("Rows", len(df))
+
+phase() also works as a function decorator. Phase timings are summed if a
+phase is entered more than once and are reported as "<Phase>Duration" in
+milliseconds. The handler's total time is reported as "Duration" and a
+failed invocation also reports "Errors".
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+# Dimensions used for every metric, in aggregation order
+DIMENSION_KEYS = ("Function", "Database", "Table")
+
+_record: dict | None = None
+
+# Called by start(), e.g. to discard per-invocation caches
+_start_hooks: list[Callable[[], None]] = []
+
+# Phases can run on worker threads, e.g. the exporter's upload pool
+_lock = threading.Lock()
+
+
+def _new_record(function: str) -> dict:
+    return {
+        "dimensions": {"Function": function},
+        "metrics": {},
+        "units": {},
+        "properties": {},
+    }
+
+
+def start(function: str, **dimensions):
+    """Starts a new metrics record, discarding any unflushed one."""
+    global _record
+    _record = _new_record(function)
+    set_dimensions(**dimensions)
+    for hook in _start_hooks:
+        hook()
+
+
+def on_start(hook: Callable[[], None]):
+    """Registers a function to call at the start of every invocation."""
+    _start_hooks.append(hook)
+
+
+def _current() -> dict:
+    global _record
+    if _record is None:
+        _record = _new_record(os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "unknown"))
+    return _record
+
+
+def set_dimensions(**dimensions):
+    """Sets Database and/or Table for the current record."""
+    for key, value in dimensions.items():
+        if key not in DIMENSION_KEYS:
+            raise ValueError(f"Unknown metric dimension: {key}")
+        if value is not None:
+            _current()["dimensions"][key] = str(value)
+
+
+def set_property(key: str, value):
+    """Adds a searchable, non-metric field (e.g. the chunk index) to the record."""
+    _current()["properties"][key] = value
+
+
+def count(name: str, value: float, unit: str = "Count"):
+    """Adds to a counter such as Rows or Bytes."""
+    record = _current()
+    with _lock:
+        record["metrics"][name] = record["metrics"].get(name, 0) + value
+        record["units"][name] = unit
+
+
+@contextmanager
+def phase(name: str):
+    """Times a block and adds it to the <name>Duration metric."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        count(f"{name}Duration", (time.perf_counter() - started) * 1000, "Milliseconds")
+
+
+def phase_seconds(name: str) -> float:
+    """Time spent in a phase so far in this invocation, in seconds."""
+    return _current()["metrics"].get(f"{name}Duration", 0.0) / 1000
+
+
+def flush():
+    """Prints the current record as an EMF log line and resets it."""
+    global _record
+    record = _current()
+    _record = None
+
+    dimensions = record["dimensions"]
+    # Aggregate per function, then per table when the table is known
+    dimension_sets = [["Function"]]
+    if "Database" in dimensions:
+        dimension_sets.append([k for k in DIMENSION_KEYS if k in dimensions])
+
+    metrics = {name: round(value, 3) for name, value in record["metrics"].items()}
+    emf = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": os.environ.get("METRICS_NAMESPACE", "DatabaseExport"),
+                    "Dimensions": dimension_sets,
+                    "Metrics": [
+                        {"Name": name, "Unit": record["units"][name]}
+                        for name in metrics
+                    ],
+                }
+            ],
+        },
+        **record["properties"],
+        **dimensions,
+        **metrics,
+    }
+    print(json.dumps(emf, default=str), flush=True)
+
+
+def instrument(function: str):
+    """Decorates a Lambda handler so every invocation emits one EMF record."""
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            start(function)
+            started = time.perf_counter()
+            try:
+                return handler(event, context)
+            except Exception:
+                count("Errors", 1)
+                raise
+            finally:
+                count(
+                    "Duration", (time.perf_counter() - started) * 1000, "Milliseconds"
+                )
+                flush()
+
+        return wrapper
+
+    return decorator
@@ -1,24 +1,196 @@
+import json
 import logging
 import os
+import aws_clients
+import telemetry
+import progress
+import run_history
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger()
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
+s3 = aws_clients.client("s3")
 
-# Filter and deduplicate data
-def get_unique(data: list[dict], keys_to_keep: list):
-    unique_tuples = {tuple((k, d[k]) for k in keys_to_keep) for d in data}
+# Parallel GETs of the per-chunk result objects
+READ_WORKERS = 32
 
-    return [dict(t) for t in unique_tuples]
+# Status of a table when any of its chunks has it, most severe first
+STATUS_SEVERITY = ["TIMED_OUT", "SUCCEEDED"]
 
 
-# Transforms the output to keep minimal info as input for next step
+def list_result_keys(bucket: str, prefix: str):
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Key"].endswith(".json") and not obj["Key"].endswith("summary.json"):
+                yield obj["Key"]
+
+
+def read_result(bucket: str, key: str) -> dict:
+    return json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+def new_summary(database: str, table: str) -> dict:
+    return {
+        "database": database,
+        "table": table,
+        "chunks": 0,
+        "rows": 0,
+        "bytes": 0,
+        "bytes_read": 0,
+        "lobs": 0,
+        "lob_uploads": 0,
+        "lob_bytes": 0,
+        "duration_s": 0.0,
+        "wall_s": 0.0,
+        "started_at": None,
+        "finished_at": None,
+        "retries": 0,
+        "max_chunk_duration_s": 0.0,
+        "encode_s": 0.0,
+        "encoding_profile": None,
+        "status": "SUCCEEDED",
+    }
+
+
+def summarise_encoding_profiles(tables: list) -> dict:
+    """Size and encode time per encoding profile, to compare their tradeoffs."""
+    profiles: dict[str, dict[str, float]] = {}
+    for table in tables:
+        if not table["encoding_profile"]:
+            continue
+        profile = profiles.setdefault(
+            table["encoding_profile"],
+            {"tables": 0, "rows": 0, "bytes": 0, "encode_s": 0.0},
+        )
+        profile["tables"] += 1
+        profile["rows"] += table["rows"]
+        profile["bytes"] += table["bytes"]
+        profile["encode_s"] = round(profile["encode_s"] + table["encode_s"], 3)
+    for profile in profiles.values():
+        profile["bytes_per_row"] = round(profile["bytes"] / max(profile["rows"], 1), 1)
+        profile["encode_rows_per_s"] = round(
+            profile["rows"] / profile["encode_s"] if profile["encode_s"] else 0.0, 1
+        )
+    return profiles
+
+
+def add_result(summary: dict, result: dict):
+    summary["chunks"] += 1
+    summary["rows"] += result.get("rows", 0)
+    summary["bytes"] += result.get("bytes", 0)
+    summary["bytes_read"] += result.get("bytes_read", 0)
+    summary["lobs"] += result.get("lobs", 0)
+    summary["lob_uploads"] += result.get("lob_uploads", 0)
+    summary["lob_bytes"] += result.get("lob_bytes", 0)
+    summary["retries"] += result.get("retries", 0)
+    duration = result.get("duration_s", 0.0)
+    summary["duration_s"] = round(summary["duration_s"] + duration, 3)
+    summary["max_chunk_duration_s"] = max(summary["max_chunk_duration_s"], duration)
+    summary["encode_s"] = round(summary["encode_s"] + result.get("encode_s", 0.0), 3)
+    summary["encoding_profile"] = result.get(
+        "encoding_profile", summary["encoding_profile"]
+    )
+    # Wall time from the first chunk start to the last chunk end
+    if "started_at" in result:
+        summary["started_at"] = min(
+            filter(None, [summary["started_at"], result["started_at"]])
+        )
+        summary["finished_at"] = max(
+            filter(None, [summary["finished_at"], result["finished_at"]])
+        )
+        summary["wall_s"] = round(summary["finished_at"] - summary["started_at"], 3)
+    status = result.get("status", "SUCCEEDED")
+    if STATUS_SEVERITY.index(status) < STATUS_SEVERITY.index(summary["status"]):
+        summary["status"] = status
+
+
+# Aggregates the chunk results written to S3 by the export Map into
+# per-table summaries, one result object at a time, and returns the tables
+# still to be validated with the location of the summary. Tables validated
+# during the export, when their last chunk finished, are not returned
+@telemetry.instrument("transform-output")
 def handler(event, context):
-    data = event["chunks"]
+    output_bucket = event["output_bucket"]
+    db_name = event["db_name"]
+    extraction_timestamp = event["extraction_timestamp"]
+    record_run_history = os.getenv("RECORD_RUN_HISTORY", "true").lower() == "true"
+    trailing_runs = int(os.getenv("RUN_HISTORY_TRAILING_RUNS", "5"))
+    regression_threshold = float(os.getenv("RUN_HISTORY_REGRESSION_THRESHOLD", "0.25"))
+    telemetry.set_dimensions(Database=db_name)
+
+    prefix = f"export_results/{db_name}/{extraction_timestamp}/"
+
+    # Every planned table is summarised, including tables with no chunks
+    summaries = {
+        (t["database"], t["table"]): new_summary(t["database"], t["table"])
+        for t in event.get("tables", [])
+    }
+
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        results = pool.map(
+            lambda key: read_result(output_bucket, key),
+            list_result_keys(output_bucket, prefix),
+        )
+        for result in results:
+            key = (result["database"], result["table"])
+            add_result(summaries.setdefault(key, new_summary(*key)), result)
+
+    summary_key = f"{prefix}summary.json"
+    tables = sorted(summaries.values(), key=lambda s: (s["database"], s["table"]))
+
+    # Flag the tables that regressed against their previous runs, then
+    # append this run to the history. The export does not depend on either
+    regressions = {}
+    if record_run_history:
+        try:
+            regressions = run_history.find_regressions(
+                db_name,
+                extraction_timestamp,
+                tables,
+                output_bucket,
+                trailing_runs,
+                regression_threshold,
+            )
+            run_history.record_run(
+                db_name, extraction_timestamp, tables, regressions, output_bucket
+            )
+        except Exception as e:
+            logger.warning(f"Failed to update the run history: {e}")
+        telemetry.count("RegressedTables", len(regressions))
+    s3.put_object(
+        Bucket=output_bucket,
+        Key=summary_key,
+        Body=json.dumps(
+            {
+                "tables": tables,
+                "encoding_profiles": summarise_encoding_profiles(tables),
+                "regressions": regressions,
+            },
+            indent=2,
+        ).encode(),
+    )
 
-    # Choose which keys to keep
-    keys_to_keep = ["database", "table"]
+    chunks = sum(s["chunks"] for s in tables)
+    telemetry.count("Tables", len(tables))
+    telemetry.count("Chunks", chunks)
+    logger.info(
+        f"Summarised {chunks} chunk results for {len(tables)} tables "
+        f"to s3://{output_bucket}/{summary_key}"
+    )
 
-    result = get_unique(data=data, keys_to_keep=keys_to_keep)
+    # Claim the tables whose validation no chunk triggered
+    run = progress.run_id(db_name, extraction_timestamp)
+    pending = [
+        {"database": s["database"], "table": s["table"]}
+        for s in tables
+        if progress.claim_table(run, s["table"], progress.SWEEP)
+    ]
+    telemetry.count("TablesSwept", len(pending))
+    logger.info(f"{len(pending)} tables left to validate after the export")
 
-    return {"tables": result}
+    return {
+        "tables": pending,
+        "summary_path": f"s3://{output_bucket}/{summary_key}",
+    }
@@ -0,0 +1,236 @@
+"""
+Append-only history of export runs, one row per run and table, in an
+Iceberg table queried through Athena.
+
+Before a run's rows are appended, each table is compared with the median
+of its trailing runs, and flagged when its throughput (rows per
+Lambda-second) dropped or its wall time grew by more than the threshold:
+
+    regressions = run_history.find_regressions(db, ts, tables, bucket, 5, 0.25)
+    run_history.record_run(db, ts, tables, regressions, bucket)
+
+Unlike table_export_validation, the table is never dropped by the scanner.
+"""
+
+import logging
+import time
+
+import aws_clients
+import telemetry
+
+logger = logging.getLogger()
+
+athena = aws_clients.client("athena")
+
+HISTORY_TABLE = "export_run_history"
+
+# Rows per INSERT statement, well inside Athena's query length limit
+INSERT_BATCH_SIZE = 200
+
+# Tables exported faster than this are dominated by Lambda and connection
+# overhead, so their timings are too noisy to compare
+MIN_REGRESSION_WALL_S = 30.0
+
+COLUMNS = {
+    "table_name": "STRING",
+    "extraction_timestamp": "STRING",
+    "status": "STRING",
+    "chunks": "BIGINT",
+    "row_count": "BIGINT",
+    "bytes_read": "BIGINT",
+    "bytes_written": "BIGINT",
+    "wall_s": "DOUBLE",
+    "lambda_s": "DOUBLE",
+    "retries": "BIGINT",
+    "rows_per_s": "DOUBLE",
+    "regression": "STRING",
+}
+
+
+@telemetry.phase("AthenaQuery")
+def run_athena_query(query, database, bucket):
+    response = athena.start_query_execution(
+        QueryString=query,
+        QueryExecutionContext={"Database": database},
+        ResultConfiguration={"OutputLocation": f"s3://{bucket}/athena-results/"},
+    )
+    query_id = response["QueryExecutionId"]
+
+    while True:
+        status = athena.get_query_execution(QueryExecutionId=query_id)
+        state = status["QueryExecution"]["Status"]["State"]
+        if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
+            break
+        time.sleep(2)
+
+    if state != "SUCCEEDED":
+        reason = status["QueryExecution"]["Status"].get("StateChangeReason", "unknown")
+        raise Exception(f"Athena query failed: {state} - {reason}")
+
+    return query_id
+
+
+def fetch_rows(query_id):
+    """Returns the rows of a query result as lists of strings, without the header."""
+    paginator = athena.get_paginator("get_query_results")
+    rows = []
+    for page in paginator.paginate(QueryExecutionId=query_id):
+        for row in page["ResultSet"]["Rows"]:
+            rows.append([col.get("VarCharValue") for col in row["Data"]])
+    return rows[1:]
+
+
+def ensure_history_table(db_name, bucket):
+    columns = ",\n    ".join(f"{name} {dtype}" for name, dtype in COLUMNS.items())
+    run_athena_query(
+        f"""
+        CREATE TABLE IF NOT EXISTS {db_name}.{HISTORY_TABLE} (
+        {columns}
+        )
+        LOCATION 's3://{bucket}/{HISTORY_TABLE}/{db_name}/'
+        TBLPROPERTIES (
+        'table_type' = 'ICEBERG',
+        'format' = 'parquet'
+        )
+        """,
+        db_name,
+        bucket,
+    )
+
+
+def history_row(summary, extraction_timestamp, regression):
+    """The ledger row of a table summary."""
+    lambda_s = summary["duration_s"]
+    return {
+        "table_name": summary["table"],
+        "extraction_timestamp": extraction_timestamp,
+        "status": summary["status"],
+        "chunks": summary["chunks"],
+        "row_count": summary["rows"],
+        "bytes_read": summary["bytes_read"],
+        "bytes_written": summary["bytes"],
+        "wall_s": summary["wall_s"],
+        "lambda_s": lambda_s,
+        "retries": summary["retries"],
+        "rows_per_s": round(summary["rows"] / lambda_s, 1) if lambda_s else 0.0,
+        "regression": regression,
+    }
+
+
+def sql_value(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, float):
+        return f"CAST({value!r} AS DOUBLE)"
+    return str(value)
+
+
+def get_baselines(db_name, extraction_timestamp, trailing_runs, bucket):
+    """
+    Returns {table: (runs, median rows_per_s, median wall_s)} over each
+    table's last trailing_runs successful runs before this one.
+    """
+    query_id = run_athena_query(
+        f"""
+        SELECT table_name, COUNT(*),
+               approx_percentile(rows_per_s, 0.5),
+               approx_percentile(wall_s, 0.5)
+        FROM (
+            SELECT table_name, rows_per_s, wall_s,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY table_name ORDER BY extraction_timestamp DESC
+                   ) AS rn
+            FROM {db_name}.{HISTORY_TABLE}
+            WHERE extraction_timestamp < '{extraction_timestamp}'
+              AND status = 'SUCCEEDED'
+        ) t
+        WHERE rn <= {trailing_runs}
+        GROUP BY table_name
+        """,
+        db_name,
+        bucket,
+    )
+    return {
+        table: (int(runs), float(rows_per_s or 0), float(wall_s or 0))
+        for table, runs, rows_per_s, wall_s in fetch_rows(query_id)
+    }
+
+
+def compare_to_baseline(row, baseline, threshold):
+    """
+    Returns "THROUGHPUT" and/or "DURATION" (comma separated) if the row
+    regressed against its baseline by more than threshold, else None.
+    """
+    _, rows_per_s, wall_s = baseline
+    if (
+        row["status"] != "SUCCEEDED"
+        or max(row["wall_s"], wall_s) < MIN_REGRESSION_WALL_S
+    ):
+        return None
+    flags = []
+    if rows_per_s and row["rows_per_s"] < rows_per_s * (1 - threshold):
+        flags.append("THROUGHPUT")
+    if wall_s and row["wall_s"] > wall_s * (1 + threshold):
+        flags.append("DURATION")
+    return ",".join(flags) or None
+
+
+def find_regressions(
+    db_name, extraction_timestamp, summaries, bucket, trailing_runs, threshold
+):
+    """
+    Returns {table: {"regression", "rows_per_s", "baseline_rows_per_s",
+    "wall_s", "baseline_wall_s", "baseline_runs"}} for the tables that
+    regressed against their trailing runs.
+    """
+    ensure_history_table(db_name, bucket)
+    baselines = get_baselines(db_name, extraction_timestamp, trailing_runs, bucket)
+
+    regressions = {}
+    for summary in summaries:
+        baseline = baselines.get(summary["table"])
+        if not baseline:
+            continue
+        row = history_row(summary, extraction_timestamp, None)
+        flag = compare_to_baseline(row, baseline, threshold)
+        if flag:
+            regressions[summary["table"]] = {
+                "regression": flag,
+                "rows_per_s": row["rows_per_s"],
+                "baseline_rows_per_s": baseline[1],
+                "wall_s": row["wall_s"],
+                "baseline_wall_s": baseline[2],
+                "baseline_runs": baseline[0],
+            }
+            logger.warning(
+                f"{db_name}.{summary['table']} regressed ({flag}): "
+                f"{row['rows_per_s']} rows/s in {row['wall_s']}s, against "
+                f"{baseline[1]} rows/s in {baseline[2]}s over {baseline[0]} runs"
+            )
+    return regressions
+
+
+def record_run(db_name, extraction_timestamp, summaries, regressions, bucket):
+    """Appends one ledger row per table summary."""
+    rows = [
+        history_row(
+            summary,
+            extraction_timestamp,
+            regressions.get(summary["table"], {}).get("regression"),
+        )
+        for summary in summaries
+    ]
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        values = ",\n".join(
+            "(" + ", ".join(sql_value(row[name]) for name in COLUMNS) + ")"
+            for row in rows[i : i + INSERT_BATCH_SIZE]
+        )
+        run_athena_query(
+            f"INSERT INTO {db_name}.{HISTORY_TABLE} ({', '.join(COLUMNS)})\n"
+            f"VALUES {values}",
+            db_name,
+            bucket,
+        )
+    logger.info(f"Recorded {len(rows)} tables in {db_name}.{HISTORY_TABLE}")
@@ -1,17 +1,19 @@
 import json
 import logging
 import os
-import boto3
+import aws_clients
+import telemetry
 from datetime import datetime, timezone
 
 logger = logging.getLogger()
 logger.setLevel(os.getenv("LOG_LEVEL", "INFO"))
 
-stepfunctions = boto3.client("stepfunctions")
+stepfunctions = aws_clients.client("stepfunctions")
 state_machine_arn = os.environ["STATE_MACHINE_ARN"]
 
 
 # Checks the file ends with a .bak prefix before triggering the database restore process
+@telemetry.instrument("upload-checker")
 def handler(event, context):
     try:
         record = event["Records"][0]
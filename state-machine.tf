@@ -29,9 +29,12 @@ resource "aws_sfn_state_machine" "db_export" {
   definition = templatefile("${path.module}/db-export.asl.json.tpl", {
     DatabaseExportScannerLambdaArn           = module.database_export_scanner.lambda_function_arn
     DatabaseExportProcessorLambdaArn         = module.database_export_processor.lambda_function_arn
+    DatabaseExportFinaliserLambdaArn         = module.database_export_finaliser.lambda_function_arn
     ExportValidationRowCountUpdaterLambdaArn = module.export_validation_rowcount_updater.lambda_function_arn
     TransformOutputLambdaArn                 = module.transform_output.lambda_function_arn
     LambdaArn                                = var.get_views ? aws_sfn_state_machine.db_export_views[0].arn : aws_sfn_state_machine.db_delete.arn
+    DatabaseExportPreparerLambdaArn          = var.prepare_database ? module.database_export_preparer[0].lambda_function_arn : ""
+    prepare_database                         = var.prepare_database
     max_concurrency                          = var.max_concurrency
 
   })
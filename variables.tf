@@ -55,6 +55,17 @@ variable "max_concurrency" {
   default     = 5
 }
 
+variable "api_clients" {
+  description = "Throttling handling of the Lambdas' AWS API clients. Calls are retried in botocore's adaptive retry mode up to max_attempts attempts. rate_limits caps the calls per second to a service by its boto3 name (e.g. { glue = 50, athena = 20, secretsmanager = 100 }) for the whole export: the Lambdas run by the export Map (processor, finaliser, row count updater) are each limited to their max_concurrency share, the others to the full rate. With coalesce, identical Glue get_table/get_database calls within an invocation are made once, and a warm Lambda reuses its Secrets Manager get_secret_value response for reuse_ttl_s seconds (0 to fetch it on every invocation). Throttled attempts are reported as the Throttles metric."
+  type = object({
+    max_attempts = optional(number, 10)
+    rate_limits  = optional(map(number), {})
+    coalesce     = optional(bool, true)
+    reuse_ttl_s  = optional(number, 300)
+  })
+  default = {}
+}
+
 variable "engine_version" {
   description = "The SQL Server engine version for the RDS instance."
   type        = string
@@ -68,7 +79,7 @@ variable "get_views" {
 }
 
 variable "lifecycle_rule_parquet_exports" {
-  description = "List of maps containing configuration of object lifecycle management for the parquet_exports S3 bucketes."
+  description = "List of maps containing configuration of object lifecycle management for the parquet_exports S3 bucketes. Keep a rule with abort_incomplete_multipart_upload_days when overriding it: the export uploads large files in parts."
   type        = any
   default = [{
     id      = "main"
@@ -102,6 +113,13 @@ variable "lifecycle_rule_parquet_exports" {
     noncurrent_version_expiration = {
       days = 730
     }
+    }, {
+    # Parts of multipart uploads left by exports that failed to abort them.
+    # S3 does not allow this action in a rule filtered by tags
+    id                                     = "abort-incomplete-multipart-uploads"
+    enabled                                = "Enabled"
+    prefix                                 = ""
+    abort_incomplete_multipart_upload_days = 1
   }]
 }
 
@@ -153,3 +171,218 @@ variable "bucket_namespace" {
     error_message = "The value for bucket_namespace needs to be one of 'global' or 'account-regional'"
   }
 }
+
+variable "output_table_format" {
+  description = "Table format for exported data: 'parquet' for Hive-style Parquet external tables or 'iceberg' for Iceberg tables committed once per table per run."
+  type        = string
+  default     = "parquet"
+
+  validation {
+    condition     = contains(["parquet", "iceberg"], var.output_table_format)
+    error_message = "The value for output_table_format needs to be one of 'parquet' or 'iceberg'"
+  }
+}
+
+variable "iceberg_snapshot_retention_seconds" {
+  description = "Age (in seconds) after which Iceberg snapshots replaced by a newer export are expired and their data files removed. Only used when output_table_format is 'iceberg'."
+  type        = number
+  default     = 86400
+}
+
+variable "skip_unchanged_chunks" {
+  description = "Whether full refresh runs compare a server-side checksum of each chunk's key range with the previous run and copy the previous file forward instead of re-exporting unchanged chunks."
+  type        = bool
+  default     = false
+}
+
+variable "export_profile_sample_rate" {
+  description = "Profile 1 in N export chunks with cProfile and tracemalloc, uploading the results to profiles/ in the output bucket. 0 disables sampling; a single chunk can still be profiled with \"profile\": true in its event. Profiling slows the chunk down and uses extra memory."
+  type        = number
+  default     = 0
+}
+
+variable "export_engine" {
+  description = "Data export engine: 'pandas' converts chunks with pandas from the AWS SDK for pandas layer; 'arrow' builds the Parquet files with pyarrow only, for a smaller package and faster cold starts. The arrow engine writes NULLs as nulls and formats values with Python's str(), where pandas writes 'None'/'nan' and float-formats integer columns containing NULLs."
+  type        = string
+  default     = "pandas"
+
+  validation {
+    condition     = contains(["pandas", "arrow"], var.export_engine)
+    error_message = "The value for export_engine needs to be one of 'pandas' or 'arrow'"
+  }
+}
+
+variable "export_driver" {
+  description = "SQL Server driver the export processor reads chunks with: 'pymssql' (FreeTDS), 'pytds' (pure-Python python-tds, as the restore Lambdas use) or 'arrow_odbc' (Microsoft's ODBC driver through arrow-odbc, which reads chunks straight into Arrow with the arrow export_engine). arrow_odbc needs arrow-odbc, unixODBC and the ODBC driver named odbc_driver in one of export_processor_layers; it reads (max) values of up to max_text_kb. Compare the drivers with the benchmark's --driver-sweep before switching."
+  type = object({
+    name        = optional(string, "pymssql")
+    odbc_driver = optional(string, "ODBC Driver 18 for SQL Server")
+    max_text_kb = optional(number, 1024)
+  })
+  default = {}
+
+  validation {
+    condition     = contains(["pymssql", "pytds", "arrow_odbc"], var.export_driver.name)
+    error_message = "The value for export_driver.name needs to be one of 'pymssql', 'pytds' or 'arrow_odbc'"
+  }
+}
+
+variable "export_processor_layers" {
+  description = "Additional Lambda layer ARNs for the export processor, e.g. one with arrow-odbc and the Microsoft ODBC driver for export_driver 'arrow_odbc'."
+  type        = list(string)
+  default     = []
+}
+
+variable "export_pipeline" {
+  description = "Overlaps the fetch, Parquet encoding and S3 upload of each export chunk (arrow export_engine only). batch_rows rows are fetched at a time and, unless the encoding profile sets row_group_size, written as one row group; queue_depth fetched batches are buffered ahead of the encoder; the file is uploaded in part_size_mb parts (at least 5), upload_concurrency at a time. Memory per chunk is then bounded by these settings rather than the chunk size."
+  type = object({
+    enabled            = optional(bool, false)
+    batch_rows         = optional(number, 50000)
+    queue_depth        = optional(number, 4)
+    part_size_mb       = optional(number, 16)
+    upload_concurrency = optional(number, 4)
+  })
+  default = {}
+}
+
+variable "server_side_projection" {
+  description = "Whether the chunk queries select an explicit projection that has SQL Server do the conversions the exporter otherwise does in Python: rowversion columns formatted as hex, binary columns (legacy single-byte text) decoded in the database collation's code page, and char, varchar and text columns converted to nvarchar from their collation. The exporter then skips its per-chunk rowversion lookup and decoding. Binary values not valid in the database code page can decode differently than the exporter's cp1252, UTF-8, Latin-1 fallback."
+  type        = bool
+  default     = false
+}
+
+variable "lob_offload" {
+  description = "Exports large values of varchar(max), nvarchar(max), varbinary(max), text, ntext, image and xml columns to S3 objects of their own under _lobs/<database>/ in the output bucket, keyed by their SHA-256 so repeated values are stored once. Values of threshold_kb or more are replaced in the Parquet file by their s3:// reference, and <column>_lob_length and <column>_lob_sha256 columns are added beside each LOB column; upload_concurrency objects are uploaded at a time per chunk while it is encoded."
+  type = object({
+    enabled            = optional(bool, false)
+    threshold_kb       = optional(number, 256)
+    upload_concurrency = optional(number, 8)
+  })
+  default = {}
+}
+
+variable "views_to_export" {
+  description = "Views whose data is exported as tables alongside the base tables, as a map of \"schema.view\" to the ordered key columns used to split the view into chunks (e.g. { \"dbo.vw_cases\" = [\"case_id\"] }). A view with no key columns is exported as a single chunk."
+  type        = map(list(string))
+  default     = {}
+}
+
+variable "extraction_profile" {
+  description = "Session and query settings for the export chunk queries; settings left unset keep the driver and server defaults. isolation_level sets the session isolation level, unset for the server default (READ COMMITTED). Opt in to READ UNCOMMITTED to read without taking locks, safe because the restored database has no other writers; SNAPSHOT needs ALLOW_SNAPSHOT_ISOLATION on the database. maxdop and query_hints are added as OPTION (...) hints. keep_order = false drops the final ORDER BY of the chunk queries, so rows are no longer written in key order. packet_size is the TDS packet size in bytes and fetch_size the rows fetched per round trip; 0 keeps the driver default."
+  type = object({
+    isolation_level = optional(string)
+    maxdop          = optional(number, 0)
+    query_hints     = optional(list(string), [])
+    keep_order      = optional(bool, true)
+    packet_size     = optional(number, 0)
+    fetch_size      = optional(number, 0)
+  })
+  default = {}
+}
+
+variable "chunk_keys" {
+  description = "Ordered key columns used to split large tables without a primary key into chunks, as a map of \"schema.table\" to column names (e.g. { \"dbo.audit_log\" = [\"logged_at\", \"id\"] }). Tables without a primary key that are not listed are exported as a single chunk."
+  type        = map(list(string))
+  default     = {}
+}
+
+variable "prepare_database" {
+  description = "Whether to prepare the restored database before the export: update the statistics of the tables to export and create nonclustered indexes on the chunking key of large tables that have none. The indexes are removed with the DB instance after the export."
+  type        = bool
+  default     = false
+}
+
+variable "prepare_time_budget_seconds" {
+  description = "Time (in seconds) the database preparation may take. Statements not started by then are skipped and running ones are cancelled. At most 840."
+  type        = number
+  default     = 600
+
+  validation {
+    condition     = var.prepare_time_budget_seconds > 0 && var.prepare_time_budget_seconds <= 840
+    error_message = "The value for prepare_time_budget_seconds needs to be between 1 and 840"
+  }
+}
+
+variable "prepare_min_index_rows" {
+  description = "Minimum row count for the database preparation to create an index on a table's chunking key."
+  type        = number
+  default     = 1000000
+}
+
+variable "encoding_profiles" {
+  description = "Parquet encoding profiles, by name, added to or overriding the built-in 'default' (Snappy), 'compact' (zstd 9, 1M-row row groups) and 'point_lookup' (zstd 3, 128K-row row groups, page index and primary key bloom filters). Bloom filters need a pyarrow version that can write them and are skipped otherwise."
+  type = map(object({
+    compression               = optional(string, "snappy")
+    compression_level         = optional(number)
+    row_group_size            = optional(number)
+    use_dictionary            = optional(bool)
+    dictionary_pagesize_limit = optional(number)
+    write_page_index          = optional(bool)
+    bloom_filter_keys         = optional(bool)
+    bloom_filter_fpp          = optional(number)
+  }))
+  default = {}
+}
+
+variable "table_encoding_profiles" {
+  description = "Encoding profile for specific tables or exported views, as a map of \"schema.table\" (or \"table\") to profile name. Takes precedence over encoding_profile_size_classes."
+  type        = map(string)
+  default     = {}
+}
+
+variable "encoding_profile_size_classes" {
+  description = "Encoding profile by table size: each table not in table_encoding_profiles uses the profile of the largest min_size_mb it reaches, or 'default'."
+  type = list(object({
+    min_size_mb = number
+    profile     = string
+  }))
+  default = []
+}
+
+variable "table_partitioning" {
+  description = "Partitions the Parquet output of tables by a date column, as a map of \"schema.table\" (or \"table\") to the column and a granularity of year, month or day. Partitions are registered in Glue as <column>_year, <column>_month and <column>_day. Not applied to Iceberg output or to exported views."
+  type = map(object({
+    column      = string
+    granularity = optional(string, "month")
+  }))
+  default = {}
+
+  validation {
+    condition     = alltrue([for p in values(var.table_partitioning) : contains(["year", "month", "day"], p.granularity)])
+    error_message = "table_partitioning granularity must be one of year, month or day."
+  }
+}
+
+variable "table_filters" {
+  description = "Limits the columns and rows exported from specific tables or exported views, as a map of \"schema.table\" (or \"table\") to include_columns (only these), exclude_columns (all but these) and where, a T-SQL predicate on the source table. The filters are applied in the chunk queries and the Glue columns, chunks are sized for the exported data only, and the row count validation compares against the rows matching where. Tables with filters are never carried forward by skip_unchanged_chunks."
+  type = map(object({
+    include_columns = optional(list(string), [])
+    exclude_columns = optional(list(string), [])
+    where           = optional(string)
+  }))
+  default = {}
+}
+
+variable "max_output_partitions" {
+  description = "Maximum number of output partitions per table. Tables over it are partitioned at a coarser granularity, or not at all if they have more years than this."
+  type        = number
+  default     = 1000
+}
+
+variable "record_run_history" {
+  description = "Append each run's per-table chunks, rows, bytes, wall time, Lambda-seconds and retries to the export_run_history Iceberg table, and flag tables that regressed against their previous runs."
+  type        = bool
+  default     = true
+}
+
+variable "run_history_trailing_runs" {
+  description = "Number of previous runs whose median throughput and wall time a table is compared with."
+  type        = number
+  default     = 5
+}
+
+variable "run_history_regression_threshold" {
+  description = "Fraction by which a table's rows per Lambda-second must drop, or its wall time grow, against its previous runs to be flagged as a regression."
+  type        = number
+  default     = 0.25
+}